@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+from PIL import Image
+from step2_fine_crop import fine_crop, initial_guess
+
+def fine_crop_pixels(img, initial_box):
+    """
+    Previous per-pixel implementation of fine_crop, kept only as the reference
+    for this benchmark.
+    """
+    photo_area = img.crop(initial_box)
+    gray = photo_area.convert('L')
+
+    threshold = 240
+    bw = gray.point(lambda x: 0 if x > threshold else 255, '1')
+
+    width, height = bw.size
+    pixels = bw.load()
+
+    best_right = width
+    has_seen_dense_content = False
+    for x in range(width):
+        column_density = sum(1 for y in range(height) if pixels[x, y] == 255) / height
+        if column_density > 0.15:
+            has_seen_dense_content = True
+
+        if has_seen_dense_content and column_density < 0.02:
+            is_gap = True
+            for check_x in range(x, min(x + 2, width)):
+                check_density = sum(1 for y in range(height) if pixels[check_x, y] == 255) / height
+                if check_density > 0.05:
+                    is_gap = False
+                    break
+            if is_gap:
+                best_right = x
+                break
+
+    restricted_bw = bw.crop((0, 0, best_right, height))
+    final_bbox = restricted_bw.getbbox()
+
+    if final_bbox and has_seen_dense_content:
+        left, top, right, bottom = initial_box
+        return (left + final_bbox[0], top + final_bbox[1], left + final_bbox[2], top + final_bbox[3])
+
+    return initial_box
+
+def main():
+    # Usage: python bench_fine_crop.py [YEAR]   (default 2020)
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    year = sys.argv[1] if len(sys.argv) > 1 else "2020"
+    full_dir = os.path.join(current_dir, year, "boletines_completos")
+    if not os.path.exists(full_dir):
+        print(f"Directory not found: {full_dir}")
+        return
+
+    files = sorted(f for f in os.listdir(full_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png')))
+    print(f"Benchmarking fine_crop on {len(files)} bulletins from {year}...")
+
+    t_old = t_new = 0.0
+    mismatches = []
+    for filename in files:
+        img = Image.open(os.path.join(full_dir, filename))
+        img.load()
+        box = initial_guess(img.size)
+
+        t0 = time.perf_counter()
+        old = fine_crop_pixels(img, box)
+        t1 = time.perf_counter()
+        new = fine_crop(img, box)
+        t2 = time.perf_counter()
+
+        t_old += t1 - t0
+        t_new += t2 - t1
+        if old != new:
+            mismatches.append((filename, old, new))
+
+    n = max(1, len(files))
+    print(f"  per-pixel: {t_old:.2f}s total, {t_old / n * 1000:.1f} ms/image")
+    print(f"  numpy:     {t_new:.2f}s total, {t_new / n * 1000:.1f} ms/image")
+    if t_new > 0:
+        print(f"  speedup:   {t_old / t_new:.1f}x")
+    print(f"  identical boxes: {len(files) - len(mismatches)}/{len(files)}")
+    for filename, old, new in mismatches[:10]:
+        print(f"    {filename}: {old} != {new}")
+
+if __name__ == "__main__":
+    main()
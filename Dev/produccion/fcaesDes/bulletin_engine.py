@@ -1,24 +1,11 @@
 import os
-import urllib.request
 import re
 import time
 from urllib.parse import unquote
 from PIL import Image, ImageChops
-
-def get_page_html(url):
-    try:
-        req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req) as response:
-            return response.read().decode('utf-8')
-    except Exception as e:
-        print(f"Error reading page {url}: {e}")
-        return ""
-
-def find_bulletin_urls(html):
-    pattern = r'/sites/cobupem\.edomex\.gob\.mx/files/images/Desaparecidos/\d{4}/[^/]+/[^"]+\.jpg'
-    found = re.findall(pattern, html)
-    base_url = "https://cobupem.edomex.gob.mx"
-    return list(set(base_url + url for url in found))
+from downloader import Downloader
+from http_cache import CACHE_FILE, MANIFEST_FILE, HTTPCache, Manifest
+from step1_download import find_bulletin_urls
 
 def fine_crop(img, initial_box):
     """
@@ -49,9 +36,12 @@ def fine_crop(img, initial_box):
     
     return initial_box
 
-def process_bulletin(url, base_dir):
+def url_year(url):
     match = re.search(r'/Desaparecidos/(\d{4})/', url)
-    year = match.group(1) if match else "Desconocido"
+    return match.group(1) if match else "Desconocido"
+
+def process_bulletin(downloader, url, base_dir):
+    year = url_year(url)
     
     year_dir = os.path.join(base_dir, year)
     full_dir = os.path.join(year_dir, "boletines_completos")
@@ -69,8 +59,9 @@ def process_bulletin(url, base_dir):
         return "EXISTS", filename
         
     try:
-        # Download
-        urllib.request.urlretrieve(url, full_path)
+        # Download (skipped if step1 already has the complete file)
+        if not os.path.exists(full_path):
+            downloader.download(url, full_path)
         
         # Load and Crop
         img = Image.open(full_path)
@@ -101,22 +92,33 @@ def main():
     base_dir = os.path.join(current_dir, "..", "fcaesDes")
     
     print(f"Initializing Bulletin Engine...")
-    html = get_page_html(target_url)
-    if not html:
-        print("Failed to reach source page.")
+    downloader = Downloader()
+    cache = HTTPCache(os.path.join(base_dir, CACHE_FILE))
+    manifest = Manifest(os.path.join(base_dir, MANIFEST_FILE))
+    try:
+        html, entry = cache.get(downloader, target_url)
+    except Exception as e:
+        print(f"Failed to reach source page: {e}")
         return
-        
-    urls = find_bulletin_urls(html)
+    if html is None:
+        cache.commit(target_url, entry)
+        print("Listing unchanged since the last complete run. Nothing to do.")
+        return
+
+    # Only URLs that were never downloaded before
+    urls = manifest.new_urls(find_bulletin_urls(html.decode('utf-8')))
     total = len(urls)
-    print(f"Total bulletins discovered: {total}")
+    print(f"New bulletins discovered: {total}")
     
     new_items = 0
     errors = 0
     start_time = time.time()
     
     for i, url in enumerate(urls, 1):
-        status, name = process_bulletin(url, base_dir)
+        status, name = process_bulletin(downloader, url, base_dir)
         
+        if status != "ERROR":
+            manifest.add(url, os.path.join(base_dir, url_year(url), "boletines_completos", name))
         if status == "NEW":
             new_items += 1
             print(f"[{i}/{total}] Downloaded & Fine-Cropped: {name}")
@@ -128,6 +130,10 @@ def main():
             elapsed = time.time() - start_time
             print(f"--- Progress: {i}/{total} ({ (i/total)*100:.1f}%) | Elapsed: {elapsed/60:.1f} min ---")
 
+    manifest.save()
+    if errors == 0:
+        cache.commit(target_url, entry)
+
     print(f"\n--- MISSION COMPLETE ---")
     print(f"Processed: {total} | New: {new_items} | Errors: {errors}")
 
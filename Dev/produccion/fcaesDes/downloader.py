@@ -0,0 +1,192 @@
+"""
+Concurrent HTTP downloader for the COBUPEM bulletins (stdlib only).
+
+- One keep-alive connection per worker thread and host, reused across requests
+  instead of a new TLS handshake per JPEG.
+- A per-host rate limit shared by all threads, so concurrency does not turn
+  into hammering the server.
+- Retries with exponential backoff on connection errors, 429 and 5xx.
+- Redirects (301/302/303/307/308) are followed up to MAX_REDIRECTS hops; any
+  other non-2xx answer is an error, so an HTML error or "moved" page is never
+  saved as a bulletin.
+- Files are written to `<name>.part` and renamed when complete, so an
+  interrupted download is never taken for a finished one.
+
+    dl = Downloader(workers=8, rate=10)
+    for url, path, ok, error in dl.download_all([(url, path), ...]):
+        ...
+"""
+import os
+import time
+import random
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlsplit, urljoin, quote
+
+USER_AGENT = 'Mozilla/5.0'
+RETRY_STATUS = (429, 500, 502, 503, 504)
+REDIRECT_STATUS = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+
+class HTTPError(Exception):
+    def __init__(self, status, url):
+        super().__init__(f"HTTP {status} for {url}")
+        self.status = status
+
+
+def encode_url(url):
+    """Percent-encodes the path (spaces, 'ñ', accents) keeping scheme and host."""
+    parts = url.split('/')
+    # The first 3 parts are 'https:', '', 'cobupem.edomex.gob.mx'
+    encoded_path = '/'.join(quote(p) for p in parts[3:])
+    return f"{parts[0]}//{parts[2]}/{encoded_path}"
+
+
+class RateLimiter:
+    """At most `rate` request starts per second for each host (0 = unlimited)."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_slot = {}
+        self.lock = threading.Lock()
+
+    def wait(self, host):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Downloader:
+    def __init__(self, workers=8, rate=10, retries=3, backoff=0.5, timeout=30, user_agent=USER_AGENT):
+        self.workers = max(1, workers)
+        self.limiter = RateLimiter(rate)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self.local = threading.local()
+        self.requests = 0
+        self.connections = 0
+        self.open_conns = []
+        self.count_lock = threading.Lock()
+
+    # ── Connections ──────────────────────────────────────────────────
+
+    def _connection(self, scheme, netloc):
+        conns = getattr(self.local, 'conns', None)
+        if conns is None:
+            conns = self.local.conns = {}
+        conn = conns.get((scheme, netloc))
+        if conn is None:
+            cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = conns[(scheme, netloc)] = cls(netloc, timeout=self.timeout)
+            with self.count_lock:
+                self.connections += 1
+                self.open_conns.append(conn)
+        return conn
+
+    def _drop_connection(self, scheme, netloc):
+        conn = getattr(self.local, 'conns', {}).pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def _request_once(self, url, headers):
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        self.limiter.wait(parts.netloc)
+        conn = self._connection(parts.scheme, parts.netloc)
+        try:
+            conn.request('GET', path, headers={'User-Agent': self.user_agent, **headers})
+            response = conn.getresponse()
+            body = response.read()
+        except (http.client.HTTPException, OSError):
+            # Stale keep-alive connection or network error: next attempt reconnects
+            self._drop_connection(parts.scheme, parts.netloc)
+            raise
+        with self.count_lock:
+            self.requests += 1
+        if response.will_close:
+            self._drop_connection(parts.scheme, parts.netloc)
+        return response.status, response.headers, body
+
+    # ── Public API ───────────────────────────────────────────────────
+
+    def fetch(self, url, headers=None, not_modified=False):
+        """
+        GET `url` with retries, following redirects. Returns (status, headers,
+        body) for 2xx responses, and for 304 only when `not_modified` is set
+        (conditional GET). Raises HTTPError for anything else once retries run out.
+        """
+        headers = headers or {}
+        for _ in range(MAX_REDIRECTS + 1):
+            status, resp_headers, body = self._fetch_once(url, headers)
+            if 200 <= status < 300 or (status == 304 and not_modified):
+                return status, resp_headers, body
+            location = resp_headers.get('Location')
+            if status not in REDIRECT_STATUS or not location:
+                raise HTTPError(status, url)
+            url = urljoin(url, location)
+        raise HTTPError(status, f"{url} (more than {MAX_REDIRECTS} redirects)")
+
+    def _fetch_once(self, url, headers):
+        """One URL with retries on connection errors, 429 and 5xx; no redirects."""
+        for attempt in range(self.retries + 1):
+            try:
+                status, resp_headers, body = self._request_once(url, headers)
+                if status < 400:
+                    return status, resp_headers, body
+                error = HTTPError(status, url)
+                if status not in RETRY_STATUS:
+                    raise error
+            except (http.client.HTTPException, OSError) as e:
+                error = e
+            if attempt == self.retries:
+                raise error
+            time.sleep(self.backoff * (2 ** attempt) * (1 + random.random() * 0.25))
+
+    def download(self, url, path):
+        """Downloads `url` to `path` through `path.part` + rename. Only 2xx bodies are written."""
+        status, _, body = self.fetch(encode_url(url))
+        if not 200 <= status < 300:
+            raise HTTPError(status, url)
+        tmp = path + '.part'
+        with open(tmp, 'wb') as f:
+            f.write(body)
+        os.replace(tmp, path)
+        return len(body)
+
+    def download_all(self, jobs):
+        """
+        Downloads every (url, path) concurrently. Yields (url, path, ok, error)
+        as each one finishes.
+        """
+        def task(url, path):
+            try:
+                self.download(url, path)
+                return url, path, True, None
+            except Exception as e:
+                return url, path, False, str(e)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='download') as pool:
+            futures = [pool.submit(task, url, path) for url, path in jobs]
+            for future in as_completed(futures):
+                yield future.result()
+
+    def close(self):
+        """Closes the keep-alive connections of every thread."""
+        with self.count_lock:
+            conns, self.open_conns = self.open_conns, []
+        for conn in conns:
+            conn.close()
+
+    def stats(self):
+        return {'requests': self.requests, 'connections': self.connections}
@@ -0,0 +1,99 @@
+"""
+Persistent state that lets the daily update skip work that was already done.
+
+HTTPCache   ETag / Last-Modified / sha1 of pages (the bulletin listing), so an
+            unchanged listing answers 304 (or the same hash) and nothing is parsed.
+Manifest    Every bulletin URL already downloaded, with its local path, so only
+            URLs that were never seen before are processed.
+
+Validators of a page are committed only after every URL it lists made it into
+the manifest; a run that failed half-way re-reads the listing next time.
+
+    cache = HTTPCache(os.path.join(base_dir, CACHE_FILE))
+    body, entry = cache.get(downloader, url)     # body None → unchanged
+    ...
+    cache.commit(url, entry)
+"""
+import os
+import json
+import hashlib
+from datetime import datetime
+
+CACHE_FILE = 'http_cache.json'
+MANIFEST_FILE = 'bulletin_manifest.json'
+
+
+def _load_json(path):
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable {os.path.basename(path)}: {e}")
+        return {}
+
+
+def _save_json(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+class HTTPCache:
+    def __init__(self, path):
+        self.path = path
+        self.entries = _load_json(path)
+
+    def get(self, downloader, url, refresh=False):
+        """
+        Conditional GET of `url`. Returns (body, entry); body is None when the
+        page did not change since the last commit (304, or same sha1 when the
+        server ignores the validators).
+        """
+        old = {} if refresh else self.entries.get(url, {})
+        headers = {}
+        if old.get('etag'):
+            headers['If-None-Match'] = old['etag']
+        if old.get('last_modified'):
+            headers['If-Modified-Since'] = old['last_modified']
+
+        status, resp_headers, body = downloader.fetch(url, headers, not_modified=bool(headers))
+        if status == 304:
+            return None, old
+
+        entry = {
+            'etag': resp_headers.get('ETag'),
+            'last_modified': resp_headers.get('Last-Modified'),
+            'sha1': hashlib.sha1(body).hexdigest(),
+            'checked': datetime.now().isoformat(),
+        }
+        if old and entry['sha1'] == old.get('sha1'):
+            return None, entry
+        return body, entry
+
+    def commit(self, url, entry):
+        self.entries[url] = entry
+        _save_json(self.path, self.entries)
+
+
+class Manifest:
+    def __init__(self, path):
+        self.path = path
+        self.urls = _load_json(path)
+
+    def __contains__(self, url):
+        return url in self.urls
+
+    def __len__(self):
+        return len(self.urls)
+
+    def new_urls(self, urls):
+        return [url for url in urls if url not in self.urls]
+
+    def add(self, url, path):
+        self.urls[url] = os.path.relpath(path, os.path.dirname(self.path))
+
+    def save(self):
+        _save_json(self.path, self.urls)
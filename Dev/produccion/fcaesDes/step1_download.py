@@ -1,77 +1,104 @@
 import os
-import urllib.request
 import re
-from urllib.parse import unquote
+import time
+import argparse
+from urllib.parse import unquote, urlsplit
+from downloader import Downloader
+from http_cache import CACHE_FILE, MANIFEST_FILE, HTTPCache, Manifest
 
-def get_page_html(url):
-    try:
-        req = urllib.request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
-        with urllib.request.urlopen(req) as response:
-            return response.read().decode('utf-8')
-    except Exception as e:
-        print(f"Error reading page {url}: {e}")
-        return ""
+TARGET_URL = "https://cobupem.edomex.gob.mx/boletines-personas-desaparecidas"
+# Script is in Dev\produccion\fcaesDes, base_dir is Dev\produccion\fcaesDes
+DEFAULT_BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "fcaesDes")
 
-def find_bulletin_urls(html):
+def find_bulletin_urls(html, base_url="https://cobupem.edomex.gob.mx"):
     pattern = r'/sites/cobupem\.edomex\.gob\.mx/files/images/Desaparecidos/\d{4}/[^/]+/[^"]+\.jpg'
     found = re.findall(pattern, html)
-    base_url = "https://cobupem.edomex.gob.mx"
-    return list(set(base_url + url for url in found))
+    return sorted(set(base_url + url for url in found))
 
-def download_bulletin(url, base_dir):
+def bulletin_path(url, base_dir):
+    """Local path base_dir/YYYY/boletines_completos/<name> of a bulletin URL."""
     match = re.search(r'/Desaparecidos/(\d{4})/', url)
     year = match.group(1) if match else "Desconocido"
-    
+
     # Save to base_dir/YYYY/boletines_completos/
     full_dir = os.path.join(base_dir, year, "boletines_completos")
-    if not os.path.exists(full_dir):
-        os.makedirs(full_dir)
-            
-    filename = unquote(os.path.basename(url))
-    full_path = os.path.join(full_dir, filename)
-    
-    if os.path.exists(full_path):
-        return False, filename # Already exists
-        
+    os.makedirs(full_dir, exist_ok=True)
+    return os.path.join(full_dir, unquote(os.path.basename(url)))
+
+def download_new(url=TARGET_URL, out=None, workers=8, rate=10, retries=3, refresh=False):
+    """
+    Downloads the bulletins of the listing that are not in the manifest yet.
+    Returns stats: items (new files), found, failed, errors, seconds, unchanged.
+    """
+    t0 = time.perf_counter()
+    out = out or DEFAULT_BASE_DIR
+    stats = {'items': 0, 'found': 0, 'failed': 0, 'errors': [], 'unchanged': False}
+
+    downloader = Downloader(workers=workers, rate=rate, retries=retries)
+    cache = HTTPCache(os.path.join(out, CACHE_FILE))
+    manifest = Manifest(os.path.join(out, MANIFEST_FILE))
+    parts = urlsplit(url)
+    base_url = f"{parts.scheme}://{parts.netloc}"
+
+    print(f"Fetching bulletin list from {url}...")
     try:
-        # Fix: Properly encode the URL to handle spaces and special characters like 'ñ'
-        parts = url.split('/')
-        # The first 3 parts are 'https:', '', 'cobupem.edomex.gob.mx'
-        # We need to quote the rest (the path)
-        encoded_path = '/'.join([urllib.parse.quote(p) for p in parts[3:]])
-        encoded_url = f"https://{parts[2]}/{encoded_path}"
-        
-        urllib.request.urlretrieve(encoded_url, full_path)
-        return True, filename
+        html, entry = cache.get(downloader, url, refresh=refresh)
     except Exception as e:
-        print(f"  - Error downloading {filename}: {e}")
-        return False, filename
+        print(f"Error reading page {url}: {e}")
+        stats['errors'].append(f"{url}: {e}")
+        stats['failed'] = 1
+        stats['seconds'] = round(time.perf_counter() - t0, 2)
+        return stats
+    if html is None:
+        cache.commit(url, entry)
+        print("Listing unchanged since the last complete run, nothing to download.")
+        stats['unchanged'] = True
+        stats['seconds'] = round(time.perf_counter() - t0, 2)
+        return stats
+
+    urls = find_bulletin_urls(html.decode('utf-8'), base_url)
+    total = stats['found'] = len(urls)
+    jobs = []
+    for bulletin_url in manifest.new_urls(urls):
+        path = bulletin_path(bulletin_url, out)
+        # Only complete files exist under the final name (downloads go through .part)
+        if os.path.exists(path):
+            manifest.add(bulletin_url, path)
+        else:
+            jobs.append((bulletin_url, path))
+    print(f"Found {total} bulletins, {len(jobs)} new.")
+
+    for i, (bulletin_url, path, ok, error) in enumerate(downloader.download_all(jobs), 1):
+        name = os.path.basename(path)
+        if ok:
+            stats['items'] += 1
+            manifest.add(bulletin_url, path)
+            print(f"[{i}/{len(jobs)}] Downloaded: {name}")
+        else:
+            stats['failed'] += 1
+            stats['errors'].append(f"{name}: {error}")
+            print(f"  - Error downloading {name}: {error}")
+    manifest.save()
+    # Remember the listing only once every URL in it is downloaded; otherwise retry next run
+    if not stats['failed']:
+        cache.commit(url, entry)
+
+    http_stats = downloader.stats()
+    stats['seconds'] = round(time.perf_counter() - t0, 2)
+    print(f"\nDownload complete. New items: {stats['items']}. Failed: {stats['failed']}. Total: {total}. "
+          f"({http_stats['requests']} requests over {http_stats['connections']} connections)")
+    return stats
 
 def main():
-    target_url = "https://cobupem.edomex.gob.mx/boletines-personas-desaparecidas"
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    # Script is in Dev\produccion\python, base_dir is Dev\produccion\fcaesDes
-    base_dir = os.path.join(current_dir, "..", "fcaesDes")
-    
-    print(f"Fetching bulletin list from {target_url}...")
-    html = get_page_html(target_url)
-    if not html:
-        return
-        
-    urls = find_bulletin_urls(html)
-    total = len(urls)
-    print(f"Found {total} bulletins.")
-    
-    new_count = 0
-    for i, url in enumerate(urls, 1):
-        success, name = download_bulletin(url, base_dir)
-        if success:
-            new_count += 1
-            print(f"[{i}/{total}] Downloaded: {name}")
-        elif i % 100 == 0:
-            print(f"[{i}/{total}] Checking existing files...")
-    
-    print(f"\nDownload complete. New items: {new_count}. Total: {total}.")
+    parser = argparse.ArgumentParser(description="Download new COBUPEM bulletins")
+    parser.add_argument('--url', default=TARGET_URL, help="Bulletin listing page")
+    parser.add_argument('--out', default=DEFAULT_BASE_DIR, help="Base directory for the year folders")
+    parser.add_argument('--workers', type=int, default=8, help="Concurrent downloads")
+    parser.add_argument('--rate', type=float, default=10, help="Max requests per second per host (0 = no limit)")
+    parser.add_argument('--retries', type=int, default=3, help="Retries per file on errors, 429 and 5xx")
+    parser.add_argument('--refresh', action='store_true', help="Re-read the listing even if it did not change")
+    args = parser.parse_args()
+    download_new(args.url, args.out, args.workers, args.rate, args.retries, args.refresh)
 
 if __name__ == "__main__":
     main()
@@ -1,103 +1,186 @@
 import os
+import sys
+import time
+import argparse
+import multiprocessing
+import numpy as np
 from PIL import Image
 
+# Column density thresholds (fraction of content pixels in a column)
+DENSE_COLUMN = 0.15   # part of the photo
+GAP_COLUMN   = 0.02   # white gap between photo and text
+GAP_CONFIRM  = 0.05   # the next column must stay below this to confirm the gap
+
+# Base dir is Dev\produccion\fcaesDes
+DEFAULT_BASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "fcaesDes")
+
+def content_mask(photo_area, threshold=240):
+    """Boolean array (height, width): True where the pixel is content, not near-white background."""
+    return np.asarray(photo_area.convert('L')) <= threshold
+
+def find_photo_right(mask):
+    """
+    Scans the column profile left to right and returns (right, has_content):
+    the first white-gap column after dense content, or the full width.
+    """
+    height, width = mask.shape
+    density = np.count_nonzero(mask, axis=0) / height
+    seen = np.maximum.accumulate(density > DENSE_COLUMN)
+    # A gap column counts only if the one after it (when there is one) is also nearly empty
+    next_ok = np.ones(width, dtype=bool)
+    next_ok[:-1] = density[1:] <= GAP_CONFIRM
+    gaps = np.flatnonzero(seen & (density < GAP_COLUMN) & next_ok)
+    if len(gaps):
+        return int(gaps[0]), True
+    return width, bool(seen[-1]) if width else False
+
+def mask_bbox(mask):
+    """Same as PIL getbbox() on the mask: (left, top, right, bottom) of the content, or None."""
+    cols = np.flatnonzero(mask.any(axis=0))
+    if len(cols) == 0:
+        return None
+    rows = np.flatnonzero(mask.any(axis=1))
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
 def fine_crop(img, initial_box):
     """
     Refined crop logic that searches for white gaps to separate the photo from nearby text.
+    The threshold mask and column profile are computed once with NumPy.
     """
-    photo_area = img.crop(initial_box)
-    gray = photo_area.convert('L')
-    
-    # Threshold to identify content vs background
-    threshold = 240
-    bw = gray.point(lambda x: 0 if x > threshold else 255, '1')
-    
-    width, height = bw.size
-    pixels = bw.load()
-    
+    mask = content_mask(img.crop(initial_box))
+
     # 1. Find the right edge of the photo by looking for a vertical white gap
-    best_right = width
-    has_seen_dense_content = False
-    for x in range(width):
-        column_density = sum(1 for y in range(height) if pixels[x, y] == 255) / height
-        if column_density > 0.15: # Significant content found
-            has_seen_dense_content = True
-        
-        # If we have seen content and find an empty/gap column
-        if has_seen_dense_content and column_density < 0.02:
-            # Check if it remains a gap for at least 2 pixels to avoid noise within the photo
-            is_gap = True
-            for check_x in range(x, min(x + 2, width)):
-                check_density = sum(1 for y in range(height) if pixels[check_x, y] == 255) / height
-                if check_density > 0.05:
-                    is_gap = False
-                    break
-            if is_gap:
-                best_right = x
-                break
+    best_right, has_seen_dense_content = find_photo_right(mask)
 
     # 2. Get the final bounding box within the restricted width
     # We also trim the top and bottom based on the found content
-    restricted_bw = bw.crop((0, 0, best_right, height))
-    final_bbox = restricted_bw.getbbox()
-    
+    final_bbox = mask_bbox(mask[:, :best_right])
+
     if final_bbox and has_seen_dense_content:
         left, top, right, bottom = initial_box
         return (left + final_bbox[0], top + final_bbox[1], left + final_bbox[2], top + final_bbox[3])
-    
-    return initial_box
 
-def process_year_folder(year_path):
-    full_dir = os.path.join(year_path, "boletines_completos")
-    crop_dir = os.path.join(year_path, "fotos_recortadas")
-    
-    if not os.path.exists(full_dir):
-        return
+    return initial_box
 
-    if not os.path.exists(crop_dir):
-        os.makedirs(crop_dir)
+def initial_guess(size):
+    """Initial photo area based on known bulletin sizes."""
+    if size == (640, 480):
+        return (5, 60, 245, 380) # Widen to 245 to catch the gap-text transition
+    elif size == (680, 528):
+        return (10, 80, 420, 450)
+    return (int(size[0]*0.02), int(size[1]*0.1), int(size[0]*0.5), int(size[1]*0.8))
 
-    print(f"Processing photos in: {year_path}")
-    
-    for filename in os.listdir(full_dir):
-        if not filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+def list_jobs(base_dir, years=None, force=False):
+    """
+    (input_path, output_path) for every bulletin of every year folder.
+    Already cropped photos are skipped unless `force` (heuristics changed).
+    """
+    jobs = []
+    for folder in sorted(os.listdir(base_dir)):
+        year_path = os.path.join(base_dir, folder)
+        if not (os.path.isdir(year_path) and folder.isdigit()):
             continue
-            
-        input_path = os.path.join(full_dir, filename)
-        output_path = os.path.join(crop_dir, f"foto_{filename}")
-        
-        if os.path.exists(output_path):
+        if years and folder not in years:
             continue
+        full_dir = os.path.join(year_path, "boletines_completos")
+        crop_dir = os.path.join(year_path, "fotos_recortadas")
+        if not os.path.exists(full_dir):
+            continue
+        os.makedirs(crop_dir, exist_ok=True)
+
+        for filename in sorted(os.listdir(full_dir)):
+            if not filename.lower().endswith(('.jpg', '.jpeg', '.png')):
+                continue
+            output_path = os.path.join(crop_dir, f"foto_{filename}")
+            if force or not os.path.exists(output_path):
+                jobs.append((os.path.join(full_dir, filename), output_path))
+    return jobs
+
+def crop_file(input_path, output_path):
+    img = Image.open(input_path)
+    final_box = fine_crop(img, initial_guess(img.size))
+    cropped = img.crop(final_box)
+    cropped.save(output_path)
 
+def crop_chunk(chunk):
+    """Worker task: crops a chunk of jobs. Returns (pid, cropped, failures, seconds)."""
+    t0 = time.perf_counter()
+    cropped, failures = 0, []
+    for input_path, output_path in chunk:
         try:
-            img = Image.open(input_path)
-            size = img.size
-            
-            # Initial guess areas based on known bulletin sizes
-            if size == (640, 480):
-                initial_guess = (5, 60, 245, 380) # Widen to 245 to catch the gap-text transition
-            elif size == (680, 528):
-                initial_guess = (10, 80, 420, 450)
-            else:
-                initial_guess = (int(size[0]*0.02), int(size[1]*0.1), int(size[0]*0.5), int(size[1]*0.8))
-            
-            final_box = fine_crop(img, initial_guess)
-            cropped = img.crop(final_box)
-            cropped.save(output_path)
-            print(f"  - Cropped: {filename}")
+            crop_file(input_path, output_path)
+            cropped += 1
         except Exception as e:
-            print(f"  - Error cropping {filename}: {e}")
+            failures.append((input_path, str(e)))
+    return os.getpid(), cropped, failures, time.perf_counter() - t0
+
+def run_crops(jobs, workers=None, chunk_size=64, verbose=True):
+    """
+    Crops `jobs` in chunks over a process pool (serial with workers=1).
+    Returns a summary dict: total, cropped, failed, failures, seconds, images_per_s.
+    """
+    workers = workers or os.cpu_count() or 1
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+    t0 = time.perf_counter()
+    done, cropped, failures = 0, 0, []
+
+    def report(pid, n_ok, chunk_failures, seconds):
+        nonlocal done, cropped
+        done += n_ok + len(chunk_failures)
+        cropped += n_ok
+        failures.extend(chunk_failures)
+        if verbose:
+            rate = (n_ok + len(chunk_failures)) / seconds if seconds > 0 else 0
+            print(f"  [worker {pid}] {done}/{len(jobs)} ({rate:.1f} img/s in this chunk)"
+                  + (f", {len(chunk_failures)} failed" if chunk_failures else ""))
+
+    if workers <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            report(*crop_chunk(chunk))
+    else:
+        with multiprocessing.Pool(min(workers, len(chunks))) as pool:
+            for result in pool.imap_unordered(crop_chunk, chunks):
+                report(*result)
+
+    seconds = time.perf_counter() - t0
+    return {
+        'total': len(jobs),
+        'cropped': cropped,
+        'failed': len(failures),
+        'failures': failures,
+        'seconds': round(seconds, 2),
+        'images_per_s': round(len(jobs) / seconds, 1) if seconds > 0 else 0.0,
+        'workers': workers,
+    }
+
+def print_summary(summary):
+    for input_path, error in summary['failures']:
+        print(f"  - Error cropping {os.path.basename(input_path)}: {error}")
+    print(f"Cropped {summary['cropped']}/{summary['total']} bulletins in {summary['seconds']:.1f}s "
+          f"({summary['images_per_s']:.1f} img/s, {summary['workers']} workers), {summary['failed']} failed")
+
+def crop_all(base_dir=None, years=None, force=False, workers=0, chunk_size=64):
+    """Crops every pending bulletin. Returns run_crops' summary with items (= cropped) and errors."""
+    base_dir = base_dir or DEFAULT_BASE_DIR
+    jobs = list_jobs(base_dir, years=years, force=force)
+    print(f"{len(jobs)} bulletins to crop.")
+    summary = run_crops(jobs, workers=workers, chunk_size=max(1, chunk_size))
+    print_summary(summary)
+    summary['items'] = summary['cropped']
+    summary['errors'] = [f"{os.path.basename(path)}: {error}" for path, error in summary.pop('failures')]
+    return summary
 
 def main():
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    # Base dir is Dev\produccion\fcaesDes
-    base_dir = os.path.join(current_dir, "..", "fcaesDes")
-    
-    # Process each year folder
-    for folder in os.listdir(base_dir):
-        folder_path = os.path.join(base_dir, folder)
-        if os.path.isdir(folder_path) and folder.isdigit():
-            process_year_folder(folder_path)
+    parser = argparse.ArgumentParser(description="Crop the photo out of every downloaded bulletin")
+    parser.add_argument('--workers', type=int, default=0, help="Crop processes (default: CPU count)")
+    parser.add_argument('--chunk-size', type=int, default=64, help="Bulletins per work unit")
+    parser.add_argument('--force', action='store_true', help="Re-crop photos that already exist")
+    parser.add_argument('years', nargs='*', help="Only these year folders (default: all)")
+    args = parser.parse_args()
+
+    summary = crop_all(years=args.years, force=args.force, workers=args.workers, chunk_size=args.chunk_size)
+    # Non-zero exit only when nothing could be cropped, so actualizar_web marks the step as failed
+    return 1 if summary['failed'] and not summary['cropped'] else 0
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
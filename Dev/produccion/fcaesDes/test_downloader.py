@@ -0,0 +1,115 @@
+"""
+Downloader / HTTPCache against a local stand-in for cobupem.edomex.gob.mx.
+
+    python -m unittest test_downloader      (from Dev/produccion/fcaesDes)
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from downloader import Downloader, HTTPError
+from http_cache import HTTPCache
+
+JPEG = b'\xff\xd8\xff\xe0fake-bulletin\xff\xd9'
+ETAG = '"v1"'
+
+
+class StandIn(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/listing':
+            if self.headers.get('If-None-Match') == ETAG:
+                return self._send(304)
+            return self._send(200, b'<html>listing</html>', {'ETag': ETAG})
+        if self.path == '/files/2024/ok.jpg':
+            return self._send(200, JPEG)
+        if self.path == '/old/moved.jpg':
+            return self._send(301, b'<html>moved</html>', {'Location': '/files/2024/ok.jpg'})
+        if self.path == '/loop.jpg':
+            return self._send(302, b'', {'Location': '/loop.jpg'})
+        if self.path == '/not-modified.jpg':
+            return self._send(304)
+        self._send(404, b'<html>not found</html>')
+
+    def _send(self, status, body=b'', headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if status != 304:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if status != 304:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloaderTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StandIn)
+        cls.base = f'http://127.0.0.1:{cls.server.server_address[1]}'
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.dl = Downloader(workers=2, rate=0, retries=1, backoff=0)
+
+    def tearDown(self):
+        self.dl.close()
+        shutil.rmtree(self.dir)
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def test_200_is_written(self):
+        self.assertEqual(self.dl.download(f'{self.base}/files/2024/ok.jpg', self.path('ok.jpg')), len(JPEG))
+        with open(self.path('ok.jpg'), 'rb') as f:
+            self.assertEqual(f.read(), JPEG)
+        self.assertFalse(os.path.exists(self.path('ok.jpg.part')))
+
+    def test_redirect_is_followed(self):
+        self.dl.download(f'{self.base}/old/moved.jpg', self.path('moved.jpg'))
+        with open(self.path('moved.jpg'), 'rb') as f:
+            self.assertEqual(f.read(), JPEG)
+
+    def test_redirect_loop_fails(self):
+        with self.assertRaises(HTTPError):
+            self.dl.download(f'{self.base}/loop.jpg', self.path('loop.jpg'))
+        self.assertFalse(os.path.exists(self.path('loop.jpg')))
+
+    def test_404_is_not_written(self):
+        jobs = [(f'{self.base}/files/2024/missing.jpg', self.path('missing.jpg'))]
+        (_, _, ok, error), = self.dl.download_all(jobs)
+        self.assertFalse(ok)
+        self.assertIn('404', error)
+        self.assertFalse(os.path.exists(self.path('missing.jpg')))
+
+    def test_304_is_not_a_download(self):
+        with self.assertRaises(HTTPError):
+            self.dl.download(f'{self.base}/not-modified.jpg', self.path('nm.jpg'))
+        self.assertFalse(os.path.exists(self.path('nm.jpg')))
+
+    def test_conditional_listing(self):
+        cache = HTTPCache(self.path('http_cache.json'))
+        url = f'{self.base}/listing'
+        body, entry = cache.get(self.dl, url)
+        self.assertEqual(body, b'<html>listing</html>')
+        cache.commit(url, entry)
+        # Second read sends If-None-Match and gets 304: unchanged
+        body, _ = cache.get(self.dl, url)
+        self.assertIsNone(body)
+        self.assertEqual(self.dl.stats()['connections'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+"""
+fine_crop (NumPy) must return exactly the box of the per-pixel reference in
+bench_fine_crop.fine_crop_pixels.
+
+    python -m unittest test_fine_crop      (from Dev/produccion/fcaesDes)
+"""
+import unittest
+import numpy as np
+from PIL import Image
+from bench_fine_crop import fine_crop_pixels
+from step2_fine_crop import fine_crop, initial_guess
+
+SIZES = [(640, 480), (680, 528), (400, 300)]
+
+
+def bulletin(rng, size):
+    """White page with a dark photo block, a white gap and text-like noise to its right."""
+    w, h = size
+    page = np.full((h, w), 255, dtype=np.uint8)
+    x0, y0 = rng.integers(0, w // 8), rng.integers(h // 10, h // 4)
+    x1, y1 = x0 + rng.integers(w // 6, w // 3), y0 + rng.integers(h // 4, h // 2)
+    page[y0:y1, x0:x1] = rng.integers(0, 200, (y1 - y0, x1 - x0))
+    text_x = x1 + rng.integers(0, 12)
+    text = rng.random((h, max(0, w - text_x))) < rng.uniform(0.0, 0.3)
+    page[:, text_x:][text] = rng.integers(0, 255)
+    return Image.fromarray(page).convert('RGB')
+
+
+class FineCropTest(unittest.TestCase):
+    def assertSameBox(self, img, box=None):
+        box = box or initial_guess(img.size)
+        self.assertEqual(fine_crop(img, box), fine_crop_pixels(img, box))
+
+    def test_synthetic_bulletins(self):
+        rng = np.random.default_rng(0)
+        for i in range(30):
+            with self.subTest(i=i):
+                self.assertSameBox(bulletin(rng, SIZES[i % len(SIZES)]))
+
+    def test_random_noise(self):
+        rng = np.random.default_rng(1)
+        for i in range(10):
+            with self.subTest(i=i):
+                pixels = rng.integers(200, 256, (480, 640, 3), dtype=np.uint8)
+                self.assertSameBox(Image.fromarray(pixels))
+
+    def test_blank_and_solid_pages(self):
+        for value in (255, 241, 240, 0):
+            with self.subTest(value=value):
+                self.assertSameBox(Image.new('RGB', (640, 480), (value,) * 3))
+
+    def test_blank_page_keeps_initial_box(self):
+        img = Image.new('RGB', (640, 480), 'white')
+        self.assertEqual(fine_crop(img, initial_guess(img.size)), initial_guess(img.size))
+
+    def test_gap_in_last_column(self):
+        # Dense content up to the last column but one, which is a gap with nothing after it
+        page = np.full((100, 50), 255, dtype=np.uint8)
+        page[:, :49] = 0
+        self.assertSameBox(Image.fromarray(page).convert('RGB'), (0, 0, 50, 100))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+"""
+face_store.py — Base binaria de rostros (reemplaza face_database.pkl)
+
+Estructura (todo en un mismo directorio):
+    face_meta.json                     metadatos por columnas + lista de arrays
+    face_embeddings.<version>.npy      float32 (N, 512), embeddings normalizados
+    face_<clave>.<version>.npy         cualquier otro array con una fila por persona
+
+Los .npy se abren con np.load(mmap_mode='r'): cargar es O(1) y la caché de
+páginas del sistema se comparte entre procesos. face_meta.json se escribe al
+final y de forma atómica: es el punto de commit, nadie lee una base a medias.
+Los arrays llevan la versión en el nombre para poder escribir una base nueva
+mientras la anterior sigue mapeada (Windows no reemplaza un archivo mapeado).
+
+Única copia: el backend (Web/backend) la importa desde aquí en local, y
+deploy_hf.py / render.yaml la copian junto a main.py al desplegar.
+
+Importar el pickle legacy:
+    python face_store.py face_database.pkl [out_dir]
+"""
+import os
+import sys
+import json
+import pickle
+from datetime import datetime
+import numpy as np
+
+FORMAT = 1
+META_FILE = "face_meta.json"
+LEGACY_FILE = "face_database.pkl"
+COLUMNS = ("name", "year", "original_path")
+
+
+def _atomic_write(path, write):
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def has_store(store_dir):
+    return os.path.exists(os.path.join(store_dir, META_FILE))
+
+
+def new_version():
+    return datetime.now().strftime("%Y%m%d%H%M%S%f")
+
+
+def save_store(store_dir, arrays, columns, version=None, **info):
+    """
+    Escribe una versión nueva de la base. `arrays` debe traer "embeddings"; cada
+    array y cada columna lleva una fila por persona. Retorna los metadatos.
+    """
+    embeddings = np.ascontiguousarray(arrays["embeddings"], dtype=np.float32)
+    count = embeddings.shape[0]
+    for key, values in list(arrays.items()) + list(columns.items()):
+        if len(values) != count:
+            raise ValueError(f"'{key}' tiene {len(values)} filas, se esperaban {count}")
+
+    os.makedirs(store_dir, exist_ok=True)
+    version = version or new_version()
+
+    files = {}
+    for key, arr in arrays.items():
+        arr = embeddings if key == "embeddings" else np.ascontiguousarray(arr)
+        fname = f"face_{key}.{version}.npy"
+        _atomic_write(os.path.join(store_dir, fname), lambda f, a=arr: np.save(f, a))
+        files[key] = fname
+
+    meta = {
+        "format": FORMAT,
+        "version": version,
+        "created": datetime.now().isoformat(),
+        "count": count,
+        "dim": int(embeddings.shape[1]) if embeddings.ndim == 2 else 0,
+        **info,
+        "arrays": files,
+        "columns": {key: list(values) for key, values in columns.items()},
+    }
+    payload = json.dumps(meta, ensure_ascii=False).encode("utf-8")
+    _atomic_write(os.path.join(store_dir, META_FILE), lambda f: f.write(payload))
+
+    _remove_stale_arrays(store_dir, set(files.values()))
+    return meta
+
+
+def _remove_stale_arrays(store_dir, keep):
+    for fname in os.listdir(store_dir):
+        if fname.startswith("face_") and fname.endswith(".npy") and fname not in keep:
+            try:
+                os.remove(os.path.join(store_dir, fname))
+            except OSError:
+                pass  # Todavía mapeado por un lector (Windows); se borra en otro guardado
+
+
+def load_meta(store_dir):
+    with open(os.path.join(store_dir, META_FILE), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("format") != FORMAT:
+        raise ValueError(f"Formato de base no soportado: {meta.get('format')}")
+    return meta
+
+
+def load_store(store_dir, mmap=True):
+    """Retorna (arrays, columns, meta). Los arrays son memmaps de sólo lectura salvo con mmap=False."""
+    meta = load_meta(store_dir)
+    mode = "r" if mmap else None
+    arrays = {key: np.load(os.path.join(store_dir, fname), mmap_mode=mode)
+              for key, fname in meta["arrays"].items()}
+    return arrays, meta["columns"], meta
+
+
+def normalize_geometry(bbox, kps, width, height):
+    """
+    Caja del rostro como (x, y, w, h) normalizada y recortada a la foto, y los 5
+    keypoints como pares (x, y) normalizados. Se guardan por fila como
+    'face_box' (N, 4) y 'kps' (N, 5, 2).
+    """
+    bbox = np.asarray(bbox, dtype=np.float32)
+    box = np.array([
+        max(0.0, bbox[0]) / width,
+        max(0.0, bbox[1]) / height,
+        min(bbox[2] - bbox[0], width) / width,
+        min(bbox[3] - bbox[1], height) / height,
+    ], dtype=np.float32)
+    if kps is None:
+        kps = np.full((5, 2), np.nan, dtype=np.float32)
+    else:
+        kps = np.asarray(kps, dtype=np.float32) / np.array([width, height], dtype=np.float32)
+    return box, kps
+
+
+def legacy_to_store(pkl_path):
+    """Lee un face_database.pkl legacy y retorna (arrays, columns)."""
+    with open(pkl_path, "rb") as f:
+        raw_db = pickle.load(f)
+    dim = len(raw_db[0]["embedding"]) if raw_db else 512
+    embeddings = np.empty((len(raw_db), dim), dtype=np.float32)
+    columns = {key: [] for key in COLUMNS}
+    for i, entry in enumerate(raw_db):
+        embeddings[i] = entry["embedding"]
+        for key in COLUMNS:
+            columns[key].append(str(entry.get(key, "")))
+    return {"embeddings": embeddings}, columns
+
+
+def import_legacy(pkl_path, store_dir):
+    arrays, columns = legacy_to_store(pkl_path)
+    return save_store(store_dir, arrays, columns, source=os.path.basename(pkl_path))
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Uso: python face_store.py face_database.pkl [out_dir]")
+        sys.exit(1)
+    pkl = sys.argv[1]
+    out = sys.argv[2] if len(sys.argv) > 2 else os.path.dirname(os.path.abspath(pkl))
+    meta = import_legacy(pkl, out)
+    print(f"Importados {meta['count']} rostros en {out} (versión {meta['version']}).")
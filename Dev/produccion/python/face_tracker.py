@@ -0,0 +1,167 @@
+"""
+Detect-once, track-in-between for the live camera.
+
+app.get(frame) runs SCRFD plus every buffalo_l head (landmarks, gender/age,
+ArcFace) on every frame, although a visitor in front of the kiosk barely moves
+from one frame to the next. FaceTracker runs the detector only every
+`detect_every` frames, or as soon as tracking gets unreliable, and in between
+moves each face box with pyramidal Lucas-Kanade optical flow on corners inside
+the box (forward-backward checked). It is plain OpenCV, no contrib trackers.
+
+The recognition and gender/age heads run once per track: a detection that
+overlaps a face already being tracked keeps that face's embedding and only
+refreshes its box and landmarks. With `reembed_every=k` every k-th detection
+of a track embeds it again, to give track_identity.py more samples to average.
+The 2D/3D landmark heads are not run at all; the kiosk does not use them.
+
+    tracker = FaceTracker(app, detect_every=5)
+    faces = tracker.get(frame)       # drop-in for app.get(frame)
+
+Faces are insightface Face objects with three extra fields: `track_id`,
+`tracked` (False on frames where the detector ran) and `embedded` (True only
+on the frame where its embedding was computed).
+"""
+import cv2
+import numpy as np
+from insightface.app.common import Face
+
+# Heads of buffalo_l needed by the kiosk (embedding for the search, sex/age for the HUD)
+HEADS = ('recognition', 'genderage')
+# A detection continues a track if it overlaps the tracked box at least this much
+IOU_MATCH = 0.3
+
+LK_PARAMS = dict(winSize=(15, 15), maxLevel=3,
+                 criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+
+
+def iou(a, b):
+    x1, y1 = max(a[0], b[0]), max(a[1], b[1])
+    x2, y2 = min(a[2], b[2]), min(a[3], b[3])
+    inter = max(0.0, x2 - x1) * max(0.0, y2 - y1)
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+class FaceTracker:
+    def __init__(self, app, detect_every=5, reembed_every=0, min_points=8, min_confidence=0.6,
+                 max_fb_error=1.0):
+        self.det_model = app.det_model
+        self.heads = [model for name, model in app.models.items() if name in HEADS]
+        self.detect_every = max(1, detect_every)
+        self.reembed_every = reembed_every
+        self.min_points = min_points
+        self.min_confidence = min_confidence
+        self.max_fb_error = max_fb_error
+        self.tracks = []          # Face objects of the current tracks
+        self.points = {}          # track_id -> (n, 1, 2) float32 corners inside the box
+        self.prev_gray = None
+        self.since_detect = 0
+        self.next_id = 1
+        self.detections = 0
+        self.tracked = 0
+        self.embedded = 0
+        self.lost = 0
+
+    def get(self, image):
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        faces = None
+        # With nothing tracked the detector has to look at every frame
+        if self.tracks and self.since_detect < self.detect_every - 1:
+            faces = self._track(gray)
+            if faces is None:
+                self.lost += 1
+        if faces is None:
+            faces = self._detect(image, gray)
+        self.prev_gray = gray
+        return faces
+
+    def stats(self):
+        return {'detections': self.detections, 'tracked': self.tracked,
+                'embedded': self.embedded, 'lost': self.lost}
+
+    # ── Detection ────────────────────────────────────────────────────
+
+    def _detect(self, image, gray):
+        bboxes, kpss = self.det_model.detect(image, max_num=0, metric='default')
+        tracks, points = [], {}
+        free = list(self.tracks)
+        for i in range(bboxes.shape[0]):
+            bbox, det_score = bboxes[i, :4], float(bboxes[i, 4])
+            kps = kpss[i] if kpss is not None else None
+            previous = max(free, key=lambda t: iou(t.bbox, bbox), default=None)
+            if previous is not None and iou(previous.bbox, bbox) >= IOU_MATCH:
+                # Same visitor: keep its embedding, only the geometry is new
+                free.remove(previous)
+                face = Face(previous)
+                face.bbox, face.kps, face.det_score = bbox, kps, det_score
+                face.hits += 1
+                face.embedded = bool(self.reembed_every) and face.hits % self.reembed_every == 0
+                if face.embedded:
+                    for model in self.heads:
+                        model.get(image, face)
+                    self.embedded += 1
+            else:
+                face = Face(bbox=bbox, kps=kps, det_score=det_score)
+                for model in self.heads:
+                    model.get(image, face)
+                face.track_id = self.next_id
+                face.hits = 0
+                face.embedded = True
+                self.next_id += 1
+                self.embedded += 1
+            face.tracked = False
+            tracks.append(face)
+            points[face.track_id] = self._corners(gray, bbox)
+        self.tracks, self.points = tracks, points
+        self.since_detect = 0
+        self.detections += 1
+        return [Face(face) for face in tracks]
+
+    def _corners(self, gray, bbox):
+        h, w = gray.shape
+        x1, y1 = max(0, int(bbox[0])), max(0, int(bbox[1]))
+        x2, y2 = min(w, int(bbox[2])), min(h, int(bbox[3]))
+        if x2 - x1 < 8 or y2 - y1 < 8:
+            return None
+        mask = np.zeros_like(gray)
+        mask[y1:y2, x1:x2] = 255
+        return cv2.goodFeaturesToTrack(gray, maxCorners=50, qualityLevel=0.01, minDistance=4, mask=mask)
+
+    # ── Tracking ─────────────────────────────────────────────────────
+
+    def _track(self, gray):
+        """Moves every track to `gray`; None if any of them is lost (→ detect)."""
+        tracks, points = [], {}
+        for face in self.tracks:
+            old = self.points.get(face.track_id)
+            if old is None or len(old) < self.min_points:
+                return None
+            new, status, _ = cv2.calcOpticalFlowPyrLK(self.prev_gray, gray, old, None, **LK_PARAMS)
+            back, status_back, _ = cv2.calcOpticalFlowPyrLK(gray, self.prev_gray, new, None, **LK_PARAMS)
+            fb_error = np.linalg.norm((old - back).reshape(-1, 2), axis=1)
+            good = (status.ravel() == 1) & (status_back.ravel() == 1) & (fb_error < self.max_fb_error)
+            if good.sum() < self.min_points or good.mean() < self.min_confidence:
+                return None
+            old, new = old[good].reshape(-1, 2), new[good].reshape(-1, 2)
+
+            # Median translation, and median scale change of the spread around the centroid
+            shift = np.median(new - old, axis=0)
+            d_old = np.linalg.norm(old - old.mean(axis=0), axis=1)
+            d_new = np.linalg.norm(new - new.mean(axis=0), axis=1)
+            spread = d_old > 1.0
+            scale = float(np.median(d_new[spread] / d_old[spread])) if spread.any() else 1.0
+
+            center = (face.bbox[:2] + face.bbox[2:]) / 2
+            half = (face.bbox[2:] - face.bbox[:2]) / 2 * scale
+            moved = Face(face)
+            moved.bbox = np.concatenate([center + shift - half, center + shift + half]).astype(np.float32)
+            if face.kps is not None:
+                moved.kps = ((face.kps - center) * scale + center + shift).astype(np.float32)
+            moved.tracked = True
+            moved.embedded = False
+            tracks.append(moved)
+            points[face.track_id] = new.reshape(-1, 1, 2)
+        self.tracks, self.points = tracks, points
+        self.since_detect += 1
+        self.tracked += 1
+        return [Face(face) for face in tracks]
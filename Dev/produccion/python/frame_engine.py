@@ -0,0 +1,213 @@
+"""
+Pipelined frame engine for the live camera (init.py, step4_webcam_search.py).
+
+The loops used to do capture → app.get → gallery search → imread of matches →
+HUD → CSV → serial → imshow one after the other, so the servos moved exactly
+as often as InsightFace finished a frame. Here each stage runs at its own pace
+and stages talk through single-slot "latest wins" mailboxes:
+
+    capture    (thread)      camera frames                  → frames
+    detect     (thread)      faces of the newest frame      → detections
+    recognize  (thread)      gallery search of the newest
+                             detection with a face          → matches
+    actuate    (thread)      fixed rate (actuate_hz) with the newest detection
+    render     (caller)      peek() at frames/detections/matches, imshow
+
+A slow stage never queues work: it skips straight to the newest item and the
+skipped ones are counted as dropped. OpenCV windows must stay in the main
+thread, so rendering is left to the caller's loop.
+
+    engine = FrameEngine(camera.read, app.get, recognize, actuate).start()
+    while engine.running():
+        frame = engine.frames.peek()
+        ...
+    engine.stop()
+"""
+import time
+import threading
+from typing import Any, NamedTuple
+import numpy as np
+
+
+class Frame(NamedTuple):
+    seq: int
+    t: float           # time.time() when it was captured
+    image: np.ndarray
+
+
+class Detection(NamedTuple):
+    frame: Frame
+    faces: list
+    main: Any          # largest face, or None
+    t: float           # time.time() when detection finished
+
+
+def largest_face(faces):
+    if not faces:
+        return None
+    return max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
+
+
+class Latest:
+    """Single-slot mailbox: `put` replaces the previous item, readers only see the newest."""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.value = None
+        self.seq = 0
+        self.puts = 0
+        self.dropped = 0
+        self._read = True
+
+    def put(self, value):
+        with self.cond:
+            if not self._read:
+                self.dropped += 1
+            self.value = value
+            self.seq += 1
+            self.puts += 1
+            self._read = False
+            self.cond.notify_all()
+
+    def get(self, after, timeout=0.1):
+        """Waits for an item newer than seq `after`. Returns (seq, value); value None on timeout."""
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.seq > after, timeout):
+                return after, None
+            self._read = True
+            return self.seq, self.value
+
+    def peek(self):
+        return self.value
+
+    def snapshot(self):
+        """(seq, value) of the newest item, read together without waiting."""
+        with self.cond:
+            return self.seq, self.value
+
+
+class FrameEngine:
+    """
+    `read()` blocks until the next camera frame (None = camera closed).
+    `detect(image)` returns the list of faces. `recognize(detection)` is only
+    called for detections with a face; its result goes to `matches` unless it
+    is None. `actuate(detection, fresh, now, dt)` is called actuate_hz times
+    per second with the newest detection (None before the first one); `fresh`
+    tells whether it is a detection it has not seen yet.
+    """
+
+    def __init__(self, read, detect, recognize=None, actuate=None, actuate_hz=50):
+        self.read = read
+        self.detect = detect
+        self.recognize = recognize
+        self.actuate = actuate
+        self.actuate_hz = actuate_hz
+        self.frames = Latest()
+        self.detections = Latest()
+        self.matches = Latest()
+        self.stop_event = threading.Event()
+        self.busy = {}
+        self.counts = {}
+        self.errors = {}
+        self.started = None
+        self.threads = []
+
+    def start(self):
+        self.started = time.perf_counter()
+        loops = [('capture', self._capture), ('detect', self._detect)]
+        if self.recognize:
+            loops.append(('recognize', self._recognize))
+        if self.actuate:
+            loops.append(('actuate', self._actuate))
+        for name, loop in loops:
+            self.busy[name], self.counts[name] = 0.0, 0
+            thread = threading.Thread(target=self._guard, args=(name, loop), name=name, daemon=True)
+            self.threads.append(thread)
+            thread.start()
+        return self
+
+    def running(self):
+        return not self.stop_event.is_set()
+
+    def stop(self, timeout=2.0):
+        self.stop_event.set()
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def _guard(self, name, loop):
+        try:
+            loop()
+        except Exception as e:
+            # A dead stage would freeze the kiosk silently: stop everything instead
+            self.errors[name] = e
+            print(f"Frame engine: stage {name} failed: {e}")
+            self.stop_event.set()
+
+    def _timed(self, name, fn, *args):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        self.busy[name] += time.perf_counter() - t0
+        self.counts[name] += 1
+        return result
+
+    # ── Stages ───────────────────────────────────────────────────────
+
+    def _capture(self):
+        seq = 0
+        while self.running():
+            image = self.read()
+            if image is None:
+                self.stop_event.set()
+                return
+            seq += 1
+            self.counts['capture'] += 1
+            self.frames.put(Frame(seq, time.time(), image))
+
+    def _detect(self):
+        seen = 0
+        while self.running():
+            seen, frame = self.frames.get(seen)
+            if frame is None:
+                continue
+            faces = self._timed('detect', self.detect, frame.image) or []
+            self.detections.put(Detection(frame, faces, largest_face(faces), time.time()))
+
+    def _recognize(self):
+        seen = 0
+        while self.running():
+            seen, detection = self.detections.get(seen)
+            if detection is None or detection.main is None:
+                continue
+            result = self._timed('recognize', self.recognize, detection)
+            if result is not None:
+                self.matches.put(result)
+
+    def _actuate(self):
+        period = 1.0 / self.actuate_hz
+        seen = 0
+        last = time.time()
+        next_tick = time.perf_counter()
+        while self.running():
+            now = time.time()
+            seq, detection = self.detections.snapshot()
+            self._timed('actuate', self.actuate, detection, seq != seen, now, now - last)
+            seen, last = seq, now
+            # Fixed rate without drift; if a tick ran long, the next one starts right away
+            next_tick = max(next_tick + period, time.perf_counter())
+            time.sleep(max(0.0, next_tick - time.perf_counter()))
+
+    # ── Stats ────────────────────────────────────────────────────────
+
+    def stats(self):
+        """Per stage: items per second, busy fraction and, for mailboxes, items dropped."""
+        wall = max(1e-9, time.perf_counter() - (self.started or time.perf_counter()))
+        result = {name: {'fps': round(self.counts[name] / wall, 1),
+                         'busy': round(self.busy[name] / wall, 2)} for name in self.counts}
+        result['capture']['dropped'] = self.frames.dropped
+        result['detect']['dropped'] = self.detections.dropped
+        return result
+
+    def print_stats(self):
+        for name, s in self.stats().items():
+            extra = f"  dropped {s['dropped']}" if 'dropped' in s else ""
+            print(f"  {name:<10} {s['fps']:6.1f}/s  busy {s['busy']:.0%}{extra}")
@@ -0,0 +1,86 @@
+"""
+In-memory gallery of embeddings for the live kiosk loop.
+
+The loop used to rebuild an (N, 512) matrix from the list of entries on every
+frame, while the update thread appended to that same list. Here the embeddings
+live in one preallocated float32 buffer that grows by doubling, so appending is
+amortized O(1), and readers take a snapshot:
+
+    snap = gallery.snapshot()          # cheap; cached until the next change
+    sims = snap.embeddings @ query     # (n,) one matmul over a stable view
+    entry = snap.entries[int(sims.argmax())]
+
+A snapshot is never modified afterwards: appends only write rows past its end
+and growth copies into a new buffer, leaving the old one to the readers that
+still hold it. `reset` swaps in a whole new buffer the same way.
+"""
+import threading
+from typing import NamedTuple
+import numpy as np
+
+DIM = 512
+MIN_CAPACITY = 1024
+
+
+class Snapshot(NamedTuple):
+    version: int
+    embeddings: np.ndarray   # (n, DIM) float32, read-only view
+    entries: tuple           # entry dicts, aligned with `embeddings`
+
+    def __len__(self):
+        return len(self.entries)
+
+
+class Gallery:
+    def __init__(self, dim=DIM, capacity=MIN_CAPACITY):
+        self.dim = dim
+        self.lock = threading.Lock()
+        self.version = 0
+        self._buf = np.empty((max(1, capacity), dim), dtype=np.float32)
+        self._entries = []
+        self._n = 0
+        self._snapshot = None
+
+    def __len__(self):
+        return self._n
+
+    def reset(self, embeddings, entries):
+        """Replaces the whole gallery (e.g. after loading the store from disk)."""
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        if len(embeddings) != len(entries):
+            raise ValueError(f"{len(embeddings)} embeddings for {len(entries)} entries")
+        n = len(embeddings)
+        buf = np.empty((max(MIN_CAPACITY, 2 * n), self.dim), dtype=np.float32)
+        buf[:n] = embeddings
+        with self.lock:
+            self._buf, self._entries, self._n = buf, list(entries), n
+            self._bump()
+
+    def append(self, embedding, entry):
+        """Adds one row; returns its index."""
+        with self.lock:
+            if self._n == len(self._buf):
+                buf = np.empty((2 * len(self._buf), self.dim), dtype=np.float32)
+                buf[:self._n] = self._buf[:self._n]
+                self._buf = buf
+            self._buf[self._n] = embedding
+            self._entries.append(entry)
+            self._n += 1
+            self._bump()
+            return self._n - 1
+
+    def snapshot(self):
+        """Consistent (version, embeddings, entries) view of the current rows."""
+        snap = self._snapshot
+        if snap is not None and snap.version == self.version:
+            return snap
+        with self.lock:
+            if self._snapshot is None or self._snapshot.version != self.version:
+                view = self._buf[:self._n]
+                view.flags.writeable = False
+                self._snapshot = Snapshot(self.version, view, tuple(self._entries))
+            return self._snapshot
+
+    def _bump(self):
+        self.version += 1
+        self._snapshot = None
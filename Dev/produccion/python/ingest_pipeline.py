@@ -0,0 +1,286 @@
+"""
+Streaming ingest of new bulletins: download → crop → embed in one pass.
+
+The step-by-step scripts write every bulletin to disk (step1), read and decode
+it again to crop (step2), write the crop and read/decode it once more to embed
+(step3). Here each bulletin travels through the stages in memory:
+
+    download  (I/O, keep-alive pool)   bytes of the bulletin
+    crop      (PIL decode, fine_crop)  crop as encoded bytes + BGR array
+    embed     (InsightFace)            (embedding, face_box, kps)
+
+Stages are connected by bounded queues and each has its own worker threads, so
+throughput is set by the slowest stage. Each bulletin and crop is written to
+disk as soon as it leaves the last stage and its bytes are dropped, so memory
+is bounded by the queues, not by the number of bulletins. The updated face
+store is written once at the end (face_meta.json is the commit point, see
+face_store.py). If the current store cannot be extended (missing, legacy or
+built with another MODEL_VERSION) while other crops exist, the run falls back
+to a full step3 re-index instead of writing a store with only the new photos.
+
+    python ingest_pipeline.py --download-workers 8 --crop-workers 2 --embed-workers 2
+
+Note: the embedding is computed from the in-memory crop, not from the re-read
+JPEG, so it can differ from step3's by JPEG rounding. The sha1 stored is the
+one of the written crop file, so step3 treats these photos as up to date.
+"""
+import io
+import os
+import re
+import sys
+import time
+import queue
+import hashlib
+import argparse
+import threading
+import numpy as np
+from urllib.parse import unquote
+from PIL import Image
+from step3_index_faces import (create_face_app, embed_image, index_faces, list_photos, load_previous,
+                               plan_photos, save_database)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FCAES_DIR = os.path.join(BASE_DIR, "..", "fcaesDes")
+
+sys.path.insert(0, FCAES_DIR)
+from downloader import Downloader, encode_url
+from http_cache import CACHE_FILE, MANIFEST_FILE, HTTPCache, Manifest
+from step1_download import TARGET_URL, find_bulletin_urls
+from step2_fine_crop import fine_crop, initial_guess
+
+_DONE = object()
+
+
+class Stage:
+    """
+    `workers` threads that take items from `inbox`, apply `fn` and put the
+    result in `outbox`. Items that already failed skip `fn`. When every
+    worker has seen the end marker, one end marker is forwarded.
+    """
+
+    def __init__(self, name, fn, workers, inbox, outbox):
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, workers)
+        self.inbox = inbox
+        self.outbox = outbox
+        self.items = 0
+        self.busy_s = 0.0
+        self.lock = threading.Lock()
+        self.remaining = self.workers
+        self.threads = [threading.Thread(target=self._loop, name=f"{name}-{i}", daemon=True)
+                        for i in range(self.workers)]
+
+    def start(self):
+        for t in self.threads:
+            t.start()
+        return self
+
+    def _loop(self):
+        while True:
+            item = self.inbox.get()
+            if item is _DONE:
+                # Other workers of this stage still need to see the marker
+                self.inbox.put(_DONE)
+                with self.lock:
+                    self.remaining -= 1
+                    last = self.remaining == 0
+                if last:
+                    self.outbox.put(_DONE)
+                return
+            if not item.get('error'):
+                t0 = time.perf_counter()
+                try:
+                    self.fn(item)
+                except Exception as e:
+                    item['error'] = f"{self.name}: {e}"
+                with self.lock:
+                    self.items += 1
+                    self.busy_s += time.perf_counter() - t0
+            self.outbox.put(item)
+
+    def stats(self, wall_s):
+        return {
+            'workers': self.workers,
+            'items': self.items,
+            'busy_s': round(self.busy_s, 2),
+            # Fraction of the run this stage's workers were busy; the bottleneck is near 1
+            'utilization': round(self.busy_s / (self.workers * wall_s), 2) if wall_s > 0 else 0.0,
+        }
+
+
+def url_year(url):
+    match = re.search(r'/Desaparecidos/(\d{4})/', url)
+    return match.group(1) if match else "Desconocido"
+
+
+def make_download(downloader):
+    def download(item):
+        _, _, item['data'] = downloader.fetch(encode_url(item['url']))
+    return download
+
+
+def crop(item):
+    img = Image.open(io.BytesIO(item['data']))
+    cropped = img.crop(fine_crop(img, initial_guess(img.size)))
+    ext = os.path.splitext(item['filename'])[1].lower()
+    buf = io.BytesIO()
+    cropped.save(buf, format='PNG' if ext == '.png' else 'JPEG')
+    item['crop_data'] = buf.getvalue()
+    # BGR like cv2.imread, without going through disk
+    item['bgr'] = np.ascontiguousarray(np.asarray(cropped.convert('RGB'))[:, :, ::-1])
+
+
+def make_embed(app):
+    def embed(item):
+        item['result'] = embed_image(app, item.pop('bgr'))
+    return embed
+
+
+def run_stages(urls, downloader, app, download_workers=8, crop_workers=2, embed_workers=2, queue_size=32,
+               sink=None):
+    """
+    Streams `urls` through the three stages; `sink(item)` is called for each
+    finished item (in this thread) before it is kept. Returns (items, per-stage
+    stats, seconds).
+    """
+    q_in, q_crop, q_embed, q_out = (queue.Queue(maxsize=queue_size) for _ in range(4))
+    stages = [
+        Stage('download', make_download(downloader), download_workers, q_in, q_crop).start(),
+        Stage('crop', crop, crop_workers, q_crop, q_embed).start(),
+        Stage('embed', make_embed(app), embed_workers, q_embed, q_out).start(),
+    ]
+
+    def feed():
+        for url in urls:
+            q_in.put({'url': url, 'year': url_year(url), 'filename': unquote(os.path.basename(url))})
+        q_in.put(_DONE)
+
+    t0 = time.perf_counter()
+    threading.Thread(target=feed, name='feed', daemon=True).start()
+    items = []
+    while True:
+        item = q_out.get()
+        if item is _DONE:
+            break
+        item.pop('bgr', None)
+        if sink is not None:
+            sink(item)
+        items.append(item)
+        status = item.get('error') or ('no face' if item.get('result') is None else 'ok')
+        print(f"[{len(items)}/{len(urls)}] {item['year']}/{item['filename']}: {status}")
+    wall_s = time.perf_counter() - t0
+    return items, {s.name: s.stats(wall_s) for s in stages}, wall_s
+
+
+def _write(path, data):
+    tmp = path + '.part'
+    with open(tmp, 'wb') as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def write_item(item, base_dir, manifest):
+    """
+    Writes the bulletin and crop of a finished item and drops their bytes.
+    Its store record is left in item['fresh'].
+    """
+    data, crop_data = item.pop('data', None), item.pop('crop_data', None)
+    if item.get('error'):
+        return
+    year_dir = os.path.join(base_dir, item['year'])
+    full_dir = os.path.join(year_dir, "boletines_completos")
+    crop_dir = os.path.join(year_dir, "fotos_recortadas")
+    os.makedirs(full_dir, exist_ok=True)
+    os.makedirs(crop_dir, exist_ok=True)
+
+    full_path = os.path.join(full_dir, item['filename'])
+    crop_path = os.path.join(crop_dir, f"foto_{item['filename']}")
+    _write(full_path, data)
+    _write(crop_path, crop_data)
+    manifest.add(item['url'], full_path)
+
+    st = os.stat(crop_path)
+    item['fresh'] = {
+        'sha1': hashlib.sha1(crop_data).hexdigest(),
+        'size': st.st_size,
+        'mtime_ns': st.st_mtime_ns,
+        'result': item.get('result'),
+    }
+
+
+def update_store(items, base_dir, store_dir):
+    """
+    Adds the results of this run to the face store. Returns the number of
+    faces stored, or None when the current store cannot be extended and other
+    crops exist (the caller must re-index everything).
+    """
+    fresh = {f"{item['year']}/foto_{item['filename']}": item['fresh'] for item in items if 'fresh' in item}
+    if not fresh:
+        return 0
+
+    # Current store + the results of this run; photos nobody embedded yet are left to step3
+    photos = list_photos(base_dir)
+    previous = load_previous(store_dir)
+    if not previous and any(photo['key'] not in fresh for photo in photos):
+        # Missing/legacy/other model: saving now would keep only this run's photos
+        return None
+    previous.update(fresh)
+    plan_photos(photos, previous)
+    return save_database(store_dir, photos)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download, crop and embed new bulletins in one streaming pass")
+    parser.add_argument('--url', default=TARGET_URL, help="Bulletin listing page")
+    parser.add_argument('--download-workers', type=int, default=8)
+    parser.add_argument('--crop-workers', type=int, default=2)
+    parser.add_argument('--embed-workers', type=int, default=2)
+    parser.add_argument('--queue', type=int, default=32, help="Capacity of each queue between stages")
+    parser.add_argument('--rate', type=float, default=10, help="Max requests per second to the host")
+    parser.add_argument('--refresh', action='store_true', help="Re-read the listing even if it did not change")
+    args = parser.parse_args()
+
+    downloader = Downloader(workers=args.download_workers, rate=args.rate)
+    cache = HTTPCache(os.path.join(FCAES_DIR, CACHE_FILE))
+    manifest = Manifest(os.path.join(FCAES_DIR, MANIFEST_FILE))
+
+    html, entry = cache.get(downloader, args.url, refresh=args.refresh)
+    if html is None:
+        cache.commit(args.url, entry)
+        print("Listing unchanged since the last complete run, nothing to ingest.")
+        return
+
+    parts = args.url.split('/')
+    urls = manifest.new_urls(find_bulletin_urls(html.decode('utf-8'), f"{parts[0]}//{parts[2]}"))
+    print(f"{len(urls)} new bulletins.")
+    if not urls:
+        cache.commit(args.url, entry)
+        return
+
+    app = create_face_app()
+    items, stats, wall_s = run_stages(urls, downloader, app, args.download_workers,
+                                      args.crop_workers, args.embed_workers, args.queue,
+                                      sink=lambda item: write_item(item, FCAES_DIR, manifest))
+    manifest.save()
+
+    count = update_store(items, FCAES_DIR, BASE_DIR)
+    if count is None:
+        print("The face store is missing or was built with another model version; "
+              "re-indexing every crop with step3 instead of writing only the new ones.")
+        count = index_faces(full=True, get_app=lambda: app)['faces']
+    failed = [item for item in items if item.get('error')]
+    for item in failed:
+        print(f"  - Error {item['filename']}: {item['error']}")
+    if not failed:
+        cache.commit(args.url, entry)
+
+    print(f"\nIngested {len(items) - len(failed)}/{len(urls)} bulletins in {wall_s:.1f}s "
+          f"({len(items) / wall_s:.1f}/s)." + (f" Store now has {count} faces." if count else ""))
+    for name, s in stats.items():
+        print(f"  {name:<9} {s['workers']} workers  {s['items']} items  busy {s['busy_s']:.1f}s  "
+              f"utilization {s['utilization']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
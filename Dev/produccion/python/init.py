@@ -4,18 +4,29 @@ import time
 import threading
 import numpy as np
 import os
-import pickle
 import re
-import urllib.request
+import sys
 import csv
-from collections import Counter
 from PIL import Image
 from insightface.app import FaceAnalysis
+from face_store import LEGACY_FILE, has_store, load_store, save_store, import_legacy, normalize_geometry
+from step3_index_faces import file_sha1, largest_face
+from gallery import Gallery
+from frame_engine import FrameEngine
+from face_tracker import FaceTracker
+from track_identity import TrackIdentity, top_matches
+from thumb_cache import ThumbCache
 
 # --- CONFIGURACION DE RUTAS ---
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 FCAES_DIR = os.path.join(BASE_DIR, "..", "fcaesDes")
-DB_FILE = os.path.join(BASE_DIR, "face_database.pkl")
+
+# Descarga compartida con step1_download.py (cache HTTP + manifiesto en fcaesDes)
+sys.path.insert(0, FCAES_DIR)
+from downloader import Downloader
+from http_cache import CACHE_FILE, MANIFEST_FILE, HTTPCache, Manifest
+from step1_download import TARGET_URL, find_bulletin_urls, bulletin_path
+DB_DIR = BASE_DIR  # face_meta.json + face_embeddings.<version>.npy (ver face_store.py)
 UPDATE_FILE = os.path.join(BASE_DIR, "last_update.txt")
 CAPTURA_COMPLETA_DIR = os.path.join(BASE_DIR, "..", "capturas", "completas")
 CAPTURA_ROSTRO_DIR = os.path.join(BASE_DIR, "..", "capturas", "rostros")
@@ -25,19 +36,35 @@ for d in [CAPTURA_COMPLETA_DIR, CAPTURA_ROSTRO_DIR]:
 
 # --- CLASE DE ACTUALIZACION AUTOMATICA ---
 class BulletinManager:
-    def __init__(self, db_file, update_file, fcaes_dir, app):
-        self.db_file = db_file
+    def __init__(self, db_dir, update_file, fcaes_dir, app):
+        self.db_dir = db_dir
         self.update_file = update_file
         self.fcaes_dir = fcaes_dir
         self.app = app
-        self.database = []
+        # Embeddings en un buffer preasignado; el loop lee con gallery.snapshot()
+        self.gallery = Gallery()
+        self.meta = {}
         self.load_database()
 
     def load_database(self):
-        if os.path.exists(self.db_file):
-            with open(self.db_file, 'rb') as f:
-                self.database = pickle.load(f)
-            print(f"Base de datos cargada: {len(self.database)} rostros.")
+        legacy_file = os.path.join(self.db_dir, LEGACY_FILE)
+        if not has_store(self.db_dir) and os.path.exists(legacy_file):
+            print("Importando face_database.pkl (formato anterior)...")
+            import_legacy(legacy_file, self.db_dir)
+        if has_store(self.db_dir):
+            arrays, columns, self.meta = load_store(self.db_dir)
+            embeddings = arrays['embeddings']
+            n = len(embeddings)
+            # Las bases importadas del pickle no traen geometria: caja centrada por defecto
+            boxes = arrays.get('face_box', np.tile(np.float32([0.1, 0.05, 0.8, 0.85]), (n, 1)))
+            kps = arrays.get('kps', np.full((n, 5, 2), np.nan, dtype=np.float32))
+            # Todas las columnas (incluidas key/sha1 de step3) para reescribirlas al guardar
+            entries = [
+                {**dict(zip(columns, row)), 'face_box': boxes[i], 'kps': kps[i]}
+                for i, row in enumerate(zip(*columns.values()))
+            ]
+            self.gallery.reset(embeddings, entries)
+            print(f"Base de datos cargada: {len(self.gallery)} rostros.")
         else:
             print("Aviso: No se encontro base de datos inicial.")
 
@@ -56,36 +83,33 @@ class BulletinManager:
 
     def run_update_process(self):
         try:
-            # 1. Descargar (Logica Simplificada de step1)
-            target_url = "https://cobupem.edomex.gob.mx/boletines-personas-desaparecidas"
-            req = urllib.request.Request(target_url, headers={'User-Agent': 'Mozilla/5.0'})
-            with urllib.request.urlopen(req) as response:
-                html = response.read().decode('utf-8')
-            
-            pattern = r'/sites/cobupem\.edomex\.gob\.mx/files/images/Desaparecidos/(\d{4})/[^/]+/[^"]+\.jpg'
-            matches = re.findall(pattern, html)
-            
-            found_urls = re.findall(r'/sites/cobupem\.edomex\.gob\.mx/files/images/Desaparecidos/\d{4}/[^/]+/[^"]+\.jpg', html)
-            base_url = "https://cobupem.edomex.gob.mx"
+            # 1. Descargar (step1: listado condicional + manifiesto de URLs ya descargadas)
+            downloader = Downloader()
+            cache = HTTPCache(os.path.join(self.fcaes_dir, CACHE_FILE))
+            manifest = Manifest(os.path.join(self.fcaes_dir, MANIFEST_FILE))
+            html, entry = cache.get(downloader, TARGET_URL)
             
             new_files = []
-            for partial_url in set(found_urls):
-                url = base_url + partial_url
-                year_match = re.search(r'/Desaparecidos/(\d{4})/', url)
-                year = year_match.group(1) if year_match else "Desconocido"
-                
-                full_dir = os.path.join(self.fcaes_dir, year, "boletines_completos")
-                if not os.path.exists(full_dir): os.makedirs(full_dir)
-                
-                filename = urllib.parse.unquote(os.path.basename(url))
-                full_path = os.path.join(full_dir, filename)
+            failed = 0
+            if html is not None:
+                jobs = []
+                for url in manifest.new_urls(find_bulletin_urls(html.decode('utf-8'))):
+                    full_path = bulletin_path(url, self.fcaes_dir)
+                    if os.path.exists(full_path):
+                        manifest.add(url, full_path)
+                    else:
+                        jobs.append((url, full_path))
                 
-                if not os.path.exists(full_path):
-                    parts = url.split('/')
-                    encoded_path = '/'.join([urllib.parse.quote(p) for p in parts[3:]])
-                    encoded_url = f"https://{parts[2]}/{encoded_path}"
-                    urllib.request.urlretrieve(encoded_url, full_path)
-                    new_files.append((full_path, year, filename))
+                for url, full_path, ok, error in downloader.download_all(jobs):
+                    if not ok:
+                        failed += 1
+                        print(f"Error descargando {os.path.basename(full_path)}: {error}")
+                        continue
+                    manifest.add(url, full_path)
+                    year_match = re.search(r'/Desaparecidos/(\d{4})/', url)
+                    year = year_match.group(1) if year_match else "Desconocido"
+                    new_files.append((full_path, year, os.path.basename(full_path)))
+                manifest.save()
             
             if not new_files:
                 print("No hay boletines nuevos.")
@@ -109,54 +133,63 @@ class BulletinManager:
                         img_cv = cv2.imread(cropped_path)
                         faces = self.app.get(img_cv)
                         if faces:
-                            self.database.append({
+                            face = largest_face(faces)
+                            h, w = img_cv.shape[:2]
+                            face_box, kps = normalize_geometry(face.bbox, face.kps, w, h)
+                            st = os.stat(cropped_path)
+                            self.gallery.append(face.normed_embedding, {
                                 'name': filename,
                                 'year': year,
-                                'embedding': faces[0].normed_embedding,
-                                'original_path': cropped_path
+                                'face_box': face_box,
+                                'kps': kps,
+                                'original_path': cropped_path,
+                                # Para que step3_index_faces.py no vuelva a indexar esta foto
+                                'key': f"{year}/{cropped_name}",
+                                'sha1': file_sha1(cropped_path),
+                                'size': st.st_size,
+                                'mtime_ns': st.st_mtime_ns
                             })
                     except Exception as e:
                         print(f"Error procesando {filename}: {e}")
                 
-                # Guardar DB con prevencion de corrupcion
-                tmp_db = self.db_file + ".tmp"
-                with open(tmp_db, 'wb') as f:
-                    pickle.dump(self.database, f)
-                if os.path.exists(self.db_file): os.remove(self.db_file)
-                os.rename(tmp_db, self.db_file)
-                print(f"Base de datos actualizada. Total: {len(self.database)} rostros.")
-
+                # Guardar DB (save_store escribe atomicamente, face_meta.json al final)
+                snap = self.gallery.snapshot()
+                arrays = {
+                    'embeddings': snap.embeddings,
+                    'face_box': np.array([e['face_box'] for e in snap.entries], dtype=np.float32),
+                    'kps': np.array([e['kps'] for e in snap.entries], dtype=np.float32),
+                }
+                keys = ('name', 'year', 'original_path', 'key', 'sha1', 'size', 'mtime_ns')
+                columns = {key: [e.get(key, '') for e in snap.entries] for key in keys}
+                info = {k: self.meta[k] for k in ('model_version', 'no_face') if k in self.meta}
+                save_store(self.db_dir, arrays, columns, model='buffalo_l', **info)
+                print(f"Base de datos actualizada. Total: {len(snap)} rostros.")
+
+            # El listado se da por visto sólo si todas sus URLs quedaron descargadas
+            if not failed:
+                cache.commit(TARGET_URL, entry)
             with open(self.update_file, 'w') as f:
                 f.write(str(time.time()))
                 
         except Exception as e:
             print(f"Error en el proceso de update: {e}")
 
-# --- VIDEO STREAM ---
+# --- CAMARA ---
 class VideoStream:
+    """Camara rotada; read() bloquea hasta el siguiente cuadro (lo llama el FrameEngine)."""
     def __init__(self, src):
         self.cap = cv2.VideoCapture(src, cv2.CAP_DSHOW)
         self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
         self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-        self.frame = None
-        self.stopped = False
-
-    def start(self):
-        threading.Thread(target=self.update, daemon=True).start()
-        return self
-
-    def update(self):
-        while not self.stopped:
-            ret, frame = self.cap.read()
-            if ret:
-                # El usuario rota la camara fisicamente 90 grados en su init.py original
-                self.frame = cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
-            else:
-                self.stopped = True
 
-    def read(self): return self.frame
-    def stop(self): 
-        self.stopped = True
+    def read(self):
+        ret, frame = self.cap.read()
+        if not ret:
+            return None
+        # El usuario rota la camara fisicamente 90 grados en su init.py original
+        return cv2.rotate(frame, cv2.ROTATE_90_COUNTERCLOCKWISE)
+
+    def stop(self):
         self.cap.release()
 
 # --- INICIO SISTEMA ---
@@ -164,7 +197,7 @@ print("Cargando Modelos de IA (InsightFace)...")
 app = FaceAnalysis(name='buffalo_l', providers=['CPUExecutionProvider'])
 app.prepare(ctx_id=0, det_size=(640, 640))
 
-manager = BulletinManager(DB_FILE, UPDATE_FILE, FCAES_DIR, app)
+manager = BulletinManager(DB_DIR, UPDATE_FILE, FCAES_DIR, app)
 manager.check_and_update()
 
 print("Conectando con Arduino...")
@@ -175,15 +208,27 @@ except:
     print("Aviso: No se encontro Arduino en COM6. Modo simulacion visual.")
     arduino = None
 
-vs = VideoStream(0).start()
+vs = VideoStream(0)
 
 # --- AJUSTES MOVIMIENTO (MODO NERVIOSO) ---
-posBase, posHombro, posCamV = 90.0, 60.0, 45.0
-targetBase, targetCamV = 90.0, 45.0
 ultimo_avistamiento = time.time()
 ultima_foto = 0
-last_known_base = 90.0
-last_known_camv = 70.0
+
+# Servos a ACTUATE_HZ fijos con la ultima deteccion; la IA corre a su propio ritmo
+ACTUATE_HZ = 50
+# Deteccion completa cada DETECT_EVERY cuadros; en medio se sigue la caja con flujo optico (1 = sin seguimiento)
+DETECT_EVERY = 5
+# Cada cuantas detecciones de un mismo rostro se vuelve a calcular su embedding (muestras para promediar)
+REEMBED_EVERY = 2
+# Busqueda en la galeria con el embedding promedio del track, como mucho cada SEARCH_INTERVAL s
+SEARCH_INTERVAL = 0.5
+# Se muestran 4 parecidos; las fotos de los siguientes se decodifican de antemano por si entran
+SHOW_TOP = 4
+PREFETCH_TOP = 8
+# Una deteccion mas vieja que esto ya no cuenta como "rostro a la vista"
+FACE_TIMEOUT = 0.5
+# El suavizado original (0.22 / 0.03) era por cuadro, a unos 10 cuadros/s
+SMOOTH_REF_HZ = 10.0
 
 # --- SISTEMA DE DATOS PARA RED NEURONAL ---
 CSV_DATOS = os.path.join(BASE_DIR, "training_data.csv")
@@ -191,6 +236,9 @@ if not os.path.exists(CSV_DATOS):
     with open(CSV_DATOS, 'w', newline='') as f:
         writer = csv.writer(f)
         writer.writerow(['timestamp', 'err_x_rel', 'err_y_rel', 'dist_px', 'aciertos', 'fallos', 'peso_v_x', 'peso_h_y'])
+# Con buffer por linea: cada fila llega al archivo al escribirse, aunque se mate el kiosko
+csv_file = open(CSV_DATOS, 'a', newline='', buffering=1)
+csv_writer = csv.writer(csv_file)
 
 # --- CEREBRO Y ENTRENAMIENTO (Separado en brain_trainer.py) ---
 from brain_trainer import BrainTrainer
@@ -207,151 +255,211 @@ b4 = [90, 65, 55, 90]
 
 last_known_base = 90.0
 last_known_camv = 70.0
-current_display_indices = None
-history = []
-MAX_HISTORY = 15
-
-try:
-    while True:
-        frame = vs.read()
-        if frame is None: continue
-
-        faces = app.get(frame)
-        ahora = time.time()
-        
-        # Ventanas
-        reward_canvas = np.zeros((350, 450, 3), dtype=np.uint8)
-        canvas = np.zeros((850, 600, 3), dtype=np.uint8)
-        cv2.putText(canvas, "MIL OJOS v2.0 - SISTEMA DE VIGILANCIA IA", (80, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-        
-        # Centro de la Imagen
-        img_h, img_w = frame.shape[:2]
+identity = TrackIdentity(search_interval=SEARCH_INTERVAL)
+# Fotos de los parecidos ya decodificadas y a tamaño de celda, por indice de galeria
+thumbs = ThumbCache()
+
+# Lo que el hilo de actuacion deja para el HUD (se reemplaza entero, nunca se muta)
+hud = {'face': False, 'searching': False}
+
+
+# --- ETAPA RECONOCIMIENTO (hilo propio) ---
+def recognize(detection):
+    main_face = detection.main
+    # Promedio ponderado de los embeddings del track; se busca solo si hay muestras nuevas
+    identity.add(main_face, detection.t)
+    if not identity.due(detection.t):
+        return None
+    # Snapshot: matriz estable aunque el update agregue rostros en paralelo
+    gallery = manager.gallery.snapshot()
+    if not len(gallery):
+        return None
+    top, _ = top_matches(gallery.embeddings, identity.embedding(), k=PREFETCH_TOP)
+    identity.searched(detection.t)
+    thumbs.prefetch([(int(idx), gallery.entries[idx]['original_path']) for idx in top])
+    top = [int(idx) for idx in top[:SHOW_TOP]]
+    gender = "Masc" if main_face.gender == 1 else "Fem"
+    return {
+        'indices': tuple(top),
+        'entries': [gallery.entries[idx] for idx in top],
+        'bio': f"BIO: {gender} - {int(main_face.age)} anos",
+    }
+
+
+# --- ETAPA ACTUACION (hilo propio, ACTUATE_HZ) ---
+def actuate(detection, fresh, ahora, dt):
+    global ultimo_avistamiento, ultima_foto, last_known_base, last_known_camv, b1, b3, b4, hud
+    face = detection is not None and detection.main is not None and ahora - detection.t < FACE_TIMEOUT
+
+    if face and fresh:
+        ultimo_avistamiento = ahora
+        image = detection.frame.image
+        img_h, img_w = image.shape[:2]
         cx, cy = img_w // 2, img_h // 2
-        
-        # Mira HUD
-        cv2.line(frame, (cx-20, cy), (cx+20, cy), (0, 255, 255), 1)
-        cv2.line(frame, (cx, cy-20), (cx, cy+20), (0, 255, 255), 1)
+        bbox = detection.main.bbox.astype(int)
+        tx, ty = (bbox[0] + bbox[2]) // 2, (bbox[1] + bbox[3]) // 2
+
+        # --- CÁLCULO DE DISTANCIAS ---
+        err_x, err_y = cx - tx, cy - ty
+        distancia_px = np.sqrt(err_x**2 + err_y**2)
+        error_input = np.array([err_x / (img_w / 2), err_y / (img_h / 2)])
+
+        # --- LLAMADA AL CEREBRO (BrainTrainer) --- una vez por deteccion nueva
+        step_v, step_h, status_rl, reward_color = trainer.update(error_input, distancia_px, ahora)
+
+        # Aplicar movimiento EXCLUSIVO al Brazo 2
+        targetArm2[0] += step_h # Base (Yaw)
+        targetArm2[2] += step_v # Codo (Tilt)
+
+        # --- GUARDAR DATOS RED NEURONAL (CSV) ---
+        csv_writer.writerow([ahora, error_input[0], error_input[1], distancia_px, trainer.aciertos, trainer.fallos, trainer.pesos[0][0], trainer.pesos[1][1]])
+
+        # Sincronizar otros brazos (Vigilancia coordinada)
+        last_known_base, last_known_camv = targetArm2[0], targetArm2[2]
+        b1 = [180 - (targetArm2[0] - 5), targetArm2[2] + 15, targetArm2[2], 90]
+        b3 = [targetArm2[0] + 5, targetArm2[2] - 10, targetArm2[2] + 10, 90]
+        b4 = [180 - targetArm2[0], targetArm2[2] + 5, targetArm2[2] - 10, 90]
+
+        # Captura automatica
+        if distancia_px < 35:
+            if ahora - ultima_foto > 10.0:
+                ultima_foto = ahora
+                ts = time.strftime("%Y%m%d_%H%M%S")
+                cv2.imwrite(os.path.join(CAPTURA_COMPLETA_DIR, f"cam_{ts}.jpg"), image)
+                print(f"SISTEMA: Captura centreada realizada ({ts})")
+
+        hud = {'face': True, 'target': (tx, ty), 'dist': distancia_px, 'error': error_input,
+               'status': status_rl, 'color': reward_color}
+
+    elif not face:
+        # --- MODO BUSQUEDA INTELIGENTE ---
+        tiempo_perdido = ahora - ultimo_avistamiento
+        if tiempo_perdido < 6.0:
+            t_j = ahora * 10
+            targetArm2[0] = last_known_base + 10 * np.sin(t_j)
+            targetArm2[2] = last_known_camv + 5 * np.cos(t_j)
+        else:
+            t_s = ahora * 0.3
+            targetArm2[0] = 90 + 60 * np.sin(t_s)
+            targetArm2[2] = 70 + 10 * np.cos(t_s * 0.5)
+
+        t_misc = ahora * 0.25
+        b1 = [90 + 40 * np.sin(t_misc), 60 + 5, 50, 90]
+        b3 = [90 + 40 * np.cos(t_misc), 70, 60, 90]
+        b4 = [90 + 50 * np.sin(t_misc * 0.5), 65, 55, 90]
+        if hud['face'] or hud['searching'] != (tiempo_perdido < 6.0):
+            hud = {'face': False, 'searching': tiempo_perdido < 6.0}
+
+    # --- ENVIAR A ARDUINO (16 SERVOS TOTAL) ---
+    if arduino:
+        # Mismo acercamiento por segundo que el suavizado por cuadro original
+        f_smooth = 1 - (1 - (0.22 if face else 0.03)) ** (dt * SMOOTH_REF_HZ)
+        for i in range(4):
+            targetArm2[i] = np.clip(targetArm2[i], 20, 160)
+            posArm2[i] += (targetArm2[i] - posArm2[i]) * f_smooth
+            posArm2[i] = np.clip(posArm2[i], 20, 160)
+
+        cmd = f"${int(b1[0])},{int(b1[1])},{int(b1[2])},{int(b1[3])},"
+        cmd += f"{int(posArm2[0])},{int(posArm2[1])},{int(posArm2[2])},{int(posArm2[3])},"
+        cmd += f"{int(b3[0])},{int(b3[1])},{int(b3[2])},{int(b3[3])},"
+        cmd += f"{int(b4[0])},{int(b4[1])},{int(b4[2])},{int(b4[3])},1\n"
+        arduino.write(cmd.encode())
+
+
+# --- ETAPA RENDER (hilo principal: las ventanas de OpenCV no salen de aqui) ---
+results_key = None
+
+def results_canvas(state, matches):
+    """Panel de parecidos; solo se recompone (y se muestra) cuando cambia lo que enseña."""
+    global results_key
+    if state['face']:
+        key = ('face', matches['indices'], matches['bio']) if matches is not None else ('face',)
+    else:
+        key = ('searching',) if state['searching'] else ('scanning',)
+    if key == results_key:
+        return None
+    results_key = key
+
+    canvas = np.zeros((850, 600, 3), dtype=np.uint8)
+    cv2.putText(canvas, "MIL OJOS v2.0 - SISTEMA DE VIGILANCIA IA", (80, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+    if state['face']:
+        if matches is not None:
+            cv2.putText(canvas, matches['bio'], (10, 830), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+            for i, (idx, m) in enumerate(zip(matches['indices'], matches['entries'])):
+                m_img = thumbs.get(idx, m['original_path'])
+                if m_img is not None:
+                    row, col = i // 2, i % 2
+                    canvas[50+row*400:380+row*400, 10+col * 290:290+col*290] = m_img
+                    cv2.putText(canvas, f"{m['name'][:20]}", (15+col*290, 410+row*400), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+    elif state['searching']:
+        cv2.putText(canvas, "ESTADO: BUSCANDO SUJETO...", (110, 420), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
+    else:
+        cv2.putText(canvas, "ESTADO: ESCANEANDO ENTORNO...", (100, 420), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
+    return canvas
+
+
+def render(frame, state, matches):
+    reward_canvas = np.zeros((350, 450, 3), dtype=np.uint8)
+
+    # Centro de la Imagen
+    img_h, img_w = frame.shape[:2]
+    cx, cy = img_w // 2, img_h // 2
+
+    # Mira HUD
+    cv2.line(frame, (cx-20, cy), (cx+20, cy), (0, 255, 255), 1)
+    cv2.line(frame, (cx, cy-20), (cx, cy+20), (0, 255, 255), 1)
+
+    if state['face']:
+        tx, ty = state['target']
+        # Dibujo de vector de error
+        cv2.line(frame, (cx, cy), (tx, ty), (0, 255, 0), 2)
+        cv2.circle(frame, (tx, ty), 5, (0, 0, 255), -1)
+
+        # HUD del Entrenador
+        trainer.draw_hud(reward_canvas, state['status'], state['color'], state['dist'])
+
+        # Dibujar vector de Intención IA (Azul) sobre el error
+        mv_ai = np.dot(trainer.pesos, state['error'])
+        cv2.arrowedLine(frame, (cx, cy), (cx+int(mv_ai[1]*500), cy-int(mv_ai[0]*500)), (255, 0, 0), 2)
+
+        # Info en Pantalla
+        cv2.putText(frame, f"DISTANCIA: {int(state['dist'])}px", (tx+10, ty), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+        cv2.putText(frame, f"IA WEIGHTS: {np.round(trainer.pesos.flatten()[:2], 2)}", (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
+
+    # Visualizacion
+    cv2.imshow("Stream Mil Ojos", cv2.resize(frame, (360, 480)))
+    cv2.imshow("Red Neuronal - Refuerzo", reward_canvas)
+    canvas = results_canvas(state, matches)
+    if canvas is not None:
+        cv2.imshow("Resultados de Semejanza", canvas)
 
-        if faces:
-            ultimo_avistamiento = ahora
-            main_face = sorted(faces, key=lambda x: (x.bbox[2]-x.bbox[0])*(x.bbox[3]-x.bbox[1]), reverse=True)[0]
-            
-            bbox = main_face.bbox.astype(int)
-            tx, ty = (bbox[0] + bbox[2]) // 2, (bbox[1] + bbox[3]) // 2
-            
-            # --- CÁLCULO DE DISTANCIAS ---
-            err_x, err_y = cx - tx, cy - ty
-            distancia_px = np.sqrt(err_x**2 + err_y**2)
-            error_input = np.array([err_x / (img_w / 2), err_y / (img_h / 2)])
-            
-            # Dibujo de vector de error
-            cv2.line(frame, (cx, cy), (tx, ty), (0, 255, 0), 2)
-            cv2.circle(frame, (tx, ty), 5, (0, 0, 255), -1)
-            
-            # --- LLAMADA AL CEREBRO (BrainTrainer) ---
-            step_v, step_h, status_rl, reward_color = trainer.update(error_input, distancia_px, ahora)
-            
-            # Aplicar movimiento EXCLUSIVO al Brazo 2
-            targetArm2[0] += step_h # Base (Yaw)
-            targetArm2[2] += step_v # Codo (Tilt)
-            
-            # HUD del Entrenador
-            trainer.draw_hud(reward_canvas, status_rl, reward_color, distancia_px)
-
-            # Dibujar vector de Intención IA (Azul) sobre el error
-            mv_ai = np.dot(trainer.pesos, error_input)
-            cv2.arrowedLine(frame, (cx, cy), (cx+int(mv_ai[1]*500), cy-int(mv_ai[0]*500)), (255, 0, 0), 2)
-
-            # --- GUARDAR DATOS RED NEURONAL (CSV) ---
-            with open(CSV_DATOS, 'a', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow([ahora, error_input[0], error_input[1], distancia_px, trainer.aciertos, trainer.fallos, trainer.pesos[0][0], trainer.pesos[1][1]])
-
-            # Info en Pantalla
-            cv2.putText(frame, f"DISTANCIA: {int(distancia_px)}px", (tx+10, ty), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
-            cv2.putText(frame, f"IA WEIGHTS: {np.round(trainer.pesos.flatten()[:2], 2)}", (10, 20), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 1)
-
-            # Sincronizar otros brazos (Vigilancia coordinada)
-            last_known_base, last_known_camv = targetArm2[0], targetArm2[2]
-            b1 = [180 - (targetArm2[0] - 5), targetArm2[2] + 15, targetArm2[2], 90]
-            b3 = [targetArm2[0] + 5, targetArm2[2] - 10, targetArm2[2] + 10, 90]
-            b4 = [180 - targetArm2[0], targetArm2[2] + 5, targetArm2[2] - 10, 90]
-
-            # --- BUSQUEDA EN DB ---
-            if manager.database:
-                db_embs = np.array([e['embedding'] for e in manager.database])
-                sims = np.dot(db_embs, main_face.normed_embedding)
-                history.append(np.argmax(sims))
-                if len(history) > MAX_HISTORY: history.pop(0)
-                most_common_id, count = Counter(history).most_common(1)[0]
-                if current_display_indices is None or (most_common_id != current_display_indices[0] and count >= 8):
-                    current_display_indices = np.argsort(sims)[-4:][::-1]
-                
-                if current_display_indices is not None:
-                    # Mostrar resultados en canvas (omitido por brevedad en el diff, pero funcional)
-                    gender = "Masc" if main_face.sex == 1 else "Fem"
-                    cv2.putText(canvas, f"BIO: {gender} - {int(main_face.age)} anos", (10, 830), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
-                    for i, idx in enumerate(current_display_indices):
-                        m = manager.database[idx]
-                        m_img = cv2.imread(m['original_path'])
-                        if m_img is not None:
-                            m_img = cv2.resize(m_img, (280, 330))
-                            row, col = i // 2, i % 2
-                            canvas[50+row*400:380+row*400, 10+col * 290:290+col*290] = m_img
-                            cv2.putText(canvas, f"{m['name'][:20]}", (15+col*290, 410+row*400), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
-
-            # Captura automatica
-            if distancia_px < 35:
-                if ahora - ultima_foto > 10.0:
-                    ultima_foto = ahora
-                    ts = time.strftime("%Y%m%d_%H%M%S")
-                    cv2.imwrite(os.path.join(CAPTURA_COMPLETA_DIR, f"cam_{ts}.jpg"), frame)
-                    print(f"SISTEMA: Captura centreada realizada ({ts})")
 
+tracker = FaceTracker(app, detect_every=DETECT_EVERY, reembed_every=REEMBED_EVERY)
+detect = tracker.get if DETECT_EVERY > 1 else app.get
+engine = FrameEngine(vs.read, detect, recognize, actuate, actuate_hz=ACTUATE_HZ).start()
+try:
+    shown = 0
+    while engine.running():
+        frame = engine.frames.peek()
+        if frame is None or frame.seq == shown:
+            # Nada nuevo que mostrar: solo atender el teclado
+            key = cv2.waitKey(5) & 0xFF
         else:
-            # --- MODO BUSQUEDA INTELIGENTE ---
-            tiempo_perdido = ahora - ultimo_avistamiento
-            if tiempo_perdido < 6.0:
-                t_j = ahora * 10
-                targetArm2[0] = last_known_base + 10 * np.sin(t_j)
-                targetArm2[2] = last_known_camv + 5 * np.cos(t_j)
-                cv2.putText(canvas, "ESTADO: BUSCANDO SUJETO...", (110, 420), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 0), 2)
-            else:
-                t_s = ahora * 0.3
-                targetArm2[0] = 90 + 60 * np.sin(t_s)
-                targetArm2[2] = 70 + 10 * np.cos(t_s * 0.5)
-                cv2.putText(canvas, "ESTADO: ESCANEANDO ENTORNO...", (100, 420), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 0, 255), 2)
-            
-            t_misc = ahora * 0.25
-            b1 = [90 + 40 * np.sin(t_misc), 60 + 5, 50, 90]
-            b3 = [90 + 40 * np.cos(t_misc), 70, 60, 90]
-            b4 = [90 + 50 * np.sin(t_misc * 0.5), 65, 55, 90]
-
-        # --- ENVIAR A ARDUINO (16 SERVOS TOTAL) ---
-        if arduino:
-            f_smooth = 0.22 if faces else 0.03
-            for i in range(4):
-                targetArm2[i] = np.clip(targetArm2[i], 20, 160)
-                posArm2[i] += (targetArm2[i] - posArm2[i]) * f_smooth
-                posArm2[i] = np.clip(posArm2[i], 20, 160)
-            
-            cmd = f"${int(b1[0])},{int(b1[1])},{int(b1[2])},{int(b1[3])},"
-            cmd += f"{int(posArm2[0])},{int(posArm2[1])},{int(posArm2[2])},{int(posArm2[3])}," 
-            cmd += f"{int(b3[0])},{int(b3[1])},{int(b3[2])},{int(b3[3])},"
-            cmd += f"{int(b4[0])},{int(b4[1])},{int(b4[2])},{int(b4[3])},1\n"
-            arduino.write(cmd.encode())
-
-        # Visualizacion
-        cv2.imshow("Stream Mil Ojos", cv2.resize(frame, (360, 480)))
-        cv2.imshow("Red Neuronal - Refuerzo", reward_canvas)
-        cv2.imshow("Resultados de Semejanza", canvas)
-        
-        key = cv2.waitKey(1) & 0xFF
+            shown = frame.seq
+            render(frame.image.copy(), hud, engine.matches.peek())
+            key = cv2.waitKey(1) & 0xFF
         if key == ord('q'): break
         if key == ord('r'): trainer.reset_pesos()
 
 except KeyboardInterrupt: pass
 finally:
+    engine.stop()
+    print("Frame engine:")
+    engine.print_stats()
+    print(f"  tracker    {tracker.stats()}")
+    print(f"  thumbs     {thumbs.stats()}")
+    thumbs.close()
     vs.stop()
     cv2.destroyAllWindows()
-    if arduino: arduino.close()
\ No newline at end of file
+    csv_file.close()
+    if arduino: arduino.close()
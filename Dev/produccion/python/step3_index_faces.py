@@ -1,78 +1,392 @@
 import os
 import cv2
+import time
+import shutil
+import hashlib
+import argparse
+import multiprocessing
 import numpy as np
-import pickle
 from insightface.app import FaceAnalysis
 from tqdm import tqdm
+from face_store import has_store, load_store, save_store, normalize_geometry
 
-def index_faces():
-    # Base configuration
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    base_dir = os.path.join(current_dir, "..", "fcaesDes")
-    db_file = os.path.join(current_dir, "face_database.pkl")
-    
-    # Initialize InsightFace
-    # We use a standard provider (CPU for now as we don't know if user has GPU)
-    app = FaceAnalysis(name='buffalo_l', providers=['CPUExecutionProvider'])
-    app.prepare(ctx_id=0, det_size=(640, 640))
-    
-    database = []
-    
-    # Process each year folder
+# Identifies how embeddings were produced. Bump it when the model, det_size or
+# face selection changes: stores built with another version are never reused.
+MODEL_VERSION = 'buffalo_l/det640/v2'   # v2: largest face instead of faces[0]
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png')
+# Results of an unfinished run, next to the store; removed once the store is written
+CHECKPOINT_DIR = 'index_checkpoint'
+
+
+def list_photos(base_dir):
+    """Every cropped photo as a record keyed by 'YEAR/filename', in a stable order."""
+    photos = []
     years = sorted([d for d in os.listdir(base_dir) if d.isdigit()])
-    
-    print(f"Starting Face Indexing using InsightFace...")
-    
     for year in years:
-        year_path = os.path.join(base_dir, year)
-        crop_dir = os.path.join(year_path, "fotos_recortadas")
-        
+        crop_dir = os.path.join(base_dir, year, "fotos_recortadas")
         if not os.path.exists(crop_dir):
             continue
-            
-        print(f"Indexing year: {year}")
-        files = [f for f in os.listdir(crop_dir) if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
-        
-        for filename in tqdm(files, desc=f"Year {year}"):
-            img_path = os.path.join(crop_dir, filename)
-            
-            try:
-                # Load image
-                img = cv2.imread(img_path)
-                if img is None:
-                    continue
-                
-                # Get faces
-                faces = app.get(img)
-                
-                if not faces:
-                    # Optional: print(f"No face found in {filename}")
-                    continue
-                
-                # Take the most prominent face
-                # Each face has an 'embedding' (512-d for buffalo_l)
-                # and a 'normed_embedding'
-                face = faces[0]
-                
-                # Clean name: remove prefix 'foto_' if present
-                clean_name = filename.replace('foto_', '')
-                
-                database.append({
-                    'name': clean_name,
+        for filename in sorted(os.listdir(crop_dir)):
+            if filename.lower().endswith(IMAGE_EXTS):
+                photos.append({
+                    'key': f"{year}/{filename}",
                     'year': year,
-                    'embedding': face.normed_embedding,
-                    'original_path': img_path
+                    'filename': filename,
+                    'path': os.path.join(crop_dir, filename),
                 })
-                
+    return photos
+
+
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def load_previous(store_dir):
+    """
+    Rows of the current store by key, only if it was built with MODEL_VERSION.
+    Photos where no face was found are remembered too (result None) so they
+    are not re-run every day.
+    """
+    if not has_store(store_dir):
+        return {}
+    arrays, columns, meta = load_store(store_dir)
+    if meta.get('model_version') != MODEL_VERSION or 'face_box' not in arrays:
+        return {}
+
+    previous = {}
+    for i, key in enumerate(columns['key']):
+        previous[key] = {
+            'sha1': columns['sha1'][i],
+            'size': columns['size'][i],
+            'mtime_ns': columns['mtime_ns'][i],
+            'result': (arrays['embeddings'][i], arrays['face_box'][i], arrays['kps'][i]),
+        }
+    for key, info in meta.get('no_face', {}).items():
+        previous[key] = {**info, 'result': None}
+    return previous
+
+
+def plan_photos(photos, previous):
+    """
+    Fills sha1/size/mtime for every photo and reuses the previous result when
+    the content hash is unchanged. Files whose size and mtime did not change
+    keep their stored hash without being read again.
+    Returns the photos that still need to be embedded.
+    """
+    todo = []
+    for photo in photos:
+        st = os.stat(photo['path'])
+        prev = previous.get(photo['key'])
+        if prev and prev['size'] == st.st_size and prev['mtime_ns'] == st.st_mtime_ns:
+            sha1 = prev['sha1']
+        else:
+            sha1 = file_sha1(photo['path'])
+        photo.update(sha1=sha1, size=st.st_size, mtime_ns=st.st_mtime_ns)
+
+        if prev and prev['sha1'] == sha1:
+            photo['result'] = prev['result']
+        else:
+            todo.append(photo)
+    return todo
+
+
+def create_face_app(threads=0):
+    """
+    Detection + recognition only (the other buffalo_l heads are not stored).
+    `threads` caps onnxruntime's intra-op threads, so N worker processes do
+    not each try to use every core.
+    """
+    # We use a standard provider (CPU for now as we don't know if user has GPU)
+    app = FaceAnalysis(name='buffalo_l', allowed_modules=['detection', 'recognition'],
+                       providers=['CPUExecutionProvider'])
+    app.prepare(ctx_id=0, det_size=(640, 640))
+    if threads > 0:
+        # FaceAnalysis only forwards providers to InferenceSession, so session
+        # options passed to it are ignored: rebuild each session with the cap
+        import onnxruntime as ort
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = threads
+        opts.inter_op_num_threads = 1
+        for model in app.models.values():
+            model.session = ort.InferenceSession(model.model_file, sess_options=opts,
+                                                 providers=model.session.get_providers())
+    effective = {name: model.session.get_session_options().intra_op_num_threads
+                 for name, model in app.models.items()}
+    print(f"onnxruntime intra-op threads (pid {os.getpid()}): "
+          + ", ".join(f"{name}={n or 'all cores'}" for name, n in effective.items()))
+    return app
+
+
+def embed_photo(app, path):
+    """(embedding, face_box, kps) of the most prominent face, or None if there is no face."""
+    img = cv2.imread(path)
+    if img is None:
+        return None
+    return embed_image(app, img)
+
+
+def largest_face(faces):
+    return max(faces, key=lambda f: (f.bbox[2] - f.bbox[0]) * (f.bbox[3] - f.bbox[1]))
+
+
+def embed_image(app, img):
+    """Same as embed_photo for an already decoded BGR image."""
+    faces = app.get(img)
+    if not faces:
+        return None
+
+    # Take the most prominent face (the largest box; app.get does not sort by size)
+    # Each face has an 'embedding' (512-d for buffalo_l) and a 'normed_embedding'
+    face = largest_face(faces)
+
+    # Normalized box + 5 keypoints, so the API never has to re-detect gallery photos
+    h, w = img.shape[:2]
+    face_box, kps = normalize_geometry(face.bbox, face.kps, w, h)
+    return face.normed_embedding.astype(np.float32), face_box, kps
+
+
+# One FaceAnalysis per worker process, created by the pool initializer
+_worker_app = None
+
+
+def _init_worker(threads):
+    global _worker_app
+    try:
+        _worker_app = create_face_app(threads)
+    except Exception as e:
+        # A failing initializer makes Pool respawn workers forever; report it per task instead
+        _worker_app = e
+
+
+def _embed_task(path):
+    if isinstance(_worker_app, Exception):
+        return None, f"worker could not load the model: {_worker_app}"
+    try:
+        return embed_photo(_worker_app, path), None
+    except Exception as e:
+        return None, str(e)
+
+
+def embed_photos(todo, workers=1, threads=0, app=None):
+    """
+    Yields (photo, result, error) for every photo in `todo`, in `todo` order.
+    With workers > 1 the list is sharded in chunks across processes; imap keeps
+    the results in input order, so the output is identical to the serial run.
+    A given `app` is used as is (serial).
+    """
+    if workers <= 1 or app is not None:
+        app = app or create_face_app(threads)
+        for photo in todo:
+            try:
+                yield photo, embed_photo(app, photo['path']), None
             except Exception as e:
-                print(f"Error processing {filename}: {e}")
-                
+                yield photo, None, str(e)
+        return
+
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    chunksize = max(1, min(32, len(todo) // (workers * 4)))
+    ctx = multiprocessing.get_context('spawn')
+    with ctx.Pool(workers, initializer=_init_worker, initargs=(threads,)) as pool:
+        paths = [photo['path'] for photo in todo]
+        for photo, (result, error) in zip(todo, pool.imap(_embed_task, paths, chunksize=chunksize)):
+            yield photo, result, error
+
+
+class Checkpoint:
+    """
+    Durable log of the results of the current run, as numbered chunk_NNNNN.npz
+    files. Each chunk is written to a temp file and renamed, so a killed run
+    leaves only whole chunks behind; the next run reuses every entry whose
+    key, sha1 and MODEL_VERSION still match and embeds only the rest.
+    """
+
+    def __init__(self, directory, chunk_size=256):
+        self.directory = directory
+        self.chunk_size = max(1, chunk_size)
+        self.pending = []
+        self.next_chunk = len(self._chunk_files())
+
+    def _chunk_files(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(f for f in os.listdir(self.directory)
+                      if f.startswith('chunk_') and f.endswith('.npz'))
+
+    def load(self):
+        """{key: (sha1, result)} from every committed chunk of this MODEL_VERSION."""
+        done = {}
+        for filename in self._chunk_files():
+            path = os.path.join(self.directory, filename)
+            try:
+                with np.load(path) as data:
+                    if str(data['model_version']) != MODEL_VERSION:
+                        continue
+                    for i, key in enumerate(data['keys']):
+                        result = None
+                        if data['has_face'][i]:
+                            result = (data['embeddings'][i], data['face_box'][i], data['kps'][i])
+                        done[str(key)] = (str(data['sha1'][i]), result)
+            except Exception as e:
+                print(f"Skipping unreadable checkpoint {filename}: {e}")
+        return done
+
+    def resume(self, todo):
+        """Takes the results already in the checkpoint; returns the photos still to embed."""
+        done = self.load()
+        remaining = []
+        for photo in todo:
+            entry = done.get(photo['key'])
+            if entry and entry[0] == photo['sha1']:
+                photo['result'] = entry[1]
+            else:
+                remaining.append(photo)
+        return remaining
+
+    def add(self, photo):
+        self.pending.append(photo)
+        if len(self.pending) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.pending:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        rows = self.pending
+        empty = (np.zeros(512, np.float32), np.zeros(4, np.float32), np.zeros((5, 2), np.float32))
+        results = [p['result'] if p['result'] is not None else empty for p in rows]
+        path = os.path.join(self.directory, f"chunk_{self.next_chunk:05d}.npz")
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            np.savez(f,
+                     model_version=np.str_(MODEL_VERSION),
+                     keys=np.array([p['key'] for p in rows]),
+                     sha1=np.array([p['sha1'] for p in rows]),
+                     has_face=np.array([p['result'] is not None for p in rows]),
+                     embeddings=np.array([r[0] for r in results], dtype=np.float32).reshape(-1, 512),
+                     face_box=np.array([r[1] for r in results], dtype=np.float32).reshape(-1, 4),
+                     kps=np.array([r[2] for r in results], dtype=np.float32).reshape(-1, 5, 2))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+        self.next_chunk += 1
+        self.pending = []
+
+    def clear(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def save_database(store_dir, photos):
+    """Writes every photo with a result; photos without a face go to meta['no_face']."""
+    rows = [p for p in photos if p.get('result') is not None]
+    no_face = {p['key']: {'sha1': p['sha1'], 'size': p['size'], 'mtime_ns': p['mtime_ns']}
+               for p in photos if 'result' in p and p['result'] is None}
+
+    arrays = {
+        'embeddings': np.array([p['result'][0] for p in rows], dtype=np.float32).reshape(-1, 512),
+        'face_box': np.array([p['result'][1] for p in rows], dtype=np.float32).reshape(-1, 4),
+        'kps': np.array([p['result'][2] for p in rows], dtype=np.float32).reshape(-1, 5, 2),
+    }
+    columns = {
+        # Clean name: remove prefix 'foto_' if present
+        'name': [p['filename'].replace('foto_', '') for p in rows],
+        'year': [p['year'] for p in rows],
+        'original_path': [p['path'] for p in rows],
+        'key': [p['key'] for p in rows],
+        'sha1': [p['sha1'] for p in rows],
+        'size': [p['size'] for p in rows],
+        'mtime_ns': [p['mtime_ns'] for p in rows],
+    }
+    save_store(store_dir, arrays, columns, model='buffalo_l', model_version=MODEL_VERSION, no_face=no_face)
+    return len(rows)
+
+
+def index_faces(full=False, workers=1, threads=0, max_seconds=0, chunk_size=256, get_app=None):
+    """
+    Embeds new/changed photos and writes the store. Results are checkpointed
+    every `chunk_size` photos; with `max_seconds` the run stops at the budget
+    (store untouched) and the next run carries on from the checkpoint.
+    `get_app` returns an already loaded FaceAnalysis to reuse (serial mode);
+    it is only called when there is something to embed.
+
+    Returns stats: items (photos embedded), photos, faces, failed, errors,
+    seconds and complete (False when the budget ran out).
+    """
+    # Base configuration
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    base_dir = os.path.join(current_dir, "..", "fcaesDes")
+    # Output: face_meta.json + face_embeddings.<version>.npy (see face_store.py)
+    store_dir = current_dir
+    started = time.monotonic()
+
+    print(f"Starting Face Indexing using InsightFace ({'full' if full else 'incremental'})...")
+
+    photos = list_photos(base_dir)
+    previous = {} if full else load_previous(store_dir)
+    todo = plan_photos(photos, previous)
+    removed = len(set(previous) - {p['key'] for p in photos})
+
+    checkpoint = Checkpoint(os.path.join(store_dir, CHECKPOINT_DIR), chunk_size)
+    remaining = checkpoint.resume(todo)
+    print(f"{len(photos)} photos: {len(photos) - len(todo)} unchanged, "
+          f"{len(todo) - len(remaining)} from checkpoint, {len(remaining)} to embed, {removed} removed.")
+
+    stats = {'items': 0, 'photos': len(photos), 'faces': None, 'failed': 0, 'errors': [], 'complete': True}
+
+    def finish():
+        stats['seconds'] = round(time.monotonic() - started, 2)
+        return stats
+
+    if previous and not todo and not removed:
+        print("Nothing changed, database is up to date.")
+        checkpoint.clear()
+        return finish()
+
+    if remaining:
+        if workers > 1:
+            print(f"Embedding with {workers} worker processes...")
+        results = embed_photos(remaining, workers, threads, app=get_app() if get_app else None)
+        for photo, result, error in tqdm(results, total=len(remaining), desc="Embedding"):
+            if error:
+                # Left without a result: not saved, retried on the next run
+                print(f"Error processing {photo['filename']}: {error}")
+                stats['failed'] += 1
+                stats['errors'].append(f"{photo['key']}: {error}")
+            else:
+                photo['result'] = result
+                checkpoint.add(photo)
+                stats['items'] += 1
+            if max_seconds and time.monotonic() - started > max_seconds:
+                stats['complete'] = False
+                break
+        # Stops the worker pool right away when the budget ran out
+        results.close()
+        checkpoint.flush()
+        if not stats['complete']:
+            print(f"Time budget of {max_seconds:.0f}s reached: {stats['items']}/{len(remaining)} embedded and "
+                  f"checkpointed in {CHECKPOINT_DIR}/. Run again to continue; the store was not modified.")
+            return finish()
+
     # Save database
-    print(f"Saving {len(database)} entries to {db_file}...")
-    with open(db_file, 'wb') as f:
-        pickle.dump(database, f)
-    
-    print("Indexing complete!")
+    print(f"Saving to {store_dir}...")
+    stats['faces'] = save_database(store_dir, photos)
+    checkpoint.clear()
+    print(f"Indexing complete! {stats['faces']} faces.")
+    return finish()
+
 
 if __name__ == "__main__":
-    index_faces()
+    parser = argparse.ArgumentParser(description="Index cropped bulletin photos with InsightFace")
+    parser.add_argument('--full', action='store_true', help="Re-embed every photo, ignoring the current database")
+    parser.add_argument('--workers', type=int, default=1, help="Worker processes, each with its own ONNX session")
+    parser.add_argument('--threads', type=int, default=0,
+                        help="onnxruntime intra-op threads per process (default: cores / workers)")
+    parser.add_argument('--max-seconds', type=float, default=0,
+                        help="Stop after this many seconds and leave the rest for the next run (0 = no limit)")
+    parser.add_argument('--chunk-size', type=int, default=256, help="Photos per checkpoint chunk")
+    args = parser.parse_args()
+    index_faces(full=args.full, workers=args.workers, threads=args.threads,
+                max_seconds=args.max_seconds, chunk_size=args.chunk_size)
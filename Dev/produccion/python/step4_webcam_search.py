@@ -1,22 +1,69 @@
 import os
 import cv2
 import numpy as np
-import pickle
 from insightface.app import FaceAnalysis
-from collections import Counter
+from face_store import has_store, load_store
+from frame_engine import FrameEngine
+from face_tracker import FaceTracker
+from track_identity import TrackIdentity, top_matches
+from thumb_cache import ThumbCache
+
+# Full detection every DETECT_EVERY frames, optical-flow tracking in between (1 = detect every frame)
+DETECT_EVERY = 5
+# Every how many detections of the same face its embedding is recomputed (samples to average)
+REEMBED_EVERY = 2
+# Gallery search with the track's mean embedding, at most every SEARCH_INTERVAL seconds
+SEARCH_INTERVAL = 0.5
+# 4 matches are shown; photos of the next ones are decoded ahead in case they move up
+SHOW_TOP = 4
+PREFETCH_TOP = 8
+
+def build_panel(database, indices, scores, main_face, thumbs):
+    """Composite panel with the top matches and the traits of the visitor."""
+    canvas = np.zeros((850, 600, 3), dtype=np.uint8) # Increased height for info
+    
+    # Header
+    cv2.putText(canvas, "SIMILITUDES ENCONTRADAS (ESTABLE)", (140, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+    
+    for i, (idx, score) in enumerate(zip(indices, scores)):
+        match = database[idx]
+        
+        # Decoded and resized once, then served from the cache
+        m_img = thumbs.get(idx, match['original_path'])
+        if m_img is None: continue
+        
+        row = i // 2
+        col = i % 2
+        y_off = 50 + row * 400
+        x_off = 10 + col * 290
+        
+        canvas[y_off:y_off+330, x_off:x_off+280] = m_img
+        
+        color = (0, 255, 0) if score > 0.45 else (200, 200, 200)
+        cv2.putText(canvas, f"{i+1}. {match['year']}", (x_off, y_off+345), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+        cv2.putText(canvas, f"{match['name'][:24]}", (x_off, y_off+360), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
+        cv2.putText(canvas, f"{score*100:.1f}%", (x_off+220, y_off+345), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+
+    # Add "Similar Characteristics" of identifying person below
+    # InsightFace buffalo_l provides 'gender' (0:Female, 1:Male; 'sex' is the 'F'/'M' string) and 'age'
+    gender = "Masc" if main_face.gender == 1 else "Fem"
+    age = int(main_face.age)
+    traits_text = f"TUS RASGOS: {gender} | Edad aprox: {age} anos"
+    cv2.putText(canvas, traits_text, (10, 830), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+    return canvas
+
 
 def webcam_search():
     # Base configuration
     current_dir = os.path.dirname(os.path.abspath(__file__))
-    db_file = os.path.join(current_dir, "face_database.pkl")
     
-    if not os.path.exists(db_file):
-        print(f"Error: Database not found at {db_file}. Please run step3_index_faces.py first.")
+    if not has_store(current_dir):
+        print(f"Error: Database not found in {current_dir}. Please run step3_index_faces.py first.")
         return
 
     print("Loading face database...")
-    with open(db_file, 'rb') as f:
-        database = pickle.load(f)
+    arrays, columns, _ = load_store(current_dir)
+    database = [dict(zip(columns, row)) for row in zip(*columns.values())]
     print(f"Loaded {len(database)} indexed faces.")
 
     # Initialize InsightFace
@@ -32,100 +79,79 @@ def webcam_search():
 
     print("Live Search Started. Press 'q' to quit.")
     
-    # Pre-compute all embeddings into a matrix for speed
-    db_embeddings = np.array([entry['embedding'] for entry in database])
+    # Embeddings are already a (N, 512) matrix, memory-mapped from disk
+    db_embeddings = arrays['embeddings']
     
-    # Stabilization and State
-    history = []
-    MAX_HISTORY = 15
-    current_display_indices = None # Store what we are currently showing
+    # Identity of the current track (only touched by the recognize thread)
+    identity = TrackIdentity(search_interval=SEARCH_INTERVAL)
+    state = {'shown': None, 'panel': None}
+    thumbs = ThumbCache()
     
-    while True:
+    def read():
         ret, frame = cap.read()
-        if not ret:
-            break
-            
-        frame = cv2.flip(frame, 1)
-        faces = app.get(frame)
+        return cv2.flip(frame, 1) if ret else None
+
+    def recognize(detection):
+        main_face = detection.main
+        # Weighted mean of the track's embeddings; search only when it got new samples
+        identity.add(main_face, detection.t)
+        if not identity.due(detection.t):
+            return None
+        top, scores = top_matches(db_embeddings, identity.embedding(), k=PREFETCH_TOP)
+        identity.searched(detection.t)
+        thumbs.prefetch([(int(idx), database[idx]['original_path']) for idx in top[SHOW_TOP:]])
+        top, scores = [int(idx) for idx in top[:SHOW_TOP]], scores[:SHOW_TOP]
         
-        if faces:
-            faces = sorted(faces, key=lambda x: (x.bbox[2]-x.bbox[0])*(x.bbox[3]-x.bbox[1]), reverse=True)
-            main_face = faces[0]
-            
-            bbox = main_face.bbox.astype(int)
-            cv2.rectangle(frame, (bbox[0], bbox[1]), (bbox[2], bbox[3]), (0, 255, 0), 2)
-            
-            # Search
-            target_embedding = main_face.normed_embedding
-            similarities = np.dot(db_embeddings, target_embedding)
-            
-            # Get current top match info
-            best_idx = np.argmax(similarities)
-            
-            # Stabilization: Add to history
-            history.append(best_idx)
-            if len(history) > MAX_HISTORY:
-                history.pop(0)
-            
-            # Determine "Stable Best Match"
-            most_common_id, count = Counter(history).most_common(1)[0]
-            
-            # Lógica "Sticky": Solo actualizamos el panel si:
-            # 1. No hay nada mostrándose.
-            # 2. El match más común ha cambiado Y es muy estable (ej. 8 de 15 frames).
-            if current_display_indices is None or (most_common_id != current_display_indices[0] and count >= 8):
-                current_display_indices = np.argsort(similarities)[-4:][::-1]
-                
-                # Create composite panel
-                canvas = np.zeros((850, 600, 3), dtype=np.uint8) # Increased height for info
-                
-                # Header
-                cv2.putText(canvas, "SIMILITUDES ENCONTRADAS (ESTABLE)", (140, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-                
-                for i, idx in enumerate(current_display_indices):
-                    match = database[idx]
-                    score = similarities[idx]
-                    
-                    m_img = cv2.imread(match['original_path'])
-                    if m_img is None: continue
-                    
-                    m_img = cv2.resize(m_img, (280, 330))
-                    
-                    row = i // 2
-                    col = i % 2
-                    y_off = 50 + row * 400
-                    x_off = 10 + col * 290
-                    
-                    canvas[y_off:y_off+330, x_off:x_off+280] = m_img
-                    
-                    color = (0, 255, 0) if score > 0.45 else (200, 200, 200)
-                    cv2.putText(canvas, f"{i+1}. {match['year']}", (x_off, y_off+345), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
-                    cv2.putText(canvas, f"{match['name'][:24]}", (x_off, y_off+360), cv2.FONT_HERSHEY_SIMPLEX, 0.4, (255, 255, 255), 1)
-                    cv2.putText(canvas, f"{score*100:.1f}%", (x_off+220, y_off+345), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+        # Rebuild the panel only when the displayed matches change
+        if top != state['shown']:
+            state['shown'] = top
+            state['panel'] = build_panel(database, top, scores, main_face, thumbs)
+        # The same panel object until the displayed set changes
+        return {'best_score': scores[0], 'panel': state['panel']}
 
-                # Add "Similar Characteristics" of identifying person below
-                # InsightFace buffalo_l provides 'sex' (0:Female, 1:Male) and 'age'
-                gender = "Masc" if main_face.sex == 1 else "Fem"
-                age = int(main_face.age)
-                traits_text = f"TUS RASGOS: {gender} | Edad aprox: {age} anos"
-                cv2.putText(canvas, traits_text, (10, 830), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
-                
-                cv2.imshow('Top 4 Matches', canvas)
+    tracker = FaceTracker(app, detect_every=DETECT_EVERY, reembed_every=REEMBED_EVERY)
+    detect = tracker.get if DETECT_EVERY > 1 else app.get
+    engine = FrameEngine(read, detect, recognize).start()
+    shown_seq, panel = 0, None
+    while engine.running():
+        frame = engine.frames.peek()
+        if frame is None or frame.seq == shown_seq:
+            if cv2.waitKey(5) & 0xFF == ord('q'):
+                break
+            continue
+        shown_seq = frame.seq
+        image = frame.image.copy()
+        
+        # Newest detection and search result; they may lag the frame by a few ms
+        detection = engine.detections.peek()
+        if detection is not None and detection.main is not None:
+            bbox = detection.main.bbox.astype(int)
+            cv2.rectangle(image, (bbox[0], bbox[1]), (bbox[2], bbox[3]), (0, 255, 0), 2)
             
-            # Label on webcam frame
-            best_score_live = similarities[best_idx]
-            label = f"Buscando... Mejor match: {best_score_live*100:.1f}%"
-            cv2.putText(frame, label, (bbox[0], bbox[1]-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
-
-        cv2.imshow('Busqueda en Boletines', frame)
+            match = engine.matches.peek()
+            if match is not None:
+                # Label on webcam frame
+                label = f"Buscando... Mejor match: {match['best_score']*100:.1f}%"
+                cv2.putText(image, label, (bbox[0], bbox[1]-10), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 0), 2)
+        
+        # A new panel only when recognize composed one (the displayed set changed)
+        match = engine.matches.peek()
+        if match is not None and match['panel'] is not panel:
+            panel = match['panel']
+            cv2.imshow('Top 4 Matches', panel)
         
-        if not faces:
-            history = []
-            # We don't automatically close windows to allow user to see the result
+        cv2.imshow('Busqueda en Boletines', image)
+        # We don't automatically close windows to allow user to see the result
         
         if cv2.waitKey(1) & 0xFF == ord('q'):
             break
 
+    engine.stop()
+    print("Frame engine:")
+    engine.print_stats()
+    print(f"  tracker    {tracker.stats()}")
+    print(f"  thumbs     {thumbs.stats()}")
+    thumbs.close()
     cap.release()
     cv2.destroyAllWindows()
 
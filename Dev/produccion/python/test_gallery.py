@@ -0,0 +1,57 @@
+"""
+Gallery snapshots stay frozen while the update thread appends or resets.
+
+    python -m unittest test_gallery      (from Dev/produccion/python)
+"""
+import unittest
+import numpy as np
+from gallery import Gallery
+
+
+def rows(n, dim=4, start=0):
+    return np.arange(start * dim, (start + n) * dim, dtype=np.float32).reshape(n, dim)
+
+
+class GalleryTest(unittest.TestCase):
+    def test_snapshot_is_cached_until_a_change(self):
+        gallery = Gallery(dim=4)
+        gallery.reset(rows(3), ['a', 'b', 'c'])
+        snap = gallery.snapshot()
+        self.assertIs(gallery.snapshot(), snap)
+        gallery.append(rows(1, start=3)[0], 'd')
+        self.assertIsNot(gallery.snapshot(), snap)
+        self.assertEqual(len(gallery.snapshot()), 4)
+
+    def test_snapshot_survives_appends_and_growth(self):
+        gallery = Gallery(dim=4, capacity=2)
+        gallery.append(rows(1)[0], 'a')
+        snap = gallery.snapshot()
+        # Past the capacity of 2: the buffer is copied into a bigger one
+        for i in range(1, 5):
+            self.assertEqual(gallery.append(rows(1, start=i)[0], str(i)), i)
+        self.assertEqual(len(snap), 1)
+        np.testing.assert_array_equal(snap.embeddings, rows(1))
+        self.assertEqual(snap.entries, ('a',))
+        np.testing.assert_array_equal(gallery.snapshot().embeddings, rows(5))
+
+    def test_snapshot_survives_reset(self):
+        gallery = Gallery(dim=4)
+        gallery.reset(rows(2), ['a', 'b'])
+        snap = gallery.snapshot()
+        gallery.reset(rows(1, start=9), ['z'])
+        np.testing.assert_array_equal(snap.embeddings, rows(2))
+        self.assertEqual(gallery.snapshot().entries, ('z',))
+
+    def test_snapshot_is_read_only(self):
+        gallery = Gallery(dim=4)
+        gallery.reset(rows(2), ['a', 'b'])
+        with self.assertRaises(ValueError):
+            gallery.snapshot().embeddings[0, 0] = 1.0
+
+    def test_reset_checks_lengths(self):
+        with self.assertRaises(ValueError):
+            Gallery(dim=4).reset(rows(2), ['a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""
+ThumbCache: LRU eviction, cached misses and background prefetch.
+
+    python -m unittest test_thumb_cache      (from Dev/produccion/python)
+"""
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import cv2
+import numpy as np
+from thumb_cache import ThumbCache
+
+
+class ThumbCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.paths = []
+        for i in range(4):
+            path = os.path.join(self.dir, f'{i}.png')
+            cv2.imwrite(path, np.full((40, 30, 3), i * 50, dtype=np.uint8))
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_resized_to_cell(self):
+        cache = ThumbCache(size=(20, 10), prefetch_workers=0)
+        self.assertEqual(cache.get(0, self.paths[0]).shape, (10, 20, 3))
+
+    def test_lru_eviction(self):
+        cache = ThumbCache(size=(20, 10), capacity=2, prefetch_workers=0)
+        cache.get(0, self.paths[0])
+        cache.get(1, self.paths[1])
+        cache.get(0, self.paths[0])      # 0 becomes the most recent
+        cache.get(2, self.paths[2])      # evicts 1, not 0
+        self.assertEqual(list(cache.items), [0, 2])
+        self.assertEqual(cache.stats(), {'cached': 2, 'hits': 1, 'misses': 3})
+
+    def test_unreadable_photo_is_cached_as_none(self):
+        cache = ThumbCache(prefetch_workers=0)
+        missing = os.path.join(self.dir, 'missing.png')
+        self.assertIsNone(cache.get(9, missing))
+        self.assertIsNone(cache.get(9, missing))
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_prefetch(self):
+        cache = ThumbCache(size=(20, 10))
+        try:
+            cache.prefetch(list(enumerate(self.paths)))
+            deadline = time.monotonic() + 5
+            while len(cache.items) < len(self.paths) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(sorted(cache.items), [0, 1, 2, 3])
+            cache.get(3, self.paths[3])
+            self.assertEqual(cache.stats()['misses'], 0)
+        finally:
+            cache.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
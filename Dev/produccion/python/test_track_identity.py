@@ -0,0 +1,70 @@
+"""
+TrackIdentity: quality-weighted mean of a track's embeddings and search pacing.
+
+    python -m unittest test_track_identity      (from Dev/produccion/python)
+"""
+import unittest
+import numpy as np
+from track_identity import FULL_QUALITY_SIDE, TrackIdentity, sample_quality, top_matches
+
+
+class FakeFace(dict):
+    """The attribute-style dict that insightface's Face is, with only what TrackIdentity reads."""
+    __getattr__ = dict.get
+
+
+def face(embedding, side=FULL_QUALITY_SIDE, det_score=1.0, **extra):
+    return FakeFace(bbox=np.array([0, 0, side, side], dtype=np.float32), det_score=det_score,
+                    normed_embedding=np.asarray(embedding, dtype=np.float32), **extra)
+
+
+class TrackIdentityTest(unittest.TestCase):
+    def test_sample_quality(self):
+        self.assertAlmostEqual(sample_quality(face([1, 0])), 1.0)
+        self.assertAlmostEqual(sample_quality(face([1, 0], det_score=0.5)), 0.5)
+        self.assertAlmostEqual(sample_quality(face([1, 0], side=FULL_QUALITY_SIDE // 2)), 0.5)
+        # Tiny faces still count, at the 0.2 floor
+        self.assertAlmostEqual(sample_quality(face([1, 0], side=1)), 0.2)
+
+    def test_mean_is_weighted_by_quality(self):
+        identity = TrackIdentity()
+        identity.add(face([1, 0], track_id=1), 0.0)
+        identity.add(face([0, 1], track_id=1, det_score=0.25, embedded=True), 0.1)
+        expected = np.array([1, 0.25]) / np.linalg.norm([1, 0.25])
+        np.testing.assert_allclose(identity.embedding(), expected, rtol=1e-6)
+        self.assertEqual(identity.samples, 2)
+
+    def test_tracked_frames_add_no_sample(self):
+        identity = TrackIdentity()
+        self.assertTrue(identity.add(face([1, 0], track_id=1), 0.0))
+        self.assertFalse(identity.add(face([0, 1], track_id=1, embedded=False), 0.1))
+        np.testing.assert_allclose(identity.embedding(), [1, 0])
+
+    def test_new_track_or_gap_resets(self):
+        identity = TrackIdentity(max_gap=0.5)
+        identity.add(face([1, 0], track_id=1), 0.0)
+        identity.add(face([0, 1], track_id=2), 0.1)
+        np.testing.assert_allclose(identity.embedding(), [0, 1])
+        identity.add(face([1, 0], track_id=2), 1.0)
+        self.assertEqual(identity.samples, 1)
+
+    def test_search_pacing(self):
+        identity = TrackIdentity(search_interval=0.5)
+        self.assertFalse(identity.due(0.0))
+        identity.add(face([1, 0], track_id=1), 0.0)
+        self.assertTrue(identity.due(0.0))
+        identity.searched(0.0)
+        self.assertFalse(identity.due(0.1))
+        identity.add(face([1, 0], track_id=1), 0.2)
+        self.assertFalse(identity.due(0.3))
+        self.assertTrue(identity.due(0.5))
+
+    def test_top_matches(self):
+        embeddings = np.eye(5, dtype=np.float32)
+        ids, sims = top_matches(embeddings, np.array([0.1, 0.9, 0, 0.5, 0], dtype=np.float32), k=3)
+        self.assertEqual(ids.tolist(), [1, 3, 0])
+        np.testing.assert_allclose(sims, [0.9, 0.5, 0.1])
+
+
+if __name__ == '__main__':
+    unittest.main()
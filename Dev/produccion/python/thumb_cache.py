@@ -0,0 +1,81 @@
+"""
+LRU cache of the match photos shown in the kiosk result panel.
+
+The result canvas used to cv2.imread + cv2.resize the four displayed matches
+on every frame (init.py) or on every panel refresh (step4_webcam_search.py),
+decoding the same JPEGs again and again. ThumbCache keeps up to `capacity`
+photos already decoded and resized to the panel cell, keyed by gallery index,
+and can decode the next candidates in a background thread so they are ready
+when the displayed set changes.
+
+    thumbs = ThumbCache()
+    thumbs.prefetch([(idx, entry['original_path']) for idx, entry in candidates])
+    img = thumbs.get(idx, entry['original_path'])     # (330, 280, 3) or None
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+
+CELL_SIZE = (280, 330)   # (width, height) of a panel cell
+
+
+class ThumbCache:
+    def __init__(self, size=CELL_SIZE, capacity=64, prefetch_workers=1):
+        self.size = size
+        self.capacity = capacity
+        self.items = OrderedDict()
+        self.pending = set()
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=prefetch_workers, thread_name_prefix='thumbs') \
+            if prefetch_workers else None
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self, path):
+        img = cv2.imread(path)
+        return cv2.resize(img, self.size) if img is not None else None
+
+    def _store(self, index, img):
+        with self.lock:
+            self.items[index] = img
+            self.items.move_to_end(index)
+            while len(self.items) > self.capacity:
+                self.items.popitem(last=False)
+
+    def get(self, index, path):
+        """Photo `index` resized to the cell; decoded now if it is not cached. None if unreadable."""
+        with self.lock:
+            if index in self.items:
+                self.items.move_to_end(index)
+                self.hits += 1
+                return self.items[index]
+            self.misses += 1
+        img = self._load(path)
+        # Unreadable photos are cached too (as None), so they are not retried every frame
+        self._store(index, img)
+        return img
+
+    def prefetch(self, items):
+        """Decodes the (index, path) not cached yet in the background."""
+        if self.pool is None:
+            return
+        with self.lock:
+            todo = [(i, p) for i, p in items if i not in self.items and i not in self.pending]
+            self.pending.update(i for i, _ in todo)
+        for index, path in todo:
+            self.pool.submit(self._prefetch_one, index, path)
+
+    def _prefetch_one(self, index, path):
+        try:
+            self._store(index, self._load(path))
+        finally:
+            with self.lock:
+                self.pending.discard(index)
+
+    def stats(self):
+        return {'cached': len(self.items), 'hits': self.hits, 'misses': self.misses}
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False)
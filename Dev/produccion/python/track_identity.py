@@ -0,0 +1,89 @@
+"""
+Track-level identity for the live search (init.py, step4_webcam_search.py).
+
+The loops used to search the whole gallery on every frame and vote with
+Counter over the last 15 argmax ids. Here the embeddings of one track (one
+visitor, see face_tracker.py) are averaged, weighted by how good each sample
+is, and the gallery is searched with that mean at most every
+`search_interval` seconds, and only when a new sample arrived. Averaging
+normalized embeddings cancels per-frame noise (blur, pose, lighting), so the
+top matches are steadier than the vote, for a fraction of the searches.
+
+    identity = TrackIdentity()
+    if identity.add(face, now) and identity.due(now):
+        query = identity.embedding()          # normalized mean
+        ...search...
+        identity.searched(now)
+"""
+import numpy as np
+
+# Side (px) from which a face counts as full quality; smaller faces weigh less
+FULL_QUALITY_SIDE = 112
+
+
+def sample_quality(face):
+    """Weight of one embedding: detector confidence × size of the face."""
+    w, h = face.bbox[2] - face.bbox[0], face.bbox[3] - face.bbox[1]
+    size = float(np.clip(min(w, h) / FULL_QUALITY_SIDE, 0.2, 1.0))
+    score = face.det_score if face.det_score is not None else 1.0
+    return float(score) * size
+
+
+class TrackIdentity:
+    def __init__(self, search_interval=0.5, max_gap=0.5):
+        self.search_interval = search_interval
+        self.max_gap = max_gap
+        self.reset(None)
+
+    def reset(self, track_id):
+        self.track_id = track_id
+        self.total = None
+        self.weight = 0.0
+        self.samples = 0
+        self.last_seen = 0.0
+        self.last_search = None
+        self.pending = False
+
+    def add(self, face, now):
+        """
+        Adds the embedding of `face` if it is a new one. A different track id
+        (or, without a tracker, a gap longer than max_gap) starts a new
+        identity. Returns True when a sample was added.
+        """
+        track_id = face.get('track_id')
+        if track_id != self.track_id or now - self.last_seen > self.max_gap:
+            self.reset(track_id)
+        self.last_seen = now
+        # The tracker marks frames where the embedding was computed; app.get faces always are
+        if self.samples and not face.get('embedded', True):
+            return False
+        weight = sample_quality(face)
+        sample = np.asarray(face.normed_embedding, dtype=np.float32) * weight
+        self.total = sample if self.total is None else self.total + sample
+        self.weight += weight
+        self.samples += 1
+        self.pending = True
+        return True
+
+    def due(self, now):
+        """A search is worth it: new samples and the interval elapsed (or never searched)."""
+        if not self.pending:
+            return False
+        return self.last_search is None or now - self.last_search >= self.search_interval
+
+    def embedding(self):
+        norm = np.linalg.norm(self.total)
+        return self.total / norm if norm > 0 else self.total
+
+    def searched(self, now):
+        self.last_search = now
+        self.pending = False
+
+
+def top_matches(embeddings, query, k=4):
+    """(indices, similarities) of the k most similar rows, best first."""
+    sims = embeddings @ query
+    k = min(k, len(sims))
+    top = np.argpartition(sims, -k)[-k:]
+    top = top[np.argsort(sims[top])[::-1]]
+    return top, sims[top]
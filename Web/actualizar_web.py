@@ -4,21 +4,35 @@ Pipeline completo: scrape → crop → index → deploy
 
 Ejecutar diariamente (Task Scheduler / cron):
     python actualizar_web.py
+    python actualizar_web.py --subprocess    # cada paso en su propio proceso
+    python actualizar_web.py --dry-run       # qué pasos correrían y por qué
+    python actualizar_web.py --force         # correr todo aunque nada cambie
+    python actualizar_web.py --full-publish  # re-publicar todas las imágenes y miniaturas
+
+Los pasos corren en este mismo proceso como funciones (el modelo de InsightFace
+se carga una sola vez) y cada uno deja items/segundos/errores en update_log.json.
+Los pasos forman un grafo (ver build_tasks): uno cuyas entradas no cambiaron
+desde la última ejecución exitosa se salta.
 
 Pasos:
     1. Descargar boletines nuevos de COBUPEM
     2. Recortar fotos faciales con InsightFace
-    3. Copiar imágenes al backend estático
+    3. Publicar imágenes en el backend estático (hardlinks, sólo lo nuevo)
     4. Re-indexar la base de datos de embeddings faciales
-    5. Reiniciar el backend (para recargar la DB)
+    5. El backend detecta la nueva face_meta.json y recarga la DB solo
 """
 import os
 import sys
+import time
+import argparse
+import importlib
 import subprocess
 import shutil
 import glob
 import json
+import hashlib
 from datetime import datetime
+from publish_static import MANIFEST_NAME, publish, published_totals
 
 # ── Rutas ──────────────────────────────────────────────────────────
 ROOT       = os.path.dirname(os.path.abspath(__file__))
@@ -30,13 +44,27 @@ PYTHON_DIR = os.path.join(DEV_DIR, 'python')
 RNPDNO_DIR = os.path.join(DEV_DIR, 'rnpdno')
 
 BACKEND_DIR    = os.path.join(WEB_DIR, 'backend')
-STATIC_FOTOS   = os.path.join(BACKEND_DIR, 'static', 'fotos_recortadas')
-STATIC_BOLS    = os.path.join(BACKEND_DIR, 'static', 'boletines')
-DB_FILE        = os.path.join(BACKEND_DIR, 'face_database.pkl')
+STATIC_DIR     = os.path.join(BACKEND_DIR, 'static')
+DB_META        = os.path.join(BACKEND_DIR, 'face_meta.json')
 
 YEARS = ['2020', '2021', '2022', '2023', '2024', '2025', '2026']
 
 LOG_FILE = os.path.join(ROOT, 'update_log.json')
+PUBLISH_MANIFEST = os.path.join(ROOT, MANIFEST_NAME)
+
+# Procesos para recortar boletines (0 = uno por núcleo)
+CROP_WORKERS = int(os.environ.get('CROP_WORKERS', '0'))
+
+# Presupuesto del re-indexado, por debajo del timeout de run_script
+INDEX_BUDGET_S = 540
+
+# 'inprocess': los pasos se importan como funciones (un solo proceso, modelo
+# cargado una vez, estadísticas por paso). 'subprocess': cada script en su
+# propio proceso, como respaldo si un paso necesita aislamiento.
+PIPELINE_MODE = os.environ.get('PIPELINE_MODE', 'inprocess')
+
+# --full-publish: re-publicar todas las imágenes aunque no hayan cambiado
+PUBLISH_FULL = False
 
 
 def log(msg):
@@ -44,7 +72,7 @@ def log(msg):
     print(f'[{ts}] {msg}')
 
 
-def run_script(script_path, cwd=None):
+def run_script(script_path, cwd=None, args=(), timeout=600):
     """Ejecuta un script Python y retorna True si tuvo éxito."""
     if not os.path.exists(script_path):
         log(f'  ⚠ Script no encontrado: {script_path}')
@@ -52,11 +80,11 @@ def run_script(script_path, cwd=None):
     cwd = cwd or os.path.dirname(script_path)
     log(f'  → Ejecutando {os.path.basename(script_path)}...')
     result = subprocess.run(
-        [sys.executable, script_path],
+        [sys.executable, script_path, *args],
         cwd=cwd,
         capture_output=True,
         text=True,
-        timeout=600  # 10 min max
+        timeout=timeout  # 10 min max por defecto
     )
     if result.returncode != 0:
         log(f'  ✗ Error: {result.stderr[:500]}')
@@ -68,77 +96,341 @@ def run_script(script_path, cwd=None):
     return True
 
 
+def script_stage(script_path, args=()):
+    """Paso en modo subprocess: sólo se sabe si terminó bien y cuánto tardó."""
+    t0 = time.perf_counter()
+    try:
+        ok = run_script(script_path, args=args)
+        errors = [] if ok else [f'{os.path.basename(script_path)} falló']
+    except subprocess.TimeoutExpired as e:
+        ok, errors = False, [f'timeout tras {e.timeout}s']
+        log(f'  ✗ {errors[0]}')
+    return {'ok': ok, 'items': None, 'failed': len(errors), 'errors': errors,
+            'seconds': round(time.perf_counter() - t0, 2)}
+
+
+def import_stage(directory, module):
+    """Importa un script del pipeline como módulo."""
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    return importlib.import_module(module)
+
+
+def run_stage(fn, *args, **kwargs):
+    """
+    Corre un paso en este proceso. Cada paso retorna un dict con al menos
+    items/failed/errors; aquí se agregan 'seconds' y 'ok'.
+    """
+    t0 = time.perf_counter()
+    try:
+        stats = fn(*args, **kwargs)
+    except Exception as e:
+        log(f'  ✗ Error: {type(e).__name__}: {e}')
+        stats = {'items': 0, 'failed': 1, 'errors': [f'{type(e).__name__}: {e}']}
+    stats['seconds'] = round(time.perf_counter() - t0, 2)
+    # Falla el paso si hubo errores y no avanzó nada
+    stats['ok'] = not (stats.get('failed') and not stats.get('items'))
+    # En update_log.json basta con los primeros errores
+    stats['errors'] = stats.get('errors', [])[:20]
+    return stats
+
+
+_face_app = None
+
+
+def shared_face_app():
+    """FaceAnalysis (buffalo_l) cargado una sola vez para todos los pasos que lo usan."""
+    global _face_app
+    if _face_app is None:
+        log('  → Cargando modelos de InsightFace...')
+        _face_app = import_stage(PYTHON_DIR, 'step3_index_faces').create_face_app()
+    return _face_app
+
+
 def step1_download_bulletins():
     """Paso 1: Descargar boletines nuevos de COBUPEM."""
     log('═══ PASO 1: Descargar boletines de COBUPEM ═══')
-    script = os.path.join(FCAES_DIR, 'step1_download.py')
-    return run_script(script)
+    if PIPELINE_MODE == 'subprocess':
+        return script_stage(os.path.join(FCAES_DIR, 'step1_download.py'))
+    step1 = import_stage(FCAES_DIR, 'step1_download')
+    return run_stage(step1.download_new)
 
 
 def step2_crop_faces():
     """Paso 2: Recortar fotos faciales de los boletines."""
     log('═══ PASO 2: Recortar fotos faciales ═══')
-    script = os.path.join(FCAES_DIR, 'step2_fine_crop.py')
-    return run_script(script)
+    if PIPELINE_MODE == 'subprocess':
+        return script_stage(os.path.join(FCAES_DIR, 'step2_fine_crop.py'),
+                            args=['--workers', str(CROP_WORKERS)])
+    step2 = import_stage(FCAES_DIR, 'step2_fine_crop')
+    # Pool de procesos para los recortes; el resumen trae img/s y fallos
+    return run_stage(step2.crop_all, workers=CROP_WORKERS)
 
 
 def step3_copy_images():
-    """Paso 3: Copiar imágenes nuevas al backend estático."""
-    log('═══ PASO 3: Copiar imágenes al backend ═══')
-    os.makedirs(STATIC_FOTOS, exist_ok=True)
-    os.makedirs(STATIC_BOLS, exist_ok=True)
-    
-    total_fotos = 0
-    total_bols = 0
-    
+    """Paso 3: Publicar imágenes nuevas en el backend estático (ver publish_static.py)."""
+    log('═══ PASO 3: Publicar imágenes en el backend ═══')
+    return run_stage(publish_images, full=PUBLISH_FULL)
+
+
+def publish_images(full=False):
+    sources = []
     for year in YEARS:
-        # Fotos recortadas
-        src_fotos = os.path.join(FCAES_DIR, year, 'fotos_recortadas')
-        if os.path.exists(src_fotos):
-            for f in glob.glob(os.path.join(src_fotos, '*.jpg')):
-                dest = os.path.join(STATIC_FOTOS, f'{year}_{os.path.basename(f)}')
-                if not os.path.exists(dest):
-                    shutil.copy2(f, dest)
-                    total_fotos += 1
-        
-        # Boletines completos
-        src_bols = os.path.join(FCAES_DIR, year, 'boletines_completos')
-        if os.path.exists(src_bols):
-            for f in glob.glob(os.path.join(src_bols, '*.jpg')):
-                dest = os.path.join(STATIC_BOLS, f'{year}_{os.path.basename(f)}')
-                if not os.path.exists(dest):
-                    shutil.copy2(f, dest)
-                    total_bols += 1
-    
-    log(f'  Fotos nuevas: {total_fotos}')
-    log(f'  Boletines nuevos: {total_bols}')
+        sources.append((os.path.join(FCAES_DIR, year, 'fotos_recortadas'), 'fotos_recortadas', f'{year}_'))
+        sources.append((os.path.join(FCAES_DIR, year, 'boletines_completos'), 'boletines', f'{year}_'))
+    stats = publish(sources, STATIC_DIR, PUBLISH_MANIFEST, full=full)
+    log(f'  Fotos nuevas: {stats["new"].get("fotos_recortadas", 0)}')
+    log(f'  Boletines nuevos: {stats["new"].get("boletines", 0)}')
+    log(f'  Miniaturas generadas: {stats["thumbs"]}')
+    log(f'  Carpetas revisadas: {stats["scanned_dirs"]}, retirados: {stats["removed"]}, '
+        f'link/reflink/copia: {stats["how"]["link"]}/{stats["how"]["reflink"]}/{stats["how"]["copy"]}')
+    return stats
+
+
+def db_size_mb(store_dir):
+    """Tamaño en MB de la base binaria (face_meta.json + arrays .npy que referencia)."""
+    meta_path = os.path.join(store_dir, 'face_meta.json')
+    if not os.path.exists(meta_path):
+        return 0
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    files = [meta_path] + [os.path.join(store_dir, name) for name in meta['arrays'].values()]
+    return sum(os.path.getsize(p) for p in files if os.path.exists(p)) / (1024 * 1024)
+
+
+def copy_face_store(src_dir, dst_dir):
+    """Copia la base binaria: primero los arrays versionados, al final face_meta.json."""
+    src_meta = os.path.join(src_dir, 'face_meta.json')
+    if not os.path.exists(src_meta):
+        return False
+    with open(src_meta, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    for name in meta['arrays'].values():
+        dest = os.path.join(dst_dir, name)
+        if not os.path.exists(dest):
+            shutil.copy2(os.path.join(src_dir, name), dest)
+    tmp = os.path.join(dst_dir, 'face_meta.json.tmp')
+    shutil.copy2(src_meta, tmp)
+    os.replace(tmp, os.path.join(dst_dir, 'face_meta.json'))
+    # Limpiar versiones anteriores (en Windows falla si el backend aún las tiene abiertas)
+    keep = set(meta['arrays'].values())
+    for name in os.listdir(dst_dir):
+        if name.startswith('face_') and name.endswith('.npy') and name not in keep:
+            try:
+                os.remove(os.path.join(dst_dir, name))
+            except OSError:
+                pass
     return True
 
 
 def step4_reindex():
     """Paso 4: Re-indexar embeddings faciales."""
     log('═══ PASO 4: Re-indexar base de datos facial ═══')
-    script = os.path.join(PYTHON_DIR, 'step3_index_faces.py')
-    success = run_script(script)
-    
-    if success:
+    # El indexador guarda checkpoints y se detiene solo al agotar el presupuesto;
+    # si no termina hoy, la próxima ejecución retoma donde se quedó.
+    if PIPELINE_MODE == 'subprocess':
+        stats = script_stage(os.path.join(PYTHON_DIR, 'step3_index_faces.py'),
+                             args=['--max-seconds', str(INDEX_BUDGET_S)])
+        # El script borra su checkpoint sólo al terminar todo
+        stats['complete'] = not os.path.isdir(os.path.join(PYTHON_DIR, 'index_checkpoint'))
+    else:
+        step3 = import_stage(PYTHON_DIR, 'step3_index_faces')
+        stats = run_stage(step3.index_faces, max_seconds=INDEX_BUDGET_S, get_app=shared_face_app)
+
+    if stats['ok']:
         # Copiar la DB generada al backend
-        src_db = os.path.join(PYTHON_DIR, 'face_database.pkl')
-        if os.path.exists(src_db):
-            shutil.copy2(src_db, DB_FILE)
-            size_mb = os.path.getsize(DB_FILE) / (1024 * 1024)
-            log(f'  DB copiada: {size_mb:.1f} MB')
-    return success
+        if copy_face_store(PYTHON_DIR, BACKEND_DIR):
+            log(f'  DB copiada: {db_size_mb(BACKEND_DIR):.1f} MB')
+    return stats
+
+
+# ── Grafo de tareas ────────────────────────────────────────────────
+# Cada paso declara de qué pasos depende y qué rutas lee/escribe. Antes de
+# correrlo se calcula una huella (tamaño y mtime de los archivos) de esas
+# rutas; si coincide con la que quedó al terminar la última ejecución exitosa,
+# el paso se salta. Los pasos sin entradas locales (la descarga) siempre corren.
+
+STATE_FILE = os.path.join(ROOT, 'pipeline_state.json')
+
+
+def year_dirs(sub):
+    return lambda: sorted(glob.glob(os.path.join(FCAES_DIR, '[0-9]*', sub)))
 
 
-def save_log(results):
+def paths(*items):
+    return lambda: list(items)
+
+
+def paths_fingerprint(path_list):
+    """Huella de archivos y directorios (un nivel): nombre, tamaño y mtime de cada entrada."""
+    h = hashlib.sha1()
+    for path in sorted(path_list):
+        h.update(path.encode('utf-8', 'surrogateescape'))
+        if os.path.isdir(path):
+            with os.scandir(path) as it:
+                for entry in sorted(it, key=lambda e: e.name):
+                    st = entry.stat()
+                    h.update(f'{entry.name}\0{st.st_size}\0{st.st_mtime_ns}\n'.encode('utf-8', 'surrogateescape'))
+        elif os.path.exists(path):
+            st = os.stat(path)
+            h.update(f'file\0{st.st_size}\0{st.st_mtime_ns}\n'.encode())
+        else:
+            h.update(b'missing\n')
+    return h.hexdigest()
+
+
+class Task:
+    def __init__(self, name, run, deps=(), inputs=None, outputs=None):
+        self.name    = name
+        self.run     = run
+        self.deps    = list(deps)
+        self.inputs  = inputs
+        self.outputs = outputs
+
+    def fingerprint(self):
+        """None si el paso depende de algo externo (siempre corre)."""
+        if self.inputs is None:
+            return None
+        return paths_fingerprint(self.inputs() + (self.outputs() if self.outputs else []))
+
+
+def build_tasks():
+    boletines = year_dirs('boletines_completos')
+    fotos     = year_dirs('fotos_recortadas')
+    checkpoint = os.path.join(PYTHON_DIR, 'index_checkpoint')
+    return [
+        Task('download', step1_download_bulletins),
+        Task('crop',     step2_crop_faces,   deps=['download'],
+             inputs=boletines, outputs=fotos),
+        Task('copy',     step3_copy_images,  deps=['download', 'crop'],
+             inputs=lambda: boletines() + fotos(), outputs=paths(PUBLISH_MANIFEST)),
+        # Un checkpoint pendiente cambia la huella: el re-indexado retoma aunque no haya fotos nuevas
+        Task('reindex',  step4_reindex,      deps=['crop'],
+             inputs=lambda: fotos() + [checkpoint], outputs=paths(DB_META)),
+    ]
+
+
+def topo_order(tasks):
+    """Orden topológico (Kahn) respetando el orden de declaración entre pasos independientes."""
+    by_name = {t.name: t for t in tasks}
+    pending = {t.name: set(t.deps) for t in tasks}
+    for name, deps in pending.items():
+        unknown = deps - set(by_name)
+        if unknown:
+            raise ValueError(f'{name} depende de pasos inexistentes: {sorted(unknown)}')
+    order = []
+    while pending:
+        ready = [t.name for t in tasks if t.name in pending and not pending[t.name]]
+        if not ready:
+            raise ValueError(f'Ciclo en el grafo de pasos: {sorted(pending)}')
+        for name in ready:
+            order.append(by_name[name])
+            del pending[name]
+            for deps in pending.values():
+                deps.discard(name)
+    return order
+
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    try:
+        with open(STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    tmp = STATE_FILE + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp, STATE_FILE)
+
+
+def run_pipeline(tasks, dry_run=False, force=False, force_tasks=()):
+    """
+    Corre los pasos en orden topológico saltando los que no cambiaron
+    (salvo con `force`, o los nombrados en `force_tasks`).
+    Un paso cuyo prerequisito falló en esta misma ejecución no corre.
+    Retorna (results, timings): stats de cada paso que corrió y una fila
+    {step, status, seconds} por paso (ran / failed / skipped / blocked;
+    en dry-run would-run / maybe).
+    """
+    state = load_state()
+    results, timings = {}, []
+    # Pasos que fallaron o quedaron bloqueados: sus dependientes no corren
+    broken = set()
+    # En dry-run no se sabe qué producirán los pasos previos: sus dependientes quedan como 'maybe'
+    would_run = set()
+
+    for task in topo_order(tasks):
+        fingerprint = task.fingerprint()
+        changed = force or task.name in force_tasks or fingerprint is None or state.get(task.name) != fingerprint
+        if dry_run:
+            upstream = [dep for dep in task.deps if dep in would_run]
+            if changed:
+                would_run.add(task.name)
+                status = 'would-run'
+                reason = 'siempre, entrada externa' if fingerprint is None else 'entradas cambiaron'
+                log(f'  → correría  {task.name:<8} ({reason})')
+            elif upstream:
+                would_run.add(task.name)
+                status = 'maybe'
+                log(f'  ? depende   {task.name:<8} (sin cambios hoy; corre si {", ".join(upstream)} produce algo)')
+            else:
+                status = 'skipped'
+                log(f'  · saltaría  {task.name:<8} (sin cambios)')
+            timings.append({'step': task.name, 'status': status, 'seconds': 0.0})
+            continue
+
+        blocked_by = [dep for dep in task.deps if dep in broken]
+        if blocked_by:
+            log(f'═══ {task.name}: bloqueado, falló {", ".join(blocked_by)} ═══')
+            broken.add(task.name)
+            timings.append({'step': task.name, 'status': 'blocked', 'seconds': 0.0})
+            continue
+
+        if not changed:
+            log(f'═══ {task.name}: sin cambios en sus entradas, se salta ═══')
+            timings.append({'step': task.name, 'status': 'skipped', 'seconds': 0.0})
+            continue
+
+        stats = task.run()
+        results[task.name] = stats
+        timings.append({'step': task.name, 'status': 'ran' if stats['ok'] else 'failed',
+                        'seconds': stats['seconds']})
+        if not stats['ok']:
+            broken.add(task.name)
+        # La huella se guarda sólo si el paso terminó completo y sin errores: un
+        # re-indexado parcial o fotos que fallaron deben reintentarse mañana
+        if stats['ok'] and not stats.get('failed') and stats.get('complete', True) and fingerprint is not None:
+            state[task.name] = task.fingerprint()
+            save_state(state)
+        elif task.name in state:
+            del state[task.name]
+            save_state(state)
+
+    return results, timings
+
+
+def print_timings(timings):
+    log('  paso      estado      segundos')
+    for row in timings:
+        log(f'  {row["step"]:<9} {row["status"]:<10} {row["seconds"]:>8.1f}')
+    log(f'  {"total":<9} {"":<10} {sum(r["seconds"] for r in timings):>8.1f}')
+
+
+def save_log(results, timings=None):
     """Guarda un log de la última actualización."""
+    totals = published_totals(PUBLISH_MANIFEST)
     entry = {
         'timestamp': datetime.now().isoformat(),
         'steps': results,
-        'fotos_total': len(glob.glob(os.path.join(STATIC_FOTOS, '*.jpg'))),
-        'boletines_total': len(glob.glob(os.path.join(STATIC_BOLS, '*.jpg'))),
-        'db_size_mb': round(os.path.getsize(DB_FILE) / (1024*1024), 1) if os.path.exists(DB_FILE) else 0,
+        'timings': timings or [],
+        'fotos_total': totals.get('fotos_recortadas', 0),
+        'boletines_total': totals.get('boletines', 0),
+        'db_size_mb': round(db_size_mb(BACKEND_DIR), 1),
     }
     
     history = []
@@ -157,44 +449,54 @@ def save_log(results):
 
 
 def main():
+    global PIPELINE_MODE, PUBLISH_FULL
+    parser = argparse.ArgumentParser(description='Actualización diaria de Mil Ojos')
+    parser.add_argument('--subprocess', action='store_true',
+                        help='Correr cada paso en un proceso aparte (respaldo, sin estadísticas por paso)')
+    parser.add_argument('--dry-run', action='store_true', help='Mostrar qué pasos correrían, sin ejecutar nada')
+    parser.add_argument('--force', action='store_true', help='Correr todos los pasos aunque no haya cambios')
+    parser.add_argument('--full-publish', action='store_true',
+                        help='Volver a publicar todas las imágenes y regenerar sus miniaturas')
+    args = parser.parse_args()
+    if args.subprocess:
+        PIPELINE_MODE = 'subprocess'
+    PUBLISH_FULL = args.full_publish
+    force_tasks = {'copy'} if args.full_publish else set()
+
     print()
     log('╔══════════════════════════════════════════════╗')
     log('║  MIL OJOS — Actualización diaria            ║')
     log('╚══════════════════════════════════════════════╝')
     print()
     
-    results = {}
-    
-    # Paso 1: Descargar
-    results['download'] = step1_download_bulletins()
-    
-    # Paso 2: Recortar
-    results['crop'] = step2_crop_faces()
-    
-    # Paso 3: Copiar al backend
-    results['copy'] = step3_copy_images()
-    
-    # Paso 4: Re-indexar
-    results['reindex'] = step4_reindex()
+    tasks = build_tasks()
+    if args.dry_run:
+        log('═══ DRY RUN: nada se ejecuta ═══')
+        run_pipeline(tasks, dry_run=True, force=args.force, force_tasks=force_tasks)
+        return
+
+    results, timings = run_pipeline(tasks, force=args.force, force_tasks=force_tasks)
     
     # Resumen
     print()
     log('═══ RESUMEN ═══')
-    for step, ok in results.items():
-        status = '✓' if ok else '✗'
-        log(f'  {status} {step}')
+    for step, stats in results.items():
+        status = '✓' if stats['ok'] else '✗'
+        items = '-' if stats.get('items') is None else stats['items']
+        log(f'  {status} {step:<8} {items:>6} items  {stats["seconds"]:>7.1f}s  '
+            f'{stats.get("failed", 0)} errores')
+    print()
+    print_timings(timings)
     
-    fotos = len(glob.glob(os.path.join(STATIC_FOTOS, '*.jpg')))
-    bols  = len(glob.glob(os.path.join(STATIC_BOLS, '*.jpg')))
-    log(f'  Fotos totales: {fotos}')
-    log(f'  Boletines totales: {bols}')
+    totals = published_totals(PUBLISH_MANIFEST)
+    log(f'  Fotos totales: {totals.get("fotos_recortadas", 0)}')
+    log(f'  Boletines totales: {totals.get("boletines", 0)}')
     
-    save_log(results)
+    save_log(results, timings)
     
     print()
     log('Actualización completada.')
-    log('Reinicia el backend para cargar la nueva DB:')
-    log('  python -m uvicorn main:app --host 0.0.0.0 --port 8000')
+    log('El backend recarga la nueva DB en caliente (ver GET /admin/db).')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,203 @@
+"""
+face_db.py — Base de rostros en memoria + recarga en caliente
+
+FaceDB es una foto fija de una versión de la base: fichas, matriz de embeddings
+(memmap), índice vectorial y cajas de rostro. Nunca se modifica; cuando aparece
+una versión nueva se construye otra FaceDB completa en segundo plano y se
+reemplaza la referencia global de una sola vez. Cada request toma la referencia
+al empezar, así que nunca mezcla fichas de una versión con scores de otra.
+
+DBWatcher revisa cada DB_RELOAD_INTERVAL segundos si face_meta.json cambió
+(actualizar_web.py lo escribe al final, de forma atómica) y dispara la recarga.
+También vigila la carpeta de miniaturas: si publish_static.py agrega o borra
+variantes sin que cambie la versión, se recarga para que las fichas las vean.
+"""
+import os
+import time
+import threading
+from datetime import datetime
+from face_index import load_index
+from face_store import META_FILE, has_store, load_meta, load_store, legacy_to_store
+
+RELOAD_INTERVAL = float(os.environ.get("DB_RELOAD_INTERVAL", "30"))
+
+
+class FaceDB:
+    def __init__(self, database, matrix, index, face_boxes, meta):
+        self.database   = database
+        self.matrix     = matrix
+        self.index      = index
+        self.face_boxes = face_boxes
+        self.meta       = meta
+        self.version    = meta["version"]
+        self.loaded_at  = datetime.now().isoformat()
+        # Caché de detección lazy (sólo bases legacy sin face_box); muere con la versión
+        self.bbox_cache: dict[int, dict | None] = {}
+
+    def __len__(self):
+        return len(self.database)
+
+    def info(self):
+        return {
+            "version":   self.version,
+            "created":   self.meta.get("created"),
+            "loaded_at": self.loaded_at,
+            "personas":  len(self.database),
+            "index":     self.index.kind,
+            "face_box":  self.face_boxes is not None,
+        }
+
+
+def thumbs_dir(static_dir):
+    return os.path.join(static_dir, "thumbs", "fotos_recortadas")
+
+
+def available_thumbs(static_dir):
+    """Nombres de las miniaturas de fotos_recortadas que generó publish_static.py."""
+    if not static_dir:
+        return set()
+    try:
+        return set(os.listdir(thumbs_dir(static_dir)))
+    except OSError:
+        return set()
+
+
+def build_fichas(columns, thumbs=frozenset()):
+    """
+    Fichas públicas a partir de las columnas name/year de la base. `thumb` apunta
+    a la miniatura JPEG (o a la foto completa si no existe); `thumb_webp` y
+    `thumb_avif` sólo vienen si se generaron esas variantes.
+    """
+    database = []
+    for i, (raw_name, year) in enumerate(zip(columns["name"], columns["year"])):
+        # raw_name ej. "AARON ADALID ESCOBEDO CONDE.jpg"
+        name = os.path.splitext(raw_name)[0]   # quitar .jpg
+        year = str(year)
+
+        # En disco:
+        #  fotos_recortadas/        → YEAR_foto_NOMBRE.jpg  (tiene prefijo foto_)
+        #  boletines/               → YEAR_NOMBRE.jpg        (sin prefijo)
+        #  thumbs/fotos_recortadas/ → YEAR_foto_NOMBRE.{jpg,webp,avif}
+        foto  = f"/static/fotos_recortadas/{year}_foto_{raw_name}"
+        thumb = f"{year}_foto_{name}"
+        database.append({
+            "id":         i,
+            "name":       name,
+            "year":       year,
+            "foto":       foto,
+            "boletin":    f"/static/boletines/{year}_{raw_name}",
+            "thumb":      f"/static/thumbs/fotos_recortadas/{thumb}.jpg" if f"{thumb}.jpg" in thumbs else foto,
+            "thumb_webp": f"/static/thumbs/fotos_recortadas/{thumb}.webp" if f"{thumb}.webp" in thumbs else None,
+            "thumb_avif": f"/static/thumbs/fotos_recortadas/{thumb}.avif" if f"{thumb}.avif" in thumbs else None,
+        })
+    return database
+
+
+def load_face_db(db_dir, legacy_file, index_kind, ivf_file, static_dir=None):
+    """Carga face_meta.json de `db_dir` (o el pickle legacy) y construye su índice."""
+    if has_store(db_dir):
+        # Embeddings mapeados en memoria: no se copian a RAM hasta que se leen
+        arrays, columns, meta = load_store(db_dir)
+    else:
+        print("Aviso: no hay face_meta.json, importando face_database.pkl (legacy)...")
+        arrays, columns = legacy_to_store(legacy_file)
+        meta = {"version": "legacy"}
+
+    matrix = arrays["embeddings"]
+    index  = load_index(matrix, index_kind, ivf_file, meta["version"])
+    fichas = build_fichas(columns, available_thumbs(static_dir))
+    return FaceDB(fichas, matrix, index, arrays.get("face_box"), meta)
+
+
+def store_signature(db_dir):
+    """(mtime, tamaño) de face_meta.json, o None si todavía no existe."""
+    try:
+        st = os.stat(os.path.join(db_dir, META_FILE))
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def thumbs_signature(static_dir):
+    """mtime de la carpeta de miniaturas: cambia cuando se crea o borra una variante."""
+    if not static_dir:
+        return None
+    try:
+        return os.stat(thumbs_dir(static_dir)).st_mtime_ns
+    except OSError:
+        return None
+
+
+class DBWatcher:
+    """Hilo que detecta versiones nuevas de la base y llama `on_swap(nueva_db)`."""
+
+    def __init__(self, db_dir, load, get_current, on_swap, interval=RELOAD_INTERVAL, static_dir=None):
+        self.db_dir      = db_dir
+        self.static_dir  = static_dir
+        self.load        = load
+        self.get_current = get_current
+        self.on_swap     = on_swap
+        self.interval    = interval
+        self.signature   = self._signature()
+        self.reloads     = 0
+        self.last_error  = None
+        self.last_check  = None
+        self.wakeup      = threading.Event()
+        self.lock        = threading.Lock()
+        self.thread = threading.Thread(target=self._loop, name="db-watcher", daemon=True)
+
+    def start(self):
+        if self.interval > 0:
+            self.thread.start()
+        return self
+
+    def _loop(self):
+        while True:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            self.check()
+
+    def _signature(self):
+        return store_signature(self.db_dir), thumbs_signature(self.static_dir)
+
+    def request_check(self):
+        self.wakeup.set()
+
+    def check(self, force=False):
+        """
+        Recarga si face_meta.json trae una versión distinta a la activa, o si
+        cambiaron las miniaturas publicadas. Retorna True si cambió.
+        """
+        with self.lock:
+            self.last_check = datetime.now().isoformat()
+            signature = self._signature()
+            if signature[0] is None or (signature == self.signature and not force):
+                return False
+            thumbs_changed = self.signature is None or signature[1] != self.signature[1]
+            self.signature = signature
+            try:
+                version = load_meta(self.db_dir)["version"]
+                if version == self.get_current().version and not thumbs_changed and not force:
+                    return False
+                t0 = time.perf_counter()
+                new_db = self.load()
+                self.on_swap(new_db)
+                self.reloads += 1
+                self.last_error = None
+                print(f"Base recargada: versión {new_db.version}, {len(new_db)} personas "
+                      f"({time.perf_counter() - t0:.1f}s).")
+                return True
+            except Exception as e:
+                # Se reintenta en la próxima revisión; la versión activa sigue sirviendo
+                self.signature = None
+                self.last_error = f"{type(e).__name__}: {e}"
+                print(f"Error recargando la base: {self.last_error}")
+                return False
+
+    def info(self):
+        return {
+            "interval_s": self.interval,
+            "reloads":    self.reloads,
+            "last_check": self.last_check,
+            "last_error": self.last_error,
+        }
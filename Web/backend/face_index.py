@@ -0,0 +1,254 @@
+"""
+face_index.py — Índices vectoriales para la búsqueda de rostros de Mil Ojos
+
+Todos los embeddings de InsightFace vienen normalizados (norma 1), así que la
+similitud coseno es un producto punto. Hay dos backends, seleccionables con la
+variable de entorno FACE_INDEX:
+
+    exact  — producto punto contra toda la matriz + top-k parcial (argpartition)
+    ivf    — índice invertido (k-means esférico): sólo se comparan los vectores
+             de las `nprobe` listas cuyo centroide es más parecido a la consulta
+
+El índice IVF se construye offline y se guarda junto a la base de datos
+(face_meta.json); queda ligado a la versión de la base con la que se construyó:
+
+    python face_index.py --build            # genera face_index_ivf.npz
+    python face_index.py --bench            # recall / latencia vs exact
+"""
+import os
+import sys
+import time
+import hashlib
+import argparse
+import numpy as np
+# face_store.py tiene una sola copia, en Dev/produccion/python; al desplegar se copia junto a este archivo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Dev", "produccion", "python"))
+from face_store import LEGACY_FILE, has_store, load_store, legacy_to_store
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+IVF_FILE = os.path.join(BASE_DIR, "face_index_ivf.npz")
+
+DEFAULT_KIND   = os.environ.get("FACE_INDEX", "exact")
+DEFAULT_NPROBE = int(os.environ.get("FACE_INDEX_NPROBE", "8"))
+
+
+def matrix_fingerprint(matrix, version=""):
+    """
+    Huella de la versión, la forma y una muestra de filas de la matriz: liga un
+    IVF guardado a su contenido, no sólo al número de vectores.
+    """
+    h = hashlib.sha1(f"{version}\0{matrix.shape}\0{matrix.dtype}".encode())
+    if len(matrix):
+        # Hasta 1024 filas repartidas: no hace falta leer toda la matriz del disco
+        rows = np.unique(np.linspace(0, len(matrix) - 1, num=min(len(matrix), 1024)).astype(np.int64))
+        h.update(np.ascontiguousarray(matrix[rows]).tobytes())
+    return h.hexdigest()
+
+
+def top_k(scores, k):
+    """Índices de los k valores más altos de `scores`, ordenados de mayor a menor."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        part = np.argpartition(scores, -k)[-k:]
+    else:
+        part = np.arange(len(scores))
+    return part[np.argsort(scores[part])[::-1]]
+
+
+class FaceIndex:
+    """Interfaz común: `search(query, k)` → (ids, scores) ordenados por score."""
+
+    kind = "base"
+
+    def __init__(self, matrix):
+        self.matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def search(self, query, k):
+        raise NotImplementedError
+
+
+class ExactIndex(FaceIndex):
+    """Fuerza bruta sobre la matriz completa, con top-k parcial en vez de argsort."""
+
+    kind = "exact"
+
+    def search(self, query, k):
+        sims = self.matrix @ np.asarray(query, dtype=np.float32)
+        ids = top_k(sims, k)
+        return ids, sims[ids]
+
+
+class IVFIndex(FaceIndex):
+    """
+    Índice invertido sobre k-means esférico.
+
+    `order` contiene los ids de la matriz agrupados por lista y `offsets[c]:offsets[c+1]`
+    delimita los miembros de la lista `c`, así no se duplica la matriz en memoria.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, matrix, centroids, order, offsets, nprobe=DEFAULT_NPROBE):
+        super().__init__(matrix)
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.order     = np.asarray(order, dtype=np.int64)
+        self.offsets   = np.asarray(offsets, dtype=np.int64)
+        self.nprobe    = max(1, min(nprobe, len(self.centroids)))
+
+    @classmethod
+    def build(cls, matrix, nlist=None, iters=10, seed=0, nprobe=DEFAULT_NPROBE):
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        n = matrix.shape[0]
+        if n == 0:
+            raise ValueError("No se puede construir un índice IVF sobre una base vacía")
+        if nlist is None:
+            nlist = max(1, int(4 * np.sqrt(n)))
+        nlist = max(1, min(nlist, n))
+
+        rng = np.random.default_rng(seed)
+        centroids = matrix[rng.choice(n, nlist, replace=False)].copy()
+
+        for _ in range(iters):
+            assign = np.argmax(matrix @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, matrix)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Las listas vacías conservan su centroide anterior
+            filled = norms[:, 0] > 0
+            centroids[filled] = sums[filled] / norms[filled]
+
+        assign = np.argmax(matrix @ centroids.T, axis=1)
+        order = np.argsort(assign, kind="stable")
+        offsets = np.searchsorted(assign[order], np.arange(nlist + 1))
+        return cls(matrix, centroids, order, offsets, nprobe=nprobe)
+
+    def save(self, path, version=""):
+        np.savez(path, centroids=self.centroids, order=self.order,
+                 offsets=self.offsets, count=np.int64(len(self)), version=np.str_(version),
+                 fingerprint=np.str_(matrix_fingerprint(self.matrix, version)))
+
+    @classmethod
+    def load(cls, path, matrix, version=None, nprobe=DEFAULT_NPROBE):
+        data = np.load(path)
+        if int(data["count"]) != matrix.shape[0]:
+            raise ValueError(f"{os.path.basename(path)} fue construido para {int(data['count'])} "
+                             f"vectores, la base tiene {matrix.shape[0]}")
+        if version is not None and str(data["version"]) != version:
+            raise ValueError(f"{os.path.basename(path)} corresponde a la versión "
+                             f"{str(data['version'])!r} de la base, no a {version!r}")
+        # Misma cantidad de vectores no basta: otra base del mismo tamaño no debe reusar el índice
+        if "fingerprint" not in data or str(data["fingerprint"]) != matrix_fingerprint(matrix, str(data["version"])):
+            raise ValueError(f"{os.path.basename(path)} fue construido sobre otros embeddings")
+        return cls(matrix, data["centroids"], data["order"], data["offsets"], nprobe=nprobe)
+
+    def search(self, query, k):
+        query = np.asarray(query, dtype=np.float32)
+        lists = top_k(self.centroids @ query, self.nprobe)
+        candidates = np.concatenate([self.order[self.offsets[c]:self.offsets[c + 1]] for c in lists])
+        if len(candidates) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        sims = self.matrix[candidates] @ query
+        best = top_k(sims, k)
+        return candidates[best], sims[best]
+
+
+def load_index(matrix, kind=DEFAULT_KIND, ivf_file=IVF_FILE, version=None):
+    """Crea el índice pedido; si no hay un IVF válido en disco lo construye en memoria."""
+    if kind == "exact":
+        return ExactIndex(matrix)
+    if kind == "ivf":
+        if len(matrix) == 0:
+            # Base nueva o vaciada: no hay listas que construir, el exacto responde vacío
+            print("Aviso: base vacía, se usa el índice exacto.")
+            return ExactIndex(matrix)
+        if os.path.exists(ivf_file):
+            try:
+                return IVFIndex.load(ivf_file, matrix, version=version)
+            except ValueError as e:
+                print(f"Aviso: {e}. Reconstruyendo índice IVF en memoria...")
+        return IVFIndex.build(matrix)
+    raise ValueError(f"FACE_INDEX desconocido: {kind!r} (usa 'exact' o 'ivf')")
+
+
+def benchmark(index, matrix, queries, k=8):
+    """Compara `index` contra el backend exacto: recall@k y latencia por consulta."""
+    exact = ExactIndex(matrix)
+    hits, t_exact, t_index = 0, [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        ref, _ = exact.search(q, k)
+        t1 = time.perf_counter()
+        got, _ = index.search(q, k)
+        t2 = time.perf_counter()
+        hits += len(np.intersect1d(ref, got))
+        t_exact.append(t1 - t0)
+        t_index.append(t2 - t1)
+    return {
+        "kind":          index.kind,
+        "queries":       len(queries),
+        "recall":        hits / (k * len(queries)),
+        "exact_p50_ms":  float(np.median(t_exact) * 1000),
+        "index_p50_ms":  float(np.median(t_index) * 1000),
+        "exact_p99_ms":  float(np.percentile(t_exact, 99) * 1000),
+        "index_p99_ms":  float(np.percentile(t_index, 99) * 1000),
+    }
+
+
+def _load_matrix(db_dir):
+    """(matriz, versión) desde face_meta.json, o desde el pickle legacy si no existe."""
+    if has_store(db_dir):
+        arrays, _, meta = load_store(db_dir)
+        return arrays["embeddings"], meta["version"]
+    arrays, _ = legacy_to_store(os.path.join(db_dir, LEGACY_FILE))
+    return arrays["embeddings"], "legacy"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Construye y evalúa el índice vectorial de Mil Ojos")
+    parser.add_argument("--db", default=BASE_DIR, help="Directorio de la base de rostros")
+    parser.add_argument("--out", default=None, help="Archivo del índice IVF (default: junto a la base)")
+    parser.add_argument("--build", action="store_true", help="Construir y guardar el índice IVF")
+    parser.add_argument("--bench", action="store_true", help="Medir recall/latencia contra el índice exacto")
+    parser.add_argument("--nlist", type=int, default=None, help="Número de listas (default 4·√N)")
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE, help="Listas visitadas por consulta")
+    parser.add_argument("--queries", type=int, default=200, help="Consultas para el benchmark")
+    parser.add_argument("-k", type=int, default=8, help="Resultados por consulta")
+    args = parser.parse_args()
+
+    if not (args.build or args.bench):
+        parser.print_help()
+        sys.exit(1)
+
+    matrix, version = _load_matrix(args.db)
+    args.out = args.out or os.path.join(args.db, os.path.basename(IVF_FILE))
+    print(f"Base cargada: {matrix.shape[0]} vectores de {matrix.shape[1]} dimensiones.")
+
+    if args.build:
+        t0 = time.perf_counter()
+        index = IVFIndex.build(matrix, nlist=args.nlist, nprobe=args.nprobe)
+        index.save(args.out, version)
+        print(f"IVF con {len(index.centroids)} listas guardado en {args.out} "
+              f"({time.perf_counter() - t0:.1f}s)")
+    else:
+        index = load_index(matrix, "ivf", args.out, version)
+        index.nprobe = max(1, min(args.nprobe, len(index.centroids)))
+
+    if args.bench:
+        # Consultas = vectores de la propia base con ruido, como una selfie de la misma persona
+        rng = np.random.default_rng(1)
+        sample = matrix[rng.choice(len(matrix), min(args.queries, len(matrix)), replace=False)]
+        noisy = sample + rng.normal(0, 0.03, sample.shape).astype(np.float32)
+        noisy /= np.linalg.norm(noisy, axis=1, keepdims=True)
+        report = benchmark(index, matrix, noisy, k=args.k)
+        print(f"nprobe={index.nprobe}  recall@{args.k}={report['recall']:.3f}")
+        print(f"  exact: p50 {report['exact_p50_ms']:.2f} ms  p99 {report['exact_p99_ms']:.2f} ms")
+        print(f"  ivf:   p50 {report['index_p50_ms']:.2f} ms  p99 {report['index_p99_ms']:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
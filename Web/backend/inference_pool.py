@@ -0,0 +1,122 @@
+"""
+inference_pool.py — Pool acotado para correr InsightFace fuera del event loop
+
+`face_app.get` tarda 300–800 ms de CPU; si se llama directo desde un endpoint
+`async` bloquea todo el servidor (incluido /fichas y /static). InferencePool lo
+manda a un ThreadPoolExecutor (onnxruntime suelta el GIL durante la inferencia)
+con una cola acotada: si ya hay `workers + max_queue` trabajos pendientes,
+`run` lanza PoolSaturated y el endpoint responde 503 con Retry-After.
+
+Cada trabajo mide por separado la espera en cola y el cómputo, para poder
+dimensionar la instancia:
+
+    INFERENCE_WORKERS   hilos de inferencia en paralelo   (default 1)
+    INFERENCE_QUEUE     trabajos que pueden esperar turno  (default 4)
+"""
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+DEFAULT_WORKERS = int(os.environ.get("INFERENCE_WORKERS", "1"))
+DEFAULT_QUEUE   = int(os.environ.get("INFERENCE_QUEUE", "4"))
+
+
+class PoolSaturated(Exception):
+    """La cola está llena; `retry_after` es una estimación en segundos."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Servidor ocupado, reintenta en {retry_after}s")
+        self.retry_after = retry_after
+
+
+class InferencePool:
+    def __init__(self, workers=DEFAULT_WORKERS, max_queue=DEFAULT_QUEUE, window=200):
+        self.workers   = max(1, workers)
+        self.max_queue = max(0, max_queue)
+        self.executor  = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="inferencia")
+        # `pending` baja cuando el trabajo termina en el executor (no cuando el
+        # cliente se va): lo abandonado sigue ocupando su lugar hasta acabar
+        self.pending   = 0
+        self.lock      = threading.Lock()
+        self.completed = 0
+        self.rejected  = 0
+        self.failed    = 0
+        # Errores del cliente (4xx: imagen inválida, sin rostro), aparte de las fallas
+        self.client_errors = 0
+        self.queue_ms   = deque(maxlen=window)
+        self.compute_ms = deque(maxlen=window)
+
+    @property
+    def capacity(self):
+        return self.workers + self.max_queue
+
+    def retry_after(self):
+        """Segundos estimados hasta que se libere un lugar en la cola."""
+        avg_s = (np.mean(self.compute_ms) / 1000) if self.compute_ms else 1.0
+        return max(1, math.ceil(avg_s * self.pending / self.workers))
+
+    async def run(self, fn, *args):
+        """Ejecuta `fn(*args)` en el pool. Retorna (resultado, {"queue_ms", "compute_ms"})."""
+        with self.lock:
+            saturated = self.pending >= self.capacity
+            if not saturated:
+                self.pending += 1
+        if saturated:
+            self.rejected += 1
+            raise PoolSaturated(self.retry_after())
+
+        submitted = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            result = fn(*args)
+            return result, started, time.perf_counter()
+
+        future = self.executor.submit(job)
+        future.add_done_callback(self._release)
+        try:
+            result, started, finished = await asyncio.wrap_future(future)
+        except Exception as e:
+            # HTTPException 4xx trae status_code: es un error del cliente, no del pool
+            if getattr(e, "status_code", 500) < 500:
+                self.client_errors += 1
+            else:
+                self.failed += 1
+            raise
+
+        timing = {
+            "queue_ms":   round((started - submitted) * 1000, 1),
+            "compute_ms": round((finished - started) * 1000, 1),
+        }
+        self.completed += 1
+        self.queue_ms.append(timing["queue_ms"])
+        self.compute_ms.append(timing["compute_ms"])
+        return result, timing
+
+    def _release(self, _future):
+        with self.lock:
+            self.pending -= 1
+
+    def stats(self):
+        def pct(values, q):
+            return round(float(np.percentile(values, q)), 1) if values else None
+
+        return {
+            "workers":   self.workers,
+            "max_queue": self.max_queue,
+            "pending":   self.pending,
+            "completed": self.completed,
+            "rejected":  self.rejected,
+            "failed":    self.failed,
+            "client_errors": self.client_errors,
+            "queue_ms":   {"p50": pct(self.queue_ms, 50),   "p95": pct(self.queue_ms, 95)},
+            "compute_ms": {"p50": pct(self.compute_ms, 50), "p95": pct(self.compute_ms, 95)},
+        }
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
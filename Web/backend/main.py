@@ -1,22 +1,41 @@
 import os
 import io
-import pickle
+import sys
+import time
+import asyncio
+import threading
+from collections import Counter
 import numpy as np
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, UploadFile, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import JSONResponse
 from PIL import Image
 import cv2
 from insightface.app import FaceAnalysis
+from insightface.app.common import Face
+from insightface import model_zoo
+from insightface.utils import face_align
+# face_store.py tiene una sola copia, en Dev/produccion/python; al desplegar se copia junto a este archivo
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Dev", "produccion", "python"))
+from face_store import has_store
+from face_db import FaceDB, DBWatcher, load_face_db
+from inference_pool import InferencePool, PoolSaturated
+from rec_batcher import RecognitionBatcher
 
 # ── Rutas ─────────────────────────────────────────────────────────────────────
 BASE_DIR   = os.path.dirname(os.path.abspath(__file__))
 # En Render, los datos viven en el disco persistente /data/
-# En local, viven en ./static y ./face_database.pkl
+# En local, viven en ./static y ./face_meta.json (+ face_embeddings.*.npy)
 DATA_DIR   = os.environ.get("DATA_DIR", BASE_DIR)
+DB_DIR     = DATA_DIR if has_store(os.environ.get("DATA_DIR", "")) else BASE_DIR
 DB_FILE    = os.path.join(DATA_DIR, "face_database.pkl") if os.path.exists(os.path.join(os.environ.get("DATA_DIR", ""), "face_database.pkl")) else os.path.join(BASE_DIR, "face_database.pkl")
 STATIC_DIR = os.path.join(DATA_DIR, "static") if os.path.isdir(os.path.join(os.environ.get("DATA_DIR", ""), "static")) else os.path.join(BASE_DIR, "static")
+IVF_FILE   = os.path.join(DB_DIR, "face_index_ivf.npz")
+
+# Índice vectorial: "exact" (default) o "ivf" (aproximado, ver face_index.py)
+FACE_INDEX = os.environ.get("FACE_INDEX", "exact")
+TOP_K      = 8
 
 # ── FastAPI ───────────────────────────────────────────────────────────────────
 app = FastAPI(title="Mil Ojos API", version="1.0")
@@ -26,55 +45,231 @@ app.add_middleware(
     allow_origins=["*"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "Server-Timing"],
 )
 
 # ── Cargar DB de embeddings al arrancar ───────────────────────────────────────
+# `face_db` se reemplaza entero cuando DBWatcher detecta una versión nueva;
+# los handlers toman la referencia una sola vez al empezar.
+def load_db() -> FaceDB:
+    return load_face_db(DB_DIR, DB_FILE, FACE_INDEX, IVF_FILE, STATIC_DIR)
+
+
+def swap_db(new_db: FaceDB):
+    global face_db
+    face_db = new_db
+
+
 print("Cargando base de datos de rostros...")
-with open(DB_FILE, "rb") as f:
-    raw_db = pickle.load(f)
-
-# Construir índice limpio
-database   = []
-db_embeddings = []
-
-for i, entry in enumerate(raw_db):
-    raw_name = entry["name"]          # ej. "AARON ADALID ESCOBEDO CONDE.jpg"
-    name     = os.path.splitext(raw_name)[0]   # quitar .jpg
-    year     = str(entry["year"])
-
-    # En disco:
-    #  fotos_recortadas/ → YEAR_foto_NOMBRE.jpg  (tiene prefijo foto_)
-    #  boletines/        → YEAR_NOMBRE.jpg        (sin prefijo)
-    database.append({
-        "id":      i,
-        "name":    name,
-        "year":    year,
-        "foto":    f"/static/fotos_recortadas/{year}_foto_{raw_name}",
-        "boletin": f"/static/boletines/{year}_{raw_name}",
-    })
-    db_embeddings.append(entry["embedding"])
+face_db = load_db()
+print(f"Base de datos lista: {len(face_db)} personas "
+      f"(versión {face_db.version}, índice {face_db.index.kind}).")
 
-db_matrix = np.array(db_embeddings, dtype=np.float32)
-print(f"Base de datos lista: {len(database)} personas.")
+db_watcher = DBWatcher(DB_DIR, load_db, lambda: face_db, swap_db, static_dir=STATIC_DIR).start()
+# Sin ADMIN_TOKEN las rutas /admin responden 404: nunca quedan abiertas al público
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
 
 # ── InsightFace ───────────────────────────────────────────────────────────────
-print("Cargando modelo InsightFace...")
-face_app = FaceAnalysis(name="buffalo_l", providers=["CPUExecutionProvider"])
-face_app.prepare(ctx_id=0, det_size=(640, 640))
-print("Modelo listo.")
+# El camino crítico del matching sólo necesita detección + reconocimiento.
+# Sexo/edad y landmarks 106 se cargan aparte según FACE_ATTRS:
+#   lazy  (default) — al primer request que los pida
+#   eager           — al arrancar
+#   off             — nunca; /search no devuelve visitor ni lm106
+# El modelo 3d68 de buffalo_l no se usa y nunca se carga.
+FACE_MODULES = os.environ.get("FACE_MODULES", "detection,recognition").split(",")
+FACE_ATTRS   = os.environ.get("FACE_ATTRS", "lazy")
+ATTR_FILES   = {"genderage": "genderage.onnx", "landmark_2d_106": "2d106det.onnx"}
+
+# Resolución adaptativa de las subidas:
+#  - JPEGs grandes se decodifican reducidos (1/2, 1/4, 1/8) mientras el lado
+#    largo siga siendo ≥ DECODE_TARGET_SIDE
+#  - SCRFD corre primero a DET_FAST_SIZE y sólo si no encuentra rostro a DET_SIZE
+DET_SIZE           = 640
+DET_FAST_SIZE      = int(os.environ.get("DET_FAST_SIZE", "320"))   # 0 = sin fast path
+DECODE_TARGET_SIDE = int(os.environ.get("DECODE_TARGET_SIDE", "800"))
+REDUCED_FLAGS      = {8: cv2.IMREAD_REDUCED_COLOR_8, 4: cv2.IMREAD_REDUCED_COLOR_4, 2: cv2.IMREAD_REDUCED_COLOR_2}
+# Se actualiza desde los hilos del pool de inferencia: siempre bajo paths_lock
+detection_paths    = Counter()
+paths_lock         = threading.Lock()
+
+
+def rss_mb() -> float | None:
+    """Memoria residente del proceso (Linux); None donde /proc no existe."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+model_stats = {"rss_mb_before": rss_mb()}
+print(f"Cargando modelo InsightFace ({', '.join(FACE_MODULES)})...")
+t0 = time.perf_counter()
+face_app = FaceAnalysis(name="buffalo_l", allowed_modules=FACE_MODULES, providers=["CPUExecutionProvider"])
+face_app.prepare(ctx_id=0, det_size=(DET_SIZE, DET_SIZE))
+model_stats.update(modules=sorted(face_app.models), load_s=round(time.perf_counter() - t0, 2), rss_mb_after=rss_mb())
+print(f"Modelo listo en {model_stats['load_s']}s (RSS {model_stats['rss_mb_before']} → {model_stats['rss_mb_after']} MB).")
+
+attr_models: dict | None = None
+attr_lock = threading.Lock()
+
+
+def load_attr_models() -> dict:
+    """Carga (una sola vez) los modelos de atributos que no están en face_app."""
+    global attr_models
+    with attr_lock:
+        if attr_models is None:
+            t0 = time.perf_counter()
+            models = {}
+            for taskname, fname in ATTR_FILES.items():
+                if taskname in face_app.models:
+                    models[taskname] = face_app.models[taskname]
+                    continue
+                path = os.path.join(face_app.model_dir, fname)
+                if os.path.exists(path):
+                    model = model_zoo.get_model(path, providers=["CPUExecutionProvider"])
+                    model.prepare(ctx_id=0)
+                    models[taskname] = model
+            attr_models = models
+            model_stats.update(attr_modules=sorted(models), attr_load_s=round(time.perf_counter() - t0, 2),
+                               rss_mb_after_attrs=rss_mb())
+            print(f"Modelos de atributos listos: {', '.join(sorted(models))}.")
+    return attr_models
+
+
+if FACE_ATTRS == "eager":
+    load_attr_models()
+
+# Inferencia fuera del event loop (INFERENCE_WORKERS / INFERENCE_QUEUE)
+inference_pool = InferencePool()
+print(f"Pool de inferencia: {inference_pool.workers} worker(s), cola de {inference_pool.max_queue}.")
+
+# Reconocimiento en lotes entre requests concurrentes (REC_BATCH_MAX / REC_BATCH_WAIT_MS).
+# Sólo agrupa (y espera) si hay más de un worker de inferencia detectando en paralelo.
+rec_model   = face_app.models["recognition"]
+rec_batcher = RecognitionBatcher(rec_model, producers=inference_pool.workers)
+
+
+def largest_face(faces):
+    return max(faces, key=lambda f: (f.bbox[2]-f.bbox[0]) * (f.bbox[3]-f.bbox[1]))
+
+
+def detect_faces(img, det_size=None) -> list:
+    """Sólo detección (SCRFD): bbox + 5 keypoints, sin correr los demás modelos."""
+    input_size = (det_size, det_size) if det_size else None
+    bboxes, kpss = face_app.det_model.detect(img, input_size=input_size, max_num=0, metric="default")
+    return [
+        Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None, det_score=bboxes[i, 4])
+        for i in range(bboxes.shape[0])
+    ]
+
+
+def embed_face(img, face):
+    """Alinea el rostro y obtiene su embedding a través del batcher de reconocimiento."""
+    aimg = face_align.norm_crop(img, landmark=face.kps, image_size=rec_model.input_size[0])
+    face.embedding = rec_batcher.embed(aimg)
+    return face.normed_embedding
+
+
+def analyze_face(img, face):
+    """Atributos (sexo/edad) y landmarks 106 sólo para el rostro principal."""
+    for model in load_attr_models().values():
+        model.get(img, face)
+    return face
+
+
+def decode_image(contents: bytes):
+    """Decodifica la subida, reducida si es grande. Retorna (imagen, factor de reducción)."""
+    try:
+        # Image.open sólo lee el encabezado, no decodifica los píxeles
+        long_side = max(Image.open(io.BytesIO(contents)).size)
+    except Exception:
+        long_side = 0
+    scale = next((f for f in REDUCED_FLAGS if long_side // f >= DECODE_TARGET_SIDE), 1)
+    flags = REDUCED_FLAGS.get(scale, cv2.IMREAD_COLOR)
+
+    img_cv = cv2.imdecode(np.frombuffer(contents, np.uint8), flags)
+    if img_cv is None:
+        raise HTTPException(400, "No se pudo decodificar la imagen")
+    return img_cv, scale
+
 
-# ── Caché de face bboxes para las fotos de la DB ─────────────────────────────
-# Se llena lazy: cada foto se detecta una sola vez y se guarda el bbox
-face_bbox_cache: dict[int, dict | None] = {}
+def detect_main_face(img):
+    """El rostro principal = el más grande. Retorna (rostro, det_size que lo encontró)."""
+    faces, det_size = [], DET_SIZE
+    if DET_FAST_SIZE:
+        faces, det_size = detect_faces(img, DET_FAST_SIZE), DET_FAST_SIZE
+    if not faces and det_size != DET_SIZE:
+        faces, det_size = detect_faces(img), DET_SIZE
+    if not faces:
+        raise HTTPException(422, "No se detectó ningún rostro en la imagen")
+    return largest_face(faces), det_size
 
-def detect_face_in_photo(entry_id: int) -> dict | None:
+
+def detection_info(scale: int, det_size: int) -> dict:
+    """Qué camino sirvió el request (decodificado 1/scale, SCRFD a det_size)."""
+    info = {
+        "decode_scale": scale,
+        "det_size":     det_size,
+        "fallback":     bool(DET_FAST_SIZE) and det_size != DET_FAST_SIZE,
+    }
+    with paths_lock:
+        detection_paths[f"1/{scale}@{det_size}"] += 1
+    return info
+
+
+def visitor_payload(img, face) -> dict:
+    """face_box y, si hay atributos, sexo/edad + 106 landmarks normalizados (0-1)."""
+    h, w = img.shape[:2]
+    bbox = face.bbox.astype(float)
+    payload = {
+        "visitor":  None,
+        "face_box": {
+            "x":  float(bbox[0] / w),
+            "y":  float(bbox[1] / h),
+            "w":  float((bbox[2] - bbox[0]) / w),
+            "h":  float((bbox[3] - bbox[1]) / h),
+        },
+        "lm106":    [],
+    }
+
+    # InsightFace: gender 0 = mujer, 1 = hombre
+    if face.get("gender") is not None:
+        payload["visitor"] = {
+            "gender": "femenino" if face.gender == 0 else "masculino",
+            "age":    int(face.age),
+        }
+
+    # 106 landmarks del modelo 2d106det incluido en buffalo_l
+    if face.get("landmark_2d_106") is not None:
+        payload["lm106"] = [{"x": float(pt[0] / w), "y": float(pt[1] / h)} for pt in face.landmark_2d_106]
+    return payload
+
+# ── Caja del rostro en las fotos de la DB ────────────────────────────────────
+# step3_index_faces.py guarda la caja normalizada de cada foto (face_box), así
+# que normalmente no hay inferencia. Sólo las bases legacy sin esa tabla caen a
+# detección lazy: cada foto se detecta una sola vez y se guarda el bbox en la
+# caché de esa versión de la base.
+def match_face_box(db: FaceDB, entry_id: int) -> dict | None:
+    """Bbox normalizado del rostro en la foto de la ficha `entry_id`."""
+    if db.face_boxes is not None:
+        x, y, w, h = (float(v) for v in db.face_boxes[entry_id])
+        return {"x": x, "y": y, "w": w, "h": h}
+    return detect_face_in_photo(db, entry_id)
+
+
+def detect_face_in_photo(db: FaceDB, entry_id: int) -> dict | None:
     """Detecta el rostro en la foto de una persona y retorna bbox normalizado."""
+    face_bbox_cache = db.bbox_cache
     if entry_id in face_bbox_cache:
         return face_bbox_cache[entry_id]
     
-    entry = database[entry_id]
+    entry = db.database[entry_id]
     foto_rel = entry["foto"]  # e.g. /static/fotos_recortadas/2024_foto_NAME.jpg
-    foto_path = os.path.join(BASE_DIR, foto_rel.lstrip("/"))
+    foto_path = os.path.join(STATIC_DIR, foto_rel[len("/static/"):])
     
     if not os.path.exists(foto_path):
         face_bbox_cache[entry_id] = None
@@ -87,13 +282,13 @@ def detect_face_in_photo(entry_id: int) -> dict | None:
             return None
         
         h, w = img.shape[:2]
-        faces = face_app.get(img)
+        faces = detect_faces(img)
         if not faces:
             # Default: assume face is centered
             face_bbox_cache[entry_id] = {"x": 0.1, "y": 0.05, "w": 0.8, "h": 0.85}
             return face_bbox_cache[entry_id]
         
-        face = max(faces, key=lambda f: (f.bbox[2]-f.bbox[0]) * (f.bbox[3]-f.bbox[1]))
+        face = largest_face(faces)
         bbox = face.bbox.astype(float)
         result = {
             "x": float(max(0, bbox[0]) / w),
@@ -116,74 +311,131 @@ app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
 @app.get("/")
 def health():
-    return {"status": "ok", "personas": len(database)}
+    db = face_db
+    return {"status": "ok", "personas": len(db), "index": db.index.kind, "db_version": db.version}
+
+
+def check_admin(token: str | None):
+    if not ADMIN_TOKEN:
+        raise HTTPException(404, "Not Found")
+    if token != ADMIN_TOKEN:
+        raise HTTPException(403, "Token de administración inválido")
+
+
+@app.get("/admin/db")
+def admin_db(x_admin_token: str | None = Header(None)):
+    """Versión activa de la base y estado de la recarga en caliente."""
+    check_admin(x_admin_token)
+    return {"active": face_db.info(), "watcher": db_watcher.info()}
+
+
+@app.post("/admin/db/reload")
+async def admin_db_reload(force: bool = False, x_admin_token: str | None = Header(None)):
+    """Revisa face_meta.json ya (sin esperar al intervalo) y recarga si hay versión nueva."""
+    check_admin(x_admin_token)
+    changed = await asyncio.to_thread(db_watcher.check, force)
+    return {"reloaded": changed, "active": face_db.info(), "watcher": db_watcher.info()}
+
+
+@app.on_event("shutdown")
+def shutdown_pool():
+    inference_pool.shutdown()
+
+
+def detection_stats() -> dict:
+    with paths_lock:
+        return dict(detection_paths)
+
+
+@app.get("/stats")
+def stats():
+    """Espera en cola vs cómputo de la inferencia, para dimensionar la instancia."""
+    return {
+        "inference":   inference_pool.stats(),
+        "recognition": rec_batcher.stats(),
+        "models":      model_stats,
+        "detection":   detection_stats(),
+    }
+
+
+async def run_pooled(fn, *args) -> JSONResponse:
+    """Corre `fn` en el pool de inferencia; si está saturado responde 503 + Retry-After."""
+    try:
+        payload, timing = await inference_pool.run(fn, *args)
+    except PoolSaturated as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": str(e.retry_after)})
+
+    payload["timing"] = timing
+    return JSONResponse(payload, headers={
+        "Server-Timing": f"queue;dur={timing['queue_ms']}, compute;dur={timing['compute_ms']}",
+    })
 
 
 @app.post("/search")
-async def search_face(file: UploadFile = File(...)):
+async def search_face(file: UploadFile = File(...), attrs: bool = True):
     """
     Recibe una imagen (selfie), detecta el rostro,
-    y devuelve las 12 personas más parecidas de la DB.
+    y devuelve las TOP_K personas más parecidas de la DB.
+    Con attrs=false sólo corre detección + reconocimiento (ver /analyze).
     """
     contents = await file.read()
-    nparr    = np.frombuffer(contents, np.uint8)
-    img_cv   = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    return await run_pooled(run_search, contents, attrs and FACE_ATTRS != "off")
 
-    if img_cv is None:
-        raise HTTPException(400, "No se pudo decodificar la imagen")
 
-    faces = face_app.get(img_cv)
-    if not faces:
-        raise HTTPException(422, "No se detectó ningún rostro en la imagen")
+@app.post("/analyze")
+async def analyze_visitor(file: UploadFile = File(...)):
+    """Sexo/edad y landmarks 106 del visitante, sin reconocimiento ni búsqueda."""
+    if FACE_ATTRS == "off":
+        raise HTTPException(404, "Atributos deshabilitados (FACE_ATTRS=off)")
+    contents = await file.read()
+    return await run_pooled(run_analyze, contents)
 
-    # El rostro principal = el más grande
-    main_face = max(faces, key=lambda f: (f.bbox[2]-f.bbox[0]) * (f.bbox[3]-f.bbox[1]))
-    query_emb = main_face.normed_embedding.astype(np.float32)
 
-    # Similitud coseno (embeddings ya normalizados)
-    similarities = np.dot(db_matrix, query_emb)
-    top8_idx     = np.argsort(similarities)[-8:][::-1]
+def run_search(contents: bytes, with_attrs: bool) -> dict:
+    """Decodificación + InsightFace + búsqueda. Corre en un hilo del pool de inferencia."""
+    img_cv, scale       = decode_image(contents)
+    main_face, det_size = detect_main_face(img_cv)
+
+    # Sólo el rostro principal pasa por reconocimiento
+    query_emb = embed_face(img_cv, main_face).astype(np.float32)
+
+    # Similitud coseno (embeddings ya normalizados), top-k vía el índice.
+    # Una sola referencia a la base para todo el request (recarga en caliente).
+    db = face_db
+    top_idx, top_scores = db.index.search(query_emb, TOP_K)
 
     results = []
-    for idx in top8_idx:
-        entry = database[idx].copy()
-        entry["score"] = float(round(similarities[idx] * 100, 1))
-        # Detectar face bbox en la foto del match (con caché)
-        entry["match_face_box"] = detect_face_in_photo(idx)
+    for idx, score in zip(top_idx, top_scores):
+        idx = int(idx)
+        entry = db.database[idx].copy()
+        entry["score"] = float(round(score * 100, 1))
+        # Bbox precalculado del rostro en la foto del match
+        entry["match_face_box"] = match_face_box(db, idx)
         results.append(entry)
 
-    # Atributos del visitante
-    gender = "femenino" if main_face.sex == 0 else "masculino"
-    age    = int(main_face.age)
-
-    # BBox normalizado (0-1)
-    h, w = img_cv.shape[:2]
-    bbox = main_face.bbox.astype(float)
-    face_box = {
-        "x":  float(bbox[0] / w),
-        "y":  float(bbox[1] / h),
-        "w":  float((bbox[2] - bbox[0]) / w),
-        "h":  float((bbox[3] - bbox[1]) / h),
-    }
+    # Atributos del visitante, fuera del camino crítico del matching
+    if with_attrs:
+        analyze_face(img_cv, main_face)
 
-    # 106 landmarks normalizados (0-1) del modelo 2d106det incluido en buffalo_l
-    lm106 = []
-    if hasattr(main_face, 'landmark_2d_106') and main_face.landmark_2d_106 is not None:
-        for pt in main_face.landmark_2d_106:
-            lm106.append({"x": float(pt[0] / w), "y": float(pt[1] / h)})
-
-    return JSONResponse({
-        "visitor":  {"gender": gender, "age": age},
-        "face_box": face_box,
-        "lm106":    lm106,
-        "results":  results
-    })
+    payload = visitor_payload(img_cv, main_face)
+    payload["results"]   = results
+    payload["detection"] = detection_info(scale, det_size)
+    payload["db_version"] = db.version
+    return payload
+
+
+def run_analyze(contents: bytes) -> dict:
+    img_cv, scale       = decode_image(contents)
+    main_face, det_size = detect_main_face(img_cv)
+    payload = visitor_payload(img_cv, analyze_face(img_cv, main_face))
+    payload["detection"] = detection_info(scale, det_size)
+    return payload
 
 
 @app.get("/fichas")
 def list_fichas(page: int = 1, limit: int = 48, year: str = None, q: str = None):
     """Lista paginada de todas las fichas, con filtro opcional por año y nombre."""
-    filtered = database
+    filtered = face_db.database
 
     if year:
         filtered = [p for p in filtered if p["year"] == year]
@@ -208,6 +460,7 @@ def list_fichas(page: int = 1, limit: int = 48, year: str = None, q: str = None)
 @app.get("/fichas/{ficha_id}")
 def get_ficha(ficha_id: int):
     """Retorna los datos de una ficha por su ID numérico."""
+    database = face_db.database
     if ficha_id < 0 or ficha_id >= len(database):
         raise HTTPException(404, "Ficha no encontrada")
     return database[ficha_id]
@@ -216,5 +469,5 @@ def get_ficha(ficha_id: int):
 @app.get("/years")
 def get_years():
     """Retorna los años disponibles en la base de datos."""
-    years = sorted(set(p["year"] for p in database))
+    years = sorted(set(p["year"] for p in face_db.database))
     return {"years": years}
@@ -0,0 +1,103 @@
+"""
+rec_batcher.py — Micro-batching del modelo de reconocimiento (ArcFace)
+
+Cuando llegan varios /search a la vez (un grupo escolar frente al kiosko), cada
+hilo del pool de inferencia detecta y alinea su rostro por separado, pero el
+recorte alineado de 112×112 se encola aquí. Un hilo dedicado junta los recortes
+que llegan dentro de una ventana corta y corre la sesión ONNX de reconocimiento
+una sola vez sobre todo el lote; luego reparte cada embedding a quien lo pidió.
+
+    REC_BATCH_MAX       tamaño máximo del lote                   (default 8)
+    REC_BATCH_WAIT_MS   cuánto esperar a que se llene el lote    (default 4)
+
+Más espera → lotes más grandes y más throughput, a costa de latencia p99.
+Con REC_BATCH_WAIT_MS=0 sólo se agrupan los recortes que ya estaban en cola.
+
+Cada hilo productor espera su embedding antes de encolar otro, así que un lote
+nunca pasa de `producers` (los workers de inferencia): el batching sólo existe
+con INFERENCE_WORKERS > 1. Con un solo worker (el default, y lo que usa Render)
+no hay hilo ni cola: `embed` corre el modelo directo en el hilo que lo llama.
+El Dockerfile (HF Spaces, 2 vCPU) arranca con INFERENCE_WORKERS=2.
+"""
+import os
+import time
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+import numpy as np
+
+DEFAULT_MAX_BATCH = int(os.environ.get("REC_BATCH_MAX", "8"))
+DEFAULT_WAIT_MS   = float(os.environ.get("REC_BATCH_WAIT_MS", "4"))
+
+
+class RecognitionBatcher:
+    def __init__(self, rec_model, max_batch=DEFAULT_MAX_BATCH, max_wait_ms=DEFAULT_WAIT_MS, window=200,
+                 producers=None):
+        self.rec_model   = rec_model
+        # No caben más recortes en vuelo que hilos que los producen
+        self.max_batch   = max(1, min(max_batch, producers) if producers else max_batch)
+        self.max_wait_s  = max(0.0, max_wait_ms) / 1000 if self.max_batch > 1 else 0.0
+        self.queue       = queue.Queue()
+        self.batches     = 0
+        self.items       = 0
+        self.batch_sizes = deque(maxlen=window)
+        self.lock        = threading.Lock()
+        # Sin lotes posibles, el hilo y la cola sólo sumarían un salto de hilo
+        self.direct = self.max_batch == 1
+        if not self.direct:
+            self.thread = threading.Thread(target=self._loop, name="rec-batcher", daemon=True)
+            self.thread.start()
+
+    def embed(self, aligned_img):
+        """Embedding (sin normalizar) de un rostro alineado. Bloquea hasta que su lote termina."""
+        if self.direct:
+            feat = np.asarray(self.rec_model.get_feat([aligned_img])[0], dtype=np.float32)
+            self._count(1)
+            return feat
+        future = Future()
+        self.queue.put((aligned_img, future))
+        return future.result()
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            try:
+                feats = self.rec_model.get_feat([img for img, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), feat in zip(batch, feats):
+                future.set_result(np.asarray(feat, dtype=np.float32))
+            self._count(len(batch))
+
+    def _count(self, size):
+        with self.lock:
+            self.batches += 1
+            self.items += size
+            self.batch_sizes.append(size)
+
+    def stats(self):
+        with self.lock:
+            sizes = list(self.batch_sizes)
+        return {
+            "direct":      self.direct,
+            "max_batch":   self.max_batch,
+            "max_wait_ms": self.max_wait_s * 1000,
+            "batches":     self.batches,
+            "faces":       self.items,
+            "avg_batch":   round(float(np.mean(sizes)), 2) if sizes else None,
+        }
@@ -0,0 +1,99 @@
+"""
+Índices de face_index.py: IVF contra búsqueda exacta, guardado y bases vacías.
+
+    python -m unittest test_face_index      (desde Web/backend)
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from face_index import ExactIndex, IVFIndex, benchmark, load_index, top_k
+
+
+def clustered(n=2000, dim=64, clusters=40, seed=0):
+    """Embeddings normalizados agrupados alrededor de `clusters` identidades."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    matrix = centers[rng.integers(0, clusters, n)] + rng.normal(0, 0.3, (n, dim))
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix.astype(np.float32)
+
+
+class FaceIndexTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.matrix = clustered()
+        rng = np.random.default_rng(1)
+        queries = cls.matrix[rng.choice(len(cls.matrix), 100, replace=False)]
+        queries = queries + rng.normal(0, 0.03, queries.shape).astype(np.float32)
+        cls.queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "face_index_ivf.npz")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_top_k_is_sorted(self):
+        scores = np.array([0.1, 0.9, 0.5, 0.7, 0.3], dtype=np.float32)
+        self.assertEqual(top_k(scores, 3).tolist(), [1, 3, 2])
+        self.assertEqual(top_k(scores, 10).tolist(), [1, 3, 2, 4, 0])
+        self.assertEqual(len(top_k(scores, 0)), 0)
+
+    def test_exact_matches_argsort(self):
+        index = ExactIndex(self.matrix)
+        for q in self.queries[:10]:
+            ids, scores = index.search(q, 8)
+            self.assertEqual(ids.tolist(), np.argsort(self.matrix @ q)[::-1][:8].tolist())
+            self.assertTrue(np.all(np.diff(scores) <= 0))
+
+    def test_ivf_probing_every_list_is_exact(self):
+        index = IVFIndex.build(self.matrix, nlist=32)
+        index.nprobe = len(index.centroids)
+        self.assertEqual(benchmark(index, self.matrix, self.queries, k=8)["recall"], 1.0)
+
+    def test_ivf_recall(self):
+        index = IVFIndex.build(self.matrix, nprobe=8)
+        self.assertGreaterEqual(benchmark(index, self.matrix, self.queries, k=8)["recall"], 0.9)
+
+    def test_ivf_lists_partition_the_matrix(self):
+        index = IVFIndex.build(self.matrix, nlist=32)
+        self.assertEqual(sorted(index.order.tolist()), list(range(len(self.matrix))))
+        self.assertEqual(index.offsets[0], 0)
+        self.assertEqual(index.offsets[-1], len(self.matrix))
+
+    def test_saved_index_round_trip(self):
+        built = IVFIndex.build(self.matrix, nlist=32)
+        built.save(self.path, "v1")
+        loaded = load_index(self.matrix, "ivf", self.path, "v1")
+        self.assertIsInstance(loaded, IVFIndex)
+        np.testing.assert_array_equal(loaded.order, built.order)
+
+    def test_saved_index_rejects_other_version(self):
+        IVFIndex.build(self.matrix, nlist=32).save(self.path, "v1")
+        with self.assertRaises(ValueError):
+            IVFIndex.load(self.path, self.matrix, version="v2")
+
+    def test_saved_index_rejects_other_embeddings_of_same_size(self):
+        IVFIndex.build(self.matrix, nlist=32).save(self.path, "v1")
+        other = clustered(seed=7)
+        with self.assertRaises(ValueError):
+            IVFIndex.load(self.path, other, version="v1")
+        # load_index lo reconstruye en memoria en vez de reusarlo
+        rebuilt = load_index(other, "ivf", self.path, "v1")
+        self.assertEqual(sorted(rebuilt.order.tolist()), list(range(len(other))))
+
+    def test_empty_store(self):
+        empty = np.empty((0, 64), dtype=np.float32)
+        index = load_index(empty, "ivf", self.path, "v1")
+        ids, scores = index.search(self.queries[0], 8)
+        self.assertEqual(len(ids), 0)
+        self.assertEqual(len(scores), 0)
+        with self.assertRaises(ValueError):
+            IVFIndex.build(empty)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -10,12 +10,14 @@ Uso:
 
 import os
 import sys
+import json
 import shutil
 import argparse
 import subprocess
 
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 BACKEND_DIR = os.path.join(SCRIPT_DIR, "backend")
+FACE_STORE = os.path.join(SCRIPT_DIR, "..", "Dev", "produccion", "python", "face_store.py")
 DEPLOY_DIR = os.path.join(SCRIPT_DIR, "_hf_deploy")
 SPACE_NAME = "mil-ojos-api"
 
@@ -57,7 +59,17 @@ FastAPI + InsightFace (buffalo_l) + Base de datos de 11,375 personas desaparecid
 
     # 3. Copy backend files
     print("[1/5] Copiando código del backend...")
-    for fname in ["Dockerfile", "main.py", "requirements.txt", "face_database.pkl"]:
+    optional = {"face_index_ivf.npz"}
+    db_files = ["face_meta.json"]
+    meta_path = os.path.join(BACKEND_DIR, "face_meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            db_files += list(json.load(f)["arrays"].values())
+    modules = sorted(f for f in os.listdir(BACKEND_DIR) if f.endswith(".py") and f != "face_store.py" and not f.startswith("test_"))
+    # face_store.py tiene una sola copia, compartida con el indexador
+    shutil.copy2(FACE_STORE, DEPLOY_DIR)
+    print("  ✓ face_store.py (Dev/produccion/python)")
+    for fname in ["Dockerfile", *modules, "requirements.txt", *db_files, "face_index_ivf.npz"]:
         src = os.path.join(BACKEND_DIR, fname)
         if os.path.exists(src):
             shutil.copy2(src, DEPLOY_DIR)
@@ -65,7 +77,7 @@ FastAPI + InsightFace (buffalo_l) + Base de datos de 11,375 personas desaparecid
             print(f"  ✓ {fname} ({size_mb:.1f} MB)")
         else:
             print(f"  ✗ {fname} NO ENCONTRADO")
-            if fname != "face_database.pkl":
+            if fname not in optional:
                 sys.exit(1)
 
     # 4. Copy static files
@@ -96,7 +108,8 @@ FastAPI + InsightFace (buffalo_l) + Base de datos de 11,375 personas desaparecid
     subprocess.run(["git", "lfs", "install"], check=True, capture_output=True)
     
     # Track large files with LFS
-    subprocess.run(["git", "lfs", "track", "*.pkl"], check=True, capture_output=True)
+    subprocess.run(["git", "lfs", "track", "*.npy"], check=True, capture_output=True)
+    subprocess.run(["git", "lfs", "track", "*.npz"], check=True, capture_output=True)
     subprocess.run(["git", "lfs", "track", "*.jpg"], check=True, capture_output=True)
     subprocess.run(["git", "lfs", "track", "*.jpeg"], check=True, capture_output=True)
     subprocess.run(["git", "lfs", "track", "*.png"], check=True, capture_output=True)
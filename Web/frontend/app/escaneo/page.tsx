@@ -2,6 +2,7 @@
 import { useRef, useState, useEffect, useCallback } from 'react';
 import Link from 'next/link';
 import styles from './page.module.css';
+import Thumb, { ThumbSources } from '@/components/Thumb';
 
 const API           = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
 const INTERVAL_MS   = 800;
@@ -11,7 +12,7 @@ const ZOOM          = 1.28;
 
 interface FaceBox { x: number; y: number; w: number; h: number; }
 interface Pt       { x: number; y: number; }
-interface Match    { id: number; name: string; year: string; foto: string; boletin: string; score: number; match_face_box?: FaceBox | null; }
+interface Match extends ThumbSources { id: number; name: string; year: string; foto: string; boletin: string; score: number; match_face_box?: FaceBox | null; }
 interface Visitor  { gender: string; age: number; }
 
 // ── 106-landmark groups (segmentos secuenciales por región facial) ──
@@ -463,7 +464,7 @@ export default function Home() {
               </div>
             : matches.slice(0,8).map((m,i) => (
                 <Link key={m.id} href={`/ficha/${m.id}`} className={styles.matchCard} id={`match-card-${i}`}>
-                  <img src={`${API}${m.foto}`} alt={m.name} className={styles.matchImg}/>
+                  <Thumb {...m} alt={m.name} className={styles.matchImg}/>
                   <FaceScanOverlay active={scanReveal > 0} delay={i * 150} faceBox={m.match_face_box} key={`scan-${scanReveal}-${i}`} />
                   <div className={styles.matchOverlay}>
                     <span className={styles.matchRank}>{String(i+1).padStart(2,'0')}</span>
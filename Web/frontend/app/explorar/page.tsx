@@ -2,11 +2,12 @@
 import { useState, useEffect, useCallback } from 'react';
 import Link from 'next/link';
 import styles from './page.module.css';
+import Thumb, { ThumbSources } from '@/components/Thumb';
 
 const API = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
 const LIMIT = 48;
 
-interface Ficha { id: number; name: string; year: string; foto: string; boletin: string; }
+interface Ficha extends ThumbSources { id: number; name: string; year: string; foto: string; boletin: string; }
 interface ApiResp { total: number; page: number; pages: number; items: Ficha[]; }
 
 type SortField = 'none' | 'name' | 'year';
@@ -165,7 +166,7 @@ export default function ExplorarPage() {
           <div className={styles.grid}>
             {sorted.map(f => (
               <Link key={f.id} href={`/ficha/${f.id}`} className={styles.card} id={`ficha-card-${f.id}`}>
-                <img src={`${API}${f.foto}`} alt={f.name} className={styles.cardImg} loading="lazy" />
+                <Thumb {...f} alt={f.name} className={styles.cardImg} lazy />
                 <div className={styles.cardOverlay}>
                   <span className={styles.cardYear}>{f.year}</span>
                 </div>
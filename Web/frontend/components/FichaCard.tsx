@@ -1,9 +1,8 @@
 import Link from 'next/link';
 import styles from './FichaCard.module.css';
+import Thumb, { ThumbSources } from './Thumb';
 
-const API = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
-
-interface Props {
+interface Props extends ThumbSources {
   id: number;
   name: string;
   year: string;
@@ -13,8 +12,7 @@ interface Props {
   rank?: number;
 }
 
-export default function FichaCard({ id, name, year, foto, score, rank }: Props) {
-  const imgSrc = `${API}${foto}`;
+export default function FichaCard({ id, name, year, score, rank, ...sources }: Props) {
   const scoreColor = score !== undefined
     ? score > 60 ? '#4ade80' : score > 40 ? '#f4a261' : '#8896a8'
     : undefined;
@@ -25,7 +23,7 @@ export default function FichaCard({ id, name, year, foto, score, rank }: Props)
         <div className={styles.rank}>#{rank}</div>
       )}
       <div className={styles.imgWrapper}>
-        <img src={imgSrc} alt={name} className={styles.img} loading="lazy" />
+        <Thumb {...sources} alt={name} className={styles.img} lazy />
       </div>
       <div className={styles.info}>
         <p className={styles.name}>{name}</p>
@@ -0,0 +1,26 @@
+const API = process.env.NEXT_PUBLIC_API_URL || 'http://localhost:8000';
+
+export interface ThumbSources {
+  foto: string;
+  thumb?: string;
+  thumb_webp?: string | null;
+  thumb_avif?: string | null;
+}
+
+interface Props extends ThumbSources {
+  alt: string;
+  className?: string;
+  lazy?: boolean;
+}
+
+// Miniatura de galería: AVIF/WebP si el backend las generó, si no el JPEG
+// reducido o, en bases sin miniaturas, la foto completa.
+export default function Thumb({ foto, thumb, thumb_webp, thumb_avif, alt, className, lazy }: Props) {
+  return (
+    <picture style={{ display: 'contents' }}>
+      {thumb_avif && <source srcSet={`${API}${thumb_avif}`} type="image/avif" />}
+      {thumb_webp && <source srcSet={`${API}${thumb_webp}`} type="image/webp" />}
+      <img src={`${API}${thumb || foto}`} alt={alt} className={className} loading={lazy ? 'lazy' : undefined} />
+    </picture>
+  );
+}
@@ -0,0 +1,218 @@
+"""
+publish_static.py — Publica fotos y boletines en backend/static sin copiar todo
+
+Sustituye al bucle de glob + os.path.exists + shutil.copy2 por año:
+
+- publish_manifest.json (junto a update_log.json, fuera de static/ para no
+  servirlo) recuerda cada archivo publicado con su tamaño/mtime de origen.
+- Cada carpeta de origen se lista con os.scandir (sólo stat, sin leer
+  contenido) y sólo se tocan los archivos nuevos o con otro tamaño/mtime; los
+  que ya no existen en el origen se retiran. El mtime de la carpeta no sirve
+  para saltarla: re-escribir un recorte en su lugar (step2 --force) no lo cambia.
+- Publicar = hardlink si origen y destino están en el mismo disco; si no,
+  reflink (copy-on-write, Linux) y como último recurso una copia.
+
+    PUBLISH_MODE=link (default) | copy
+
+Con hardlinks, re-escribir un recorte en el mismo archivo lo actualiza también
+en static/ (y su mtime nuevo rehace la miniatura). `full=True` (actualizar_web.py
+--full-publish) vuelve a publicar todo y regenera todas las miniaturas.
+
+Miniaturas: por cada imagen de las subcarpetas en THUMB_SUBS se genera
+static/thumbs/<subcarpeta>/<nombre>.jpg (lado mayor THUMB_MAX px) y sus
+variantes .webp y, si Pillow trae soporte, .avif. La galería (/fichas) y los
+resultados de /search las usan en vez de la foto completa. Si cambia el tamaño
+o los formatos, la siguiente publicación regenera todas.
+
+    THUMB_MAX=320   THUMB_SUBS=fotos_recortadas
+"""
+import os
+import json
+import shutil
+from PIL import Image
+
+MANIFEST_NAME = 'publish_manifest.json'
+PUBLISH_MODE  = os.environ.get('PUBLISH_MODE', 'link')
+
+THUMB_DIR  = 'thumbs'
+THUMB_MAX  = int(os.environ.get('THUMB_MAX', '320'))
+THUMB_SUBS = tuple(s for s in os.environ.get('THUMB_SUBS', 'fotos_recortadas').split(',') if s)
+
+
+def thumb_formats():
+    """(extensión, formato de Pillow, opciones) disponibles en esta instalación."""
+    Image.init()
+    formats = [('jpg',  'JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+               ('webp', 'WEBP', {'quality': 80, 'method': 4})]
+    if 'AVIF' in Image.SAVE:
+        formats.append(('avif', 'AVIF', {'quality': 60}))
+    return formats
+
+
+def thumb_paths(static_dir, rel, formats):
+    """Rutas de las miniaturas de static/<rel>, una por formato."""
+    sub, name = rel.split('/', 1)
+    stem = os.path.splitext(name)[0]
+    return [os.path.join(static_dir, THUMB_DIR, sub, f'{stem}.{ext}') for ext, _, _ in formats]
+
+
+def make_thumbnails(src, static_dir, rel, formats):
+    img = Image.open(src)
+    # JPEG: decodifica directo a una escala reducida, mucho más rápido que a tamaño completo
+    img.draft('RGB', (THUMB_MAX, THUMB_MAX))
+    img = img.convert('RGB')
+    img.thumbnail((THUMB_MAX, THUMB_MAX), Image.LANCZOS)
+    for path, (_, fmt, options) in zip(thumb_paths(static_dir, rel, formats), formats):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + '.tmp'
+        img.save(tmp, fmt, **options)
+        os.replace(tmp, path)
+
+# ioctl FICLONE de Linux (btrfs, xfs): copia instantánea que comparte bloques
+_FICLONE = 0x40049409
+
+
+def _reflink(src, dst):
+    import fcntl
+    with open(src, 'rb') as fs, open(dst, 'wb') as fd:
+        fcntl.ioctl(fd.fileno(), _FICLONE, fs.fileno())
+
+
+def link_or_copy(src, dst, mode=PUBLISH_MODE):
+    """Publica `src` en `dst` de forma atómica. Retorna 'link', 'reflink' o 'copy'."""
+    tmp = dst + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    how = 'copy'
+    if mode == 'link':
+        try:
+            os.link(src, tmp)
+            how = 'link'
+        except (OSError, AttributeError):
+            try:
+                _reflink(src, tmp)
+                how = 'reflink'
+            except (OSError, ImportError):
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+    if how == 'copy':
+        shutil.copy2(src, tmp)
+    os.replace(tmp, dst)
+    return how
+
+
+def load_manifest(path):
+    if os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+    return {'files': {}}
+
+
+def save_manifest(path, manifest):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def publish(sources, static_dir, manifest_path, full=False, mode=PUBLISH_MODE):
+    """
+    `sources`: lista de (carpeta_origen, subcarpeta_static, prefijo). Cada
+    imagen de la carpeta origen se publica como static/<subcarpeta>/<prefijo><nombre>.
+    Con `full` se re-publica cada archivo aunque su tamaño/mtime no haya cambiado.
+    Retorna stats: items (publicados), nuevos por subcarpeta, removed, how
+    (cuántos por link/reflink/copy), thumbs (miniaturas generadas), totals
+    (archivos publicados por subcarpeta).
+    """
+    manifest = load_manifest(manifest_path)
+    files = manifest['files']
+    # Manifiestos anteriores guardaban el mtime de cada carpeta; ya no se usa
+    manifest.pop('dirs', None)
+    stats = {'items': 0, 'removed': 0, 'failed': 0, 'errors': [], 'thumbs': 0, 'thumb_failed': 0,
+             'new': {}, 'how': {'link': 0, 'reflink': 0, 'copy': 0}, 'scanned_dirs': 0}
+
+    formats = thumb_formats()
+    thumb_key = f"{THUMB_MAX}:{','.join(ext for ext, _, _ in formats)}"
+    # Miniaturas de otro tamaño/formato (o aún inexistentes): se rehacen todas
+    regen_thumbs = full or manifest.get('thumbs') != thumb_key
+
+    def thumbnails(src, rel, force):
+        if rel.split('/', 1)[0] not in THUMB_SUBS:
+            return
+        if not force and all(os.path.exists(p) for p in thumb_paths(static_dir, rel, formats)):
+            return
+        try:
+            make_thumbnails(src, static_dir, rel, formats)
+            stats['thumbs'] += 1
+        except OSError as e:
+            stats['failed'] += 1
+            stats['thumb_failed'] += 1
+            stats['errors'].append(f'{rel} (miniatura): {e}')
+
+    for src_dir, sub, prefix in sources:
+        stats['new'].setdefault(sub, 0)
+        if not os.path.isdir(src_dir):
+            continue
+        stats['scanned_dirs'] += 1
+        dst_dir = os.path.join(static_dir, sub)
+        os.makedirs(dst_dir, exist_ok=True)
+
+        seen = set()
+        with os.scandir(src_dir) as it:
+            for entry in it:
+                if not entry.name.lower().endswith('.jpg'):
+                    continue
+                rel = f'{sub}/{prefix}{entry.name}'
+                seen.add(rel)
+                st = entry.stat()
+                sig = [st.st_size, st.st_mtime_ns]
+                if not full and files.get(rel) == sig:
+                    thumbnails(entry.path, rel, force=regen_thumbs)
+                    continue
+                dst = os.path.join(dst_dir, prefix + entry.name)
+                # Primera publicación con static/ ya poblado: se adopta el archivo existente
+                if not full and rel not in files and os.path.exists(dst) and os.path.getsize(dst) == st.st_size:
+                    files[rel] = sig
+                    thumbnails(entry.path, rel, force=regen_thumbs)
+                    continue
+                try:
+                    stats['how'][link_or_copy(entry.path, dst, mode)] += 1
+                    files[rel] = sig
+                    stats['items'] += 1
+                    stats['new'][sub] += 1
+                except OSError as e:
+                    stats['failed'] += 1
+                    stats['errors'].append(f'{rel}: {e}')
+                    continue
+                thumbnails(entry.path, rel, force=True)
+
+        # Retirar lo que se publicó desde esta carpeta y ya no existe en el origen
+        published_here = {rel for rel in files if rel.startswith(f'{sub}/{prefix}')}
+        for rel in published_here - seen:
+            for path in [os.path.join(static_dir, *rel.split('/'))] + thumb_paths(static_dir, rel, formats):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            del files[rel]
+            stats['removed'] += 1
+
+    totals = {}
+    for rel in files:
+        sub = rel.split('/', 1)[0]
+        totals[sub] = totals.get(sub, 0) + 1
+    manifest['totals'] = totals
+    # Si alguna miniatura falló, la próxima publicación vuelve a intentarlas todas
+    if not stats['thumb_failed']:
+        manifest['thumbs'] = thumb_key
+    stats['totals'] = totals
+    save_manifest(manifest_path, manifest)
+    return stats
+
+
+def published_totals(manifest_path):
+    """Archivos publicados por subcarpeta, según el manifiesto (sin listar static/)."""
+    return load_manifest(manifest_path).get('totals', {})
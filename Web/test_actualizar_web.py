@@ -0,0 +1,140 @@
+"""
+Grafo de pasos de actualizar_web.py: orden topológico y salto por huella.
+
+    python -m unittest test_actualizar_web      (desde Web)
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import actualizar_web
+from actualizar_web import Task, run_pipeline, topo_order
+
+
+class TopoOrderTest(unittest.TestCase):
+    def test_dependencies_first_then_declaration_order(self):
+        tasks = [Task('b', None, deps=['a']), Task('c', None), Task('a', None), Task('d', None, deps=['b', 'c'])]
+        self.assertEqual([t.name for t in topo_order(tasks)], ['c', 'a', 'b', 'd'])
+
+    def test_real_pipeline_order(self):
+        order = [t.name for t in topo_order(actualizar_web.build_tasks())]
+        self.assertEqual(order, ['download', 'crop', 'copy', 'reindex'])
+
+    def test_unknown_dependency(self):
+        with self.assertRaises(ValueError):
+            topo_order([Task('a', None, deps=['nope'])])
+
+    def test_cycle(self):
+        with self.assertRaises(ValueError):
+            topo_order([Task('a', None, deps=['b']), Task('b', None, deps=['a'])])
+
+
+class RunPipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.input = os.path.join(self.dir, 'entrada')
+        os.makedirs(self.input)
+        self.touch('a.jpg')
+        self.calls = []
+        self.results = {}
+        patches = [mock.patch.object(actualizar_web, 'STATE_FILE', os.path.join(self.dir, 'state.json')),
+                   mock.patch.object(actualizar_web, 'log', lambda msg: None)]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def touch(self, name):
+        # Un archivo nuevo cambia la huella del directorio aunque caiga en el mismo tick del reloj
+        with open(os.path.join(self.input, name), 'w'):
+            pass
+
+    def step(self, name):
+        def run():
+            self.calls.append(name)
+            return dict({'ok': True, 'items': 1, 'failed': 0, 'seconds': 0.0}, **self.results.get(name, {}))
+        return run
+
+    def tasks(self):
+        inputs = lambda: [self.input]
+        return [Task('a', self.step('a'), inputs=inputs),
+                Task('b', self.step('b'), deps=['a'], inputs=inputs),
+                Task('c', self.step('c'), deps=['b'], inputs=inputs)]
+
+    def statuses(self, timings):
+        return {row['step']: row['status'] for row in timings}
+
+    def test_unchanged_inputs_are_skipped(self):
+        run_pipeline(self.tasks())
+        self.assertEqual(self.calls, ['a', 'b', 'c'])
+        self.calls.clear()
+        _, timings = run_pipeline(self.tasks())
+        self.assertEqual(self.calls, [])
+        self.assertEqual(set(self.statuses(timings).values()), {'skipped'})
+
+    def test_changed_inputs_run_again(self):
+        run_pipeline(self.tasks())
+        self.calls.clear()
+        self.touch('b.jpg')
+        run_pipeline(self.tasks())
+        self.assertEqual(self.calls, ['a', 'b', 'c'])
+
+    def test_external_input_always_runs(self):
+        tasks = [Task('download', self.step('download'))]
+        run_pipeline(tasks)
+        run_pipeline(tasks)
+        self.assertEqual(self.calls, ['download', 'download'])
+
+    def test_force_and_force_tasks(self):
+        run_pipeline(self.tasks())
+        self.calls.clear()
+        run_pipeline(self.tasks(), force_tasks={'b'})
+        self.assertEqual(self.calls, ['b'])
+        self.calls.clear()
+        run_pipeline(self.tasks(), force=True)
+        self.assertEqual(self.calls, ['a', 'b', 'c'])
+
+    def test_failed_items_are_retried(self):
+        self.results['b'] = {'failed': 2}
+        run_pipeline(self.tasks())
+        self.calls.clear()
+        del self.results['b']
+        run_pipeline(self.tasks())
+        self.assertEqual(self.calls, ['b'])
+
+    def test_incomplete_step_is_retried(self):
+        self.results['a'] = {'complete': False}
+        run_pipeline(self.tasks())
+        self.calls.clear()
+        run_pipeline(self.tasks())
+        self.assertEqual(self.calls, ['a'])
+
+    def test_dependents_of_a_failed_step_are_blocked(self):
+        self.results['a'] = {'ok': False, 'items': 0, 'failed': 1}
+        results, timings = run_pipeline(self.tasks())
+        self.assertEqual(self.calls, ['a'])
+        self.assertEqual(self.statuses(timings), {'a': 'failed', 'b': 'blocked', 'c': 'blocked'})
+        self.assertEqual(list(results), ['a'])
+        # Nada quedó guardado: al día siguiente corre todo
+        self.calls.clear()
+        del self.results['a']
+        run_pipeline(self.tasks())
+        self.assertEqual(self.calls, ['a', 'b', 'c'])
+
+    def test_dry_run_runs_nothing(self):
+        tasks = [Task('a', self.step('a'), inputs=lambda: [self.input]),
+                 Task('d', self.step('d'), deps=['a'], inputs=lambda: [])]
+        run_pipeline(tasks)
+        self.calls.clear()
+        self.touch('b.jpg')
+        _, timings = run_pipeline(tasks, dry_run=True)
+        self.assertEqual(self.calls, [])
+        # d no cambió, pero corre si a produce algo
+        self.assertEqual(self.statuses(timings), {'a': 'would-run', 'd': 'maybe'})
+
+
+if __name__ == '__main__':
+    unittest.main()
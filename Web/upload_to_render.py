@@ -9,21 +9,34 @@ Alternativa: usar la API de Render para copiar archivos.
 """
 
 import os
+import json
 import subprocess
 import sys
 
 # Configuración
 LOCAL_STATIC = os.path.join(os.path.dirname(__file__), "backend", "static")
-LOCAL_DB = os.path.join(os.path.dirname(__file__), "backend", "face_database.pkl")
+LOCAL_DB = os.path.join(os.path.dirname(__file__), "backend", "face_meta.json")
 RENDER_SERVICE = "milojos-api"  # nombre del servicio en Render
 
+def db_files():
+    """face_meta.json + los arrays .npy de la versión que referencia."""
+    with open(LOCAL_DB, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    return ["face_meta.json"] + list(meta["arrays"].values())
+
 def check_files():
     """Verifica que los archivos locales existan."""
     fotos = os.path.join(LOCAL_STATIC, "fotos_recortadas")
     bols = os.path.join(LOCAL_STATIC, "boletines")
 
     print("=== Verificación de archivos locales ===")
-    print(f"  face_database.pkl: {'✓' if os.path.exists(LOCAL_DB) else '✗'} ({os.path.getsize(LOCAL_DB) / 1024 / 1024:.1f} MB)")
+    print(f"  face_meta.json: {'✓' if os.path.exists(LOCAL_DB) else '✗'}")
+    for name in (db_files()[1:] if os.path.exists(LOCAL_DB) else []):
+        path = os.path.join(os.path.dirname(LOCAL_DB), name)
+        if os.path.exists(path):
+            print(f"  {name}: ✓ ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
+        else:
+            print(f"  {name}: ✗")
     
     if os.path.isdir(fotos):
         n = len(os.listdir(fotos))
@@ -44,7 +57,7 @@ def create_tar():
     
     cmd = [
         "tar", "-czf", tar_file,
-        "-C", os.path.dirname(LOCAL_DB), "face_database.pkl",
+        "-C", os.path.dirname(LOCAL_DB), *db_files(),
         "-C", os.path.dirname(LOCAL_STATIC), "static"
     ]
     
@@ -70,6 +83,6 @@ if __name__ == "__main__":
         print("\n=== Instrucciones para Render ===")
         print("  1. Deploy the service from GitHub")
         print("  2. SSH into the service: render ssh milojos-api")
-        print("  3. Copy face_database.pkl to /data/")
+        print("  3. Copy face_meta.json and face_embeddings.*.npy to /data/")
         print("  4. Copy static/ folder to /data/static/")
         print("  5. Restart the service")